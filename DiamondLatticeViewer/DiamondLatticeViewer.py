@@ -1,17 +1,26 @@
 #! /usr/bin/env python3
 
+import argparse
+
 import numpy as np
 
 import glfw
 
 from utilities.opengl_symbols import *
+from utilities.opengl_state import gl_state
+from utilities.opengl_fast_path import gl_fast
 from utilities.matrices import translate, rotate, scale, perspective_projection, multiply_matrices
 
-from renderables import (RenderableScene, RenderableOptionalModel, RenderableModelTransformer, RenderableFloor,
-                         RenderableSphereImpostor, RenderableCylinderImpostor, RenderableDiamondLattice,
+from renderables import (RenderableScene, RenderableOptionalModel, RenderableModelTransformer,
+                         RenderableCompiledScene, RenderableDynamicResolution, RenderableFloor, RenderableSphereImpostor,
+                         RenderableSphereImpostorBatch, RenderableCylinderImpostor, RenderableDiamondLattice,
                          RenderableOverlay)
 
 from utilities.world import World
+from utilities.clocks import WallClock, FixedTimestepClock, ScriptedClock
+from utilities.input_recording import InputRecorder, InputReplayer
+from utilities.quality_controller import QualityController
+from utilities.frame_pipeline import FramePacket, FramePipeline
 
 
 def make_scene(world: World) -> RenderableScene:
@@ -21,14 +30,20 @@ def make_scene(world: World) -> RenderableScene:
 
     scene = RenderableScene()
 
+    # The 3D models are rendered at a resolution that depends on the render scale.
+
+    world.set_variable("render_scale", 1.0)
+
+    models = RenderableScene()
+
     # The floor model.
 
     world.set_variable("floor_enabled", False)
-    scene.add_model(
+    models.add_model(
         RenderableOptionalModel(
             RenderableModelTransformer(
                 RenderableFloor(8.0, 8.0),
-                lambda: translate((0, 0, 0))
+                translate((0, 0, 0))
             ),
             lambda: world.get_variable("floor_enabled")
         )
@@ -38,35 +53,29 @@ def make_scene(world: World) -> RenderableScene:
 
     world.set_variable("sphere_constellation_enabled", False)
 
-    sphere_imposter_constellation = RenderableScene()
-
-    earth = RenderableSphereImpostor(world, "earth.png")
-
-    sphere_imposter_constellation.add_model(
-        RenderableModelTransformer(
-            earth,
-            lambda: multiply_matrices(
-                translate((+0.8, 0.0, 0)),
-                scale((1.0, 1.0, 1.0)),
-                rotate((0, 1, 0), 0 * world.time())
-            )
-        )
-    )
-
-    moon = RenderableSphereImpostor(world, "moon.png")
-
-    sphere_imposter_constellation.add_model(
-        RenderableModelTransformer(
-            moon,
-            lambda: multiply_matrices(
-                translate((-0.8, 0.0, 0.3)),
-                scale((1.0, 1.0, 1.0)),
-                rotate((0, 1, 0), 0.0 * world.time())
-            )
+    # The earth and the moon are drawn as a batch, with a single instanced draw call.
+
+    sphere_imposter_constellation = RenderableSphereImpostorBatch(
+        world,
+        ["earth.png", "moon.png"],
+        lambda: (
+            np.array([
+                multiply_matrices(
+                    translate((+0.8, 0.0, 0)),
+                    scale((1.0, 1.0, 1.0)),
+                    rotate((0, 1, 0), 0 * world.time())
+                ),
+                multiply_matrices(
+                    translate((-0.8, 0.0, 0.3)),
+                    scale((1.0, 1.0, 1.0)),
+                    rotate((0, 1, 0), 0.0 * world.time())
+                )
+            ]),
+            np.array([0, 1])
         )
     )
 
-    scene.add_model(
+    models.add_model(
         RenderableOptionalModel(
             RenderableModelTransformer(
                 sphere_imposter_constellation,
@@ -111,7 +120,7 @@ def make_scene(world: World) -> RenderableScene:
         )
     )
 
-    scene.add_model(
+    models.add_model(
         RenderableOptionalModel(
             RenderableModelTransformer(
                 cylinder_imposter_constellation,
@@ -129,8 +138,14 @@ def make_scene(world: World) -> RenderableScene:
     world.set_variable("diamond_lattice", diamond_lattice)
 
     world.set_variable("diamond_lattice_side_length", 19)
+    world.set_variable("diamond_lattice_lod", 0)
+    world.set_variable("diamond_lattice_region_scale", 1.0)
+    world.set_variable("diamond_lattice_front_to_back", True)
+    world.set_variable("diamond_lattice_samples_passed", 0)
+    world.set_variable("diamond_lattice_pick_mode", "cpu")
+    world.set_variable("diamond_lattice_pick", "none")
     world.set_variable("diamond_lattice_enabled", True)
-    scene.add_model(
+    models.add_model(
         RenderableOptionalModel(
             RenderableModelTransformer(
                 diamond_lattice,
@@ -145,6 +160,10 @@ def make_scene(world: World) -> RenderableScene:
         )
     )
 
+    # The overlay is not part of the dynamic resolution models; it stays at the native resolution.
+
+    scene.add_model(RenderableDynamicResolution(world, models))
+
     overlay = RenderableOverlay(world)
 
     world.set_variable("overlay_enabled", True)
@@ -158,11 +177,57 @@ def make_scene(world: World) -> RenderableScene:
     return scene
 
 
+def prepare_frame(world: World, scene: RenderableCompiledScene, frame_packet: FramePacket,
+                  fov_degrees: float = 30.0, near_plane: float = 0.5, far_plane: float = 10000.0) -> None:
+    """Prepare a frame. This issues no OpenGL calls, so it can run on a frame preparation thread.
+
+    The World is locked while the frame is prepared, so changes from the main thread do not interleave with it.
+    """
+
+    with world.lock:
+        # Sample world time.
+        # All queries to world.time() up until the next sample_time() call will give the same time value.
+
+        world.sample_time()
+
+        frame_packet.clock_time = world.sampled_time()
+
+        # Make view matrix.
+
+        render_distance = world.get_variable("render_distance")
+
+        frame_packet.view_matrix = translate((0.0, 0.0, -render_distance)) @ rotate((0, 1, 0), world.time() * 0.0)
+
+        # Make model matrix.
+
+        model_matrix = np.identity(4)
+
+        # Make perspective projection matrix.
+
+        (framebuffer_width, framebuffer_height) = world.get_variable("framebuffer_size")
+
+        if framebuffer_width > 0 and framebuffer_height > 0:
+            frame_packet.projection_matrix = perspective_projection(
+                framebuffer_width,
+                framebuffer_height,
+                fov_degrees,
+                near_plane,
+                far_plane
+            )
+        else:
+            frame_packet.projection_matrix = None
+
+        # Evaluate the scene nodes, and make the list of draws.
+
+        scene.prepare(model_matrix, frame_packet.draws)
+
+
 class UserInteractionHandler:
 
     def __init__(self, app, world):
         self._app = app
         self._world = world
+        self._cursor_position = None  # In normalized device coordinates.
 
     def process_keyboard_event(self, window, key: int, _scancode: int, action: int, mods: int):
 
@@ -204,6 +269,26 @@ class UserInteractionHandler:
                 case glfw.KEY_C:
                     diamond_lattice = world.get_variable("diamond_lattice")
                     diamond_lattice.color_mode = (diamond_lattice.color_mode + 1) % 3
+                case glfw.KEY_V:
+                    # Toggle a demonstration of the atom states: vacancies, dopants, and a selected unit cell.
+                    diamond_lattice = world.get_variable("diamond_lattice")
+                    atom_states = diamond_lattice.atom_states
+                    if atom_states.states.any():
+                        atom_states.reset()
+                    else:
+                        # A fixed seed keeps replays of recorded input deterministic.
+                        rng = np.random.default_rng(0)
+                        atom_states.set_hidden(rng.random(atom_states.states.size) < 0.05)
+                        atom_states.set_color_index(rng.random(atom_states.states.size) < 0.02, 1)
+                        atom_states.set_highlighted(diamond_lattice.atom_ids((0, 0, 0), np.arange(8)))
+                case glfw.KEY_P:
+                    diamond_lattice_pick_mode = world.get_variable("diamond_lattice_pick_mode")
+                    diamond_lattice_pick_mode = "gpu" if diamond_lattice_pick_mode == "cpu" else "cpu"
+                    world.set_variable("diamond_lattice_pick_mode", diamond_lattice_pick_mode)
+                case glfw.KEY_B:
+                    diamond_lattice_front_to_back = world.get_variable("diamond_lattice_front_to_back")
+                    diamond_lattice_front_to_back = not diamond_lattice_front_to_back
+                    world.set_variable("diamond_lattice_front_to_back", diamond_lattice_front_to_back)
                 case glfw.KEY_D:
                     diamond_lattice_enabled = world.get_variable("diamond_lattice_enabled")
                     diamond_lattice_enabled = not diamond_lattice_enabled
@@ -223,12 +308,13 @@ class UserInteractionHandler:
                 case glfw.KEY_F:
                     app.toggle_fullscreen(window)
                 case glfw.KEY_M:
-                    if glIsEnabled(GL_MULTISAMPLE):
-                        print("disabling multisampling")
-                        glDisable(GL_MULTISAMPLE)
-                    else:
-                        print("enabling multisampling")
-                        glEnable(GL_MULTISAMPLE)
+                    msaa_enabled = world.get_variable("msaa_enabled")
+                    msaa_enabled = not msaa_enabled
+                    world.set_variable("msaa_enabled", msaa_enabled)
+                case glfw.KEY_Q:
+                    quality_controller_enabled = world.get_variable("quality_controller_enabled")
+                    quality_controller_enabled = not quality_controller_enabled
+                    world.set_variable("quality_controller_enabled", quality_controller_enabled)
                 case glfw.KEY_O:
                     overlay_enabled = world.get_variable("overlay_enabled")
                     overlay_enabled = not overlay_enabled
@@ -245,6 +331,14 @@ class UserInteractionHandler:
                     diamond_lattice_side_length = world.get_variable("diamond_lattice_side_length")
                     diamond_lattice_side_length = diamond_lattice_side_length + 2
                     world.set_variable("diamond_lattice_side_length", diamond_lattice_side_length)
+                case glfw.KEY_MINUS:
+                    render_scale = world.get_variable("render_scale")
+                    render_scale = max(0.25, render_scale - 0.125)
+                    world.set_variable("render_scale", render_scale)
+                case glfw.KEY_EQUAL:
+                    render_scale = world.get_variable("render_scale")
+                    render_scale = min(1.0, render_scale + 0.125)
+                    world.set_variable("render_scale", render_scale)
                 case glfw.KEY_UP:
                     render_distance = world.get_variable("render_distance")
                     render_distance = max(0.0, render_distance - 5.0)
@@ -254,12 +348,21 @@ class UserInteractionHandler:
                     render_distance = render_distance + 5.0
                     world.set_variable("render_distance", render_distance)
 
-    def process_cursor_position_event(self, _window, xpos: float, ypos: float):
-        pass
-        # print("mouse position:", self, xpos, ypos)
+    def set_cursor_position(self, x_fraction: float, y_fraction: float) -> None:
+        """Set the cursor position as a fraction of the window size, from the top left corner."""
+        self._cursor_position = (2.0 * x_fraction - 1.0, 1.0 - 2.0 * y_fraction)
+
+    def process_cursor_position_event(self, window, xpos: float, ypos: float):
+        # The cursor position is in screen coordinates, which can differ from framebuffer pixels.
+        (window_width, window_height) = glfw.get_window_size(window)
+        if window_width > 0 and window_height > 0:
+            self.set_cursor_position(xpos / window_width, ypos / window_height)
 
     def process_mouse_button_event(self, _window, button: int, action: int, mods: int):
-        print("mouse button:", self, button, action, mods)
+        if button == glfw.MOUSE_BUTTON_LEFT and action == glfw.PRESS and self._cursor_position is not None:
+            # Identify the atom or bond under the cursor.
+            diamond_lattice = self._world.get_variable("diamond_lattice")
+            diamond_lattice.request_pick(*self._cursor_position)
 
     def process_scroll_event(self, _window, xoffset: float, yoffset: float):
         print("mouse scroll button:", self, xoffset, yoffset)
@@ -267,13 +370,43 @@ class UserInteractionHandler:
 
 class Application:
 
-    def __init__(self):
+    def __init__(self, clock=None, record_filename: str = None, replayer: InputReplayer = None,
+                 headless: bool = False, frame_limit: int = None, target_frame_time: float = None,
+                 pipelined: bool = False, debug: bool = False):
+        """Create the application.
+
+        The clock drives the world time (default: a WallClock).
+        If a record filename is given, frame times and keyboard events are recorded to that file.
+        If a replayer is given, the keyboard events of its recording are replayed, and live keyboard events
+        are ignored.
+        A headless application renders to an invisible window.
+        If a frame limit is given, the application stops after rendering that number of frames.
+        If a target frame time [s] is given, a quality controller adjusts the rendering quality to meet it.
+        The controller reacts to wall-clock frame times, so it cannot be combined with replaying a recording
+        or with a clock other than a WallClock; those runs must produce an identical frame sequence.
+        A pipelined application prepares the next frame on a worker thread while submitting the current frame.
+        In debug mode, the per-frame OpenGL calls check for OpenGL errors.
+        """
         self._user_interaction_handler = None
         self._window_position_and_size = None
         self._world = None
+        self._clock = clock if clock is not None else WallClock()
+        if target_frame_time is not None and (replayer is not None or not isinstance(self._clock, WallClock)):
+            raise ValueError("The quality controller needs a wall clock and cannot be used while replaying.")
+        if pipelined and (record_filename is not None or replayer is not None):
+            # In a pipelined application, input takes effect a frame later, so a recording would not replay the same.
+            raise ValueError("Recording and replaying cannot be combined with frame pipelining.")
+        self._recorder = InputRecorder(record_filename) if record_filename is not None else None
+        self._replayer = replayer
+        self._headless = headless
+        self._frame_limit = frame_limit
+        self._frame_counter = 0
+        self._target_frame_time = target_frame_time
+        self._pipelined = pipelined
+        self._debug = debug
 
     @staticmethod
-    def create_glfw_window(version_major: int, version_minor: int):
+    def create_glfw_window(version_major: int, version_minor: int, visible: bool = True):
         """Create a window using GLFW."""
 
         # Set up window creation hints.
@@ -283,6 +416,7 @@ class Application:
         glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
         glfw.window_hint(glfw.SAMPLES, 8)  # For multi-sampling
         glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, GL_TRUE)
+        glfw.window_hint(glfw.VISIBLE, visible)
 
         # Create the window.
 
@@ -323,7 +457,7 @@ class Application:
 
         # Create a GLFW window and set it as the current OpenGL context.
 
-        window = Application.create_glfw_window(4, 1)
+        window = Application.create_glfw_window(4, 1, visible=not self._headless)
 
         # glfw.set_input_mode(window, glfw.CURSOR, glfw.CURSOR_HIDDEN)
 
@@ -335,16 +469,25 @@ class Application:
 
         glfw.make_context_current(window)
 
-        world = World()
+        # Resolve the raw OpenGL function pointers for the per-frame calls.
+        # In debug mode, check for OpenGL errors after each call.
+        gl_fast.resolve(error_checking=self._debug)
+
+        world = World(self._clock)
         self._world = world
 
         world.set_variable("render_distance", 60.0)
         (framebuffer_width, framebuffer_height) = glfw.get_framebuffer_size(window)
         world.set_variable("framebuffer_size", (framebuffer_width, framebuffer_height))
+        world.set_variable("default_framebuffer", 0)
 
         self._user_interaction_handler = UserInteractionHandler(self, world)
 
-        scene = make_scene(world)
+        # Compile the scene graph into a flat list of nodes and draw packets.
+        scene = RenderableCompiledScene(make_scene(world))
+
+        # Creating the scene's OpenGL objects bypasses the state cache.
+        gl_state.invalidate()
 
         # Prepare loop.
 
@@ -355,77 +498,139 @@ class Application:
 
         glPointSize(1)
         glClearColor(0.12, 0.12, 0.12, 1.0)
-        glEnable(GL_DEPTH_TEST)
-        glEnable(GL_MULTISAMPLE)
-        glEnable(GL_CULL_FACE)
+        gl_state.enable(GL_DEPTH_TEST)
+        gl_state.enable(GL_CULL_FACE)
         glCullFace(GL_BACK)
 
-        fov_degrees = 30.0
-        near_plane = 0.5
-        far_plane = 10000.0
-
         num_report_frames = 100
 
         world.set_variable("ms_per_frame", np.nan)
+        world.set_variable("gl_state_calls", (0, 0))
+
+        # Multi-sampling is a World variable, so the quality controller and the user can both change it.
+
+        world.subscribe("msaa_enabled", Application.msaa_enabled_changed)
+        world.set_variable("msaa_enabled", True)
+
+        # The quality controller can be switched on and off by the user, if there is a target frame time.
+
+        world.set_variable("quality_status", "off")
+        world.set_variable("quality_controller_enabled", self._target_frame_time is not None)
+
+        quality_controller = None
+        t_previous_frame = None
+
+        def prepare_frame_func(frame_packet: FramePacket) -> None:
+            prepare_frame(world, scene, frame_packet)
+
+        if self._pipelined:
+            print("Preparing frames on a worker thread.")
+            frame_pipeline = FramePipeline(prepare_frame_func)
+            frame_pipeline.request(frame_counter)
+        else:
+            frame_pipeline = None
+            frame_packet = FramePacket()
 
         while not glfw.window_should_close(window):
 
-            t_wallclock = glfw.get_time()
-            if frame_counter % num_report_frames == 0:
-                if t_previous_wallclock is not None:
-                    frame_duration = (t_wallclock - t_previous_wallclock) / num_report_frames
-                    world.set_variable("ms_per_frame", frame_duration * 1000.0)
-                t_previous_wallclock = t_wallclock
+            if self._frame_limit is not None and frame_counter >= self._frame_limit:
+                break
 
-            # Sample world time.
-            # All queries to world.time() up until the next sample_time() call will give the same time value.
+            self._frame_counter = frame_counter
 
-            world.sample_time()
+            # Input and quality changes lock the World, so they do not interleave with a frame in preparation.
 
-            # Make view matrix.
+            t_wallclock = glfw.get_time()
 
-            render_distance = world.get_variable("render_distance")
+            with world.lock:
 
-            view_matrix = translate((0.0, 0.0, -render_distance)) @ rotate((0, 1, 0), world.time() * 0.0)
+                if frame_counter % num_report_frames == 0:
+                    if t_previous_wallclock is not None:
+                        frame_duration = (t_wallclock - t_previous_wallclock) / num_report_frames
+                        world.set_variable("ms_per_frame", frame_duration * 1000.0)
+                    t_previous_wallclock = t_wallclock
 
-            # Make model matrix.
+                # Let the quality controller process the duration of the previous frame.
 
-            model_matrix = np.identity(4)
+                if world.get_variable("quality_controller_enabled") and self._target_frame_time is not None:
+                    if quality_controller is None:
+                        quality_controller = QualityController(world, self._target_frame_time)
+                    elif t_previous_frame is not None:
+                        quality_controller.update(t_wallclock - t_previous_frame)
+                elif quality_controller is not None:
+                    print("Quality controller: switched off.")
+                    quality_controller.close()
+                    quality_controller = None
 
-            # Make perspective projection matrix.
+                t_previous_frame = t_wallclock
 
-            (framebuffer_width, framebuffer_height) = glfw.get_framebuffer_size(window)
+            if frame_pipeline is None:
+                frame_packet.frame = frame_counter
+                prepare_frame_func(frame_packet)
+            else:
+                frame_packet = frame_pipeline.wait()
+                # Start preparing the next frame, while this frame is submitted.
+                self._clock.advance()
+                frame_pipeline.request(frame_counter + 1)
 
-            if framebuffer_width > 0 and framebuffer_height > 0:
+            if self._recorder is not None:
+                self._recorder.record_frame(frame_counter, frame_packet.clock_time)
 
-                projection_matrix = perspective_projection(
-                    framebuffer_width,
-                    framebuffer_height,
-                    fov_degrees,
-                    near_plane,
-                    far_plane
-                )
+            if frame_packet.projection_matrix is not None:
 
                 glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
 
-                scene.render(projection_matrix, view_matrix, model_matrix)
+                scene.submit(frame_packet.projection_matrix, frame_packet.view_matrix, frame_packet.draws)
+
+                # Report the number of issued and skipped state changes of this frame.
+                world.set_variable("gl_state_calls", gl_state.end_frame())
 
                 glfw.swap_buffers(window)
 
-            glfw.poll_events()
+            with world.lock:
+
+                glfw.poll_events()
+
+                if self._replayer is not None:
+                    # Deliver the keyboard events that were received during this frame of the recorded run.
+                    for (key, scancode, action, mods) in self._replayer.keyboard_events(frame_counter):
+                        self._user_interaction_handler.process_keyboard_event(window, key, scancode, action, mods)
+
+            if frame_pipeline is None:
+                self._clock.advance()
+
             frame_counter += 1
 
+        if frame_pipeline is not None:
+            frame_pipeline.close()
+
         scene.close()
 
+        if self._recorder is not None:
+            self._recorder.close()
+
         glfw.destroy_window(window)
         glfw.terminate()
 
+    @staticmethod
+    def msaa_enabled_changed(_name: str, msaa_enabled: bool):
+        print("{} multisampling".format("enabling" if msaa_enabled else "disabling"))
+        if msaa_enabled:
+            gl_state.enable(GL_MULTISAMPLE)
+        else:
+            gl_state.disable(GL_MULTISAMPLE)
+
     def framebuffer_size_callback(self, _window, width, height):
         print("Resizing framebuffer:", width, height)
         glViewport(0, 0, width, height)
         self._world.set_variable("framebuffer_size", (width, height))
 
     def key_callback(self, window, key: int, scancode: int, action: int, mods: int):
+        if self._replayer is not None:
+            # Live keyboard events are ignored while replaying a recording.
+            return
+        if self._recorder is not None:
+            self._recorder.record_keyboard_event(self._frame_counter, key, scancode, action, mods)
         if self._user_interaction_handler is not None:
             self._user_interaction_handler.process_keyboard_event(window, key, scancode, action, mods)
 
@@ -443,7 +648,55 @@ class Application:
 
 
 def main():
-    app = Application()
+
+    parser = argparse.ArgumentParser(description="Render a diamond lattice.")
+
+    parser.add_argument("--clock", choices=("wall", "fixed", "scripted"), default="wall",
+                        help="world clock: real time, a fixed timestep per frame, or the frame times of the replayed recording")
+    parser.add_argument("--timestep", type=float, default=1.0 / 60.0, help="timestep of the fixed clock [s]")
+    parser.add_argument("--record", metavar="FILENAME", help="record frame times and keyboard events to a file")
+    parser.add_argument("--replay", metavar="FILENAME", help="replay the keyboard events of a recording")
+    parser.add_argument("--headless", action="store_true", help="render to an invisible window")
+    parser.add_argument("--frames", type=int, help="stop after rendering this number of frames")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="prepare the next frame on a worker thread while submitting the current frame")
+    parser.add_argument("--debug", action="store_true", help="check for OpenGL errors after each per-frame call")
+    parser.add_argument("--target-frame-time", type=float,
+                        help="enable the quality controller, aiming for this frame time [ms]; "
+                             "needs the wall clock and cannot be combined with --replay")
+
+    args = parser.parse_args()
+
+    frame_limit = args.frames
+
+    replayer = InputReplayer(args.replay) if args.replay is not None else None
+
+    match args.clock:
+        case "wall":
+            clock = WallClock()
+        case "fixed":
+            clock = FixedTimestepClock(args.timestep)
+        case "scripted":
+            if replayer is None:
+                parser.error("the scripted clock needs a recording to replay")
+            clock = ScriptedClock(replayer.frame_times())
+            if frame_limit is None:
+                frame_limit = replayer.frame_count()
+
+    if args.pipelined and (args.record is not None or args.replay is not None):
+        parser.error("--record and --replay cannot be combined with --pipelined")
+
+    if args.target_frame_time is not None:
+        if args.target_frame_time <= 0:
+            parser.error("the target frame time must be positive")
+        if args.clock != "wall" or args.replay is not None:
+            parser.error("the quality controller needs the wall clock and cannot be combined with --replay")
+        target_frame_time = args.target_frame_time / 1000.0
+    else:
+        target_frame_time = None
+
+    app = Application(clock, args.record, replayer, args.headless, frame_limit, target_frame_time, args.pipelined,
+                      args.debug)
     app.run()
 
 
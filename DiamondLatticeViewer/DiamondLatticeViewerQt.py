@@ -0,0 +1,375 @@
+#! /usr/bin/env python3
+
+"""Render the diamond lattice scene in a Qt widget, on demand.
+
+The SceneWidget is a QOpenGLWidget that hosts a scene of renderables. Unlike the GLFW application, which renders
+frames in a loop, the widget only repaints when something changed:
+
+    input        -- key presses and mouse buttons, which are handled as in the GLFW application;
+    timer ticks  -- while the world time runs (i.e., is not frozen), an animation timer requests a frame;
+    World        -- any change of a World variable made outside of painting, e.g. by a tool that embeds the widget.
+
+Qt coalesces the requests, so a burst of changes results in a single repaint. When the world time is frozen and
+nothing changes, the widget renders nothing, and the process is idle.
+
+Optionally, frames are prepared on a worker thread (see utilities/frame_pipeline.py). A frame is then requested
+from the worker as soon as a repaint is requested, and paintGL() only submits it. If something changed while the
+frame was being prepared, it is prepared again.
+
+The scene renders into the framebuffer object of the widget; renderables find it in the 'default_framebuffer'
+World variable. The widget renders its own framebuffer size in device pixels. The frame time quality controller
+of the GLFW application is not used, since the frame rate is not continuous.
+
+PyOpenGL must use the same window system interface as Qt; on Wayland, set PYOPENGL_PLATFORM=egl.
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import glfw
+
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QSurfaceFormat
+from PySide6.QtOpenGLWidgets import QOpenGLWidget
+from PySide6.QtWidgets import QApplication, QMainWindow
+
+from utilities.opengl_symbols import *
+from utilities.opengl_state import gl_state
+from utilities.opengl_fast_path import gl_fast
+
+from renderables import RenderableCompiledScene
+
+from utilities.world import World
+from utilities.clocks import MonotonicClock
+from utilities.frame_pipeline import FramePacket, FramePipeline
+
+from DiamondLatticeViewer import make_scene, prepare_frame, UserInteractionHandler
+
+# Qt keys that do not have the same code as in GLFW. Printable keys (space up to the grave accent, with the
+# letters as upper case) have their ASCII code in both.
+
+QT_TO_GLFW_KEYS = {
+    Qt.Key.Key_Escape: glfw.KEY_ESCAPE,
+    Qt.Key.Key_Return: glfw.KEY_ENTER,
+    Qt.Key.Key_Enter: glfw.KEY_KP_ENTER,
+    Qt.Key.Key_Tab: glfw.KEY_TAB,
+    Qt.Key.Key_Backspace: glfw.KEY_BACKSPACE,
+    Qt.Key.Key_Left: glfw.KEY_LEFT,
+    Qt.Key.Key_Right: glfw.KEY_RIGHT,
+    Qt.Key.Key_Up: glfw.KEY_UP,
+    Qt.Key.Key_Down: glfw.KEY_DOWN
+}
+
+QT_TO_GLFW_MOUSE_BUTTONS = {
+    Qt.MouseButton.LeftButton: glfw.MOUSE_BUTTON_LEFT,
+    Qt.MouseButton.RightButton: glfw.MOUSE_BUTTON_RIGHT,
+    Qt.MouseButton.MiddleButton: glfw.MOUSE_BUTTON_MIDDLE
+}
+
+
+def glfw_key(qt_key: int):
+    """Return the GLFW key code of a Qt key, or None if it has none."""
+    if ord(" ") <= qt_key <= ord("`"):
+        return qt_key
+    try:
+        return QT_TO_GLFW_KEYS.get(Qt.Key(qt_key))
+    except ValueError:
+        return None
+
+
+class SceneWidget(QOpenGLWidget):
+    """Render a scene of renderables in a Qt widget, repainting only when something changed."""
+
+    def __init__(self, make_scene_func=make_scene, clock=None, animation_interval: int = 16,
+                 pipelined: bool = False, debug: bool = False, parent=None):
+        """Create the widget.
+
+        The scene is made by make_scene_func(world), once the OpenGL context exists.
+        The clock drives the world time (default: a MonotonicClock).
+        While the world time runs, a frame is requested every 'animation_interval' milliseconds; 0 disables this.
+        A pipelined widget prepares frames on a worker thread.
+        In debug mode, the per-frame OpenGL calls check for OpenGL errors.
+        """
+        super().__init__(parent)
+
+        self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
+
+        self._make_scene_func = make_scene_func
+        self._clock = clock if clock is not None else MonotonicClock()
+        self._pipelined = pipelined
+        self._debug = debug
+
+        self.world = World(self._clock)
+        self.world.set_variable("render_distance", 60.0)
+        self.world.set_variable("default_framebuffer", 0)
+        self.world.set_variable("framebuffer_size", (1, 1))
+        self.world.set_variable("ms_per_frame", np.nan)
+        self.world.set_variable("gl_state_calls", (0, 0))
+        self.world.set_variable("msaa_enabled", True)
+        self.world.set_variable("quality_status", "off")
+        self.world.subscribe_all(self._world_variable_changed)
+
+        self._user_interaction_handler = UserInteractionHandler(None, self.world)
+
+        self._scene = None
+        self._frame_counter = 0
+        self._frame_packet = FramePacket()
+        self._frame_pipeline = None
+        self._frame_requested = False  # The worker thread is preparing a frame that was not yet submitted.
+        self._frame_stale = False  # Something changed after the requested frame started to be prepared.
+        self._painting = False
+
+        self._animation_timer = QTimer(self)
+        self._animation_timer.timeout.connect(self.request_frame)
+        if animation_interval > 0:
+            self._animation_timer.setInterval(animation_interval)
+            self._update_animation_timer()
+
+    def request_frame(self) -> None:
+        """Schedule a repaint."""
+
+        if self._frame_pipeline is not None:
+            if self._frame_requested:
+                self._frame_stale = True
+            else:
+                self._frame_pipeline.request(self._frame_counter)
+                self._frame_requested = True
+
+        self.update()
+
+    def _finish_frame_preparation(self) -> None:
+        """Wait until the worker thread has prepared the requested frame, if any.
+
+        Input handlers change the World and the renderables, so they must not run while a frame is prepared.
+        The prepared frame is dropped; the handler requests a new one.
+        """
+
+        if self._frame_pipeline is not None and self._frame_requested:
+            self._frame_pipeline.wait()
+            self._frame_requested = False
+            self._frame_stale = False
+
+    def _update_animation_timer(self) -> None:
+        """Run the animation timer only while the world time runs."""
+
+        if self._animation_timer.interval() <= 0:
+            return
+
+        if self.world.get_freeze_status():
+            self._animation_timer.stop()
+        elif not self._animation_timer.isActive():
+            self._animation_timer.start()
+
+    def _world_variable_changed(self, _name: str, _value) -> None:
+        # Renderables report statistics through World variables while painting; those do not need a new frame.
+        if not self._painting:
+            self.request_frame()
+
+    def _prepare_frame(self, frame_packet: FramePacket) -> None:
+        prepare_frame(self.world, self._scene, frame_packet)
+
+    def initializeGL(self):
+
+        # Resolve the raw OpenGL function pointers for the per-frame calls.
+        # In debug mode, check for OpenGL errors after each call.
+        gl_fast.resolve(error_checking=self._debug)
+
+        self._painting = True
+
+        try:
+            self.world.set_variable("framebuffer_size", self._framebuffer_size())
+            self.world.set_variable("default_framebuffer", self.defaultFramebufferObject())
+
+            # Compile the scene graph into a flat list of nodes and draw packets.
+            self._scene = RenderableCompiledScene(self._make_scene_func(self.world))
+        finally:
+            self._painting = False
+
+        # The OpenGL objects must be deleted while the context still exists.
+
+        self.context().aboutToBeDestroyed.connect(self._close_scene)
+
+        if self._pipelined:
+            print("Preparing frames on a worker thread.")
+            self._frame_pipeline = FramePipeline(self._prepare_frame)
+
+    def _close_scene(self) -> None:
+
+        if self._frame_pipeline is not None:
+            if self._frame_requested:
+                self._frame_pipeline.wait()
+                self._frame_requested = False
+            self._frame_pipeline.close()
+            self._frame_pipeline = None
+
+        if self._scene is not None:
+            self.makeCurrent()
+            self._scene.close()
+            self._scene = None
+            self.doneCurrent()
+
+    def _framebuffer_size(self) -> tuple[int, int]:
+        ratio = self.devicePixelRatioF()
+        return (round(self.width() * ratio), round(self.height() * ratio))
+
+    def resizeGL(self, w: int, h: int):
+        self._finish_frame_preparation()
+        # Qt sets the viewport before paintGL(); the framebuffer size is in device pixels.
+        self.world.set_variable("framebuffer_size", self._framebuffer_size())
+
+    def paintGL(self):
+
+        if self._scene is None:
+            return
+
+        self._painting = True
+
+        try:
+            self._paint()
+        finally:
+            self._painting = False
+
+    def _paint(self) -> None:
+
+        world = self.world
+
+        t1 = time.monotonic()
+
+        # The framebuffer object of the widget changes when it is resized.
+
+        world.set_variable("default_framebuffer", self.defaultFramebufferObject())
+
+        if self._frame_pipeline is None:
+            frame_packet = self._frame_packet
+            frame_packet.frame = self._frame_counter
+            self._prepare_frame(frame_packet)
+        else:
+            # A repaint that Qt requested itself (e.g. after an expose) has no frame in preparation yet.
+            if not self._frame_requested:
+                self._frame_pipeline.request(self._frame_counter)
+            frame_packet = self._frame_pipeline.wait()
+            while self._frame_stale:
+                self._frame_stale = False
+                self._frame_pipeline.request(self._frame_counter)
+                frame_packet = self._frame_pipeline.wait()
+            self._frame_requested = False
+
+        if frame_packet.projection_matrix is not None:
+
+            # Qt may change the OpenGL state between repaints, so the state cache starts afresh every frame.
+
+            gl_state.invalidate()
+
+            gl_state.enable(GL_DEPTH_TEST)
+            gl_state.enable(GL_CULL_FACE)
+            glCullFace(GL_BACK)
+
+            if world.get_variable("msaa_enabled"):
+                gl_state.enable(GL_MULTISAMPLE)
+            else:
+                gl_state.disable(GL_MULTISAMPLE)
+
+            glClearColor(0.12, 0.12, 0.12, 1.0)
+            glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+            self._scene.submit(frame_packet.projection_matrix, frame_packet.view_matrix, frame_packet.draws)
+
+            # Report the number of issued and skipped state changes of this frame.
+            world.set_variable("gl_state_calls", gl_state.end_frame())
+
+        self._clock.advance()
+        self._frame_counter += 1
+
+        # Frames are not rendered continuously, so the overlay shows the time spent on the previous repaint.
+
+        t2 = time.monotonic()
+        world.set_variable("ms_per_frame", (t2 - t1) * 1000.0)
+
+    def keyPressEvent(self, event):
+
+        key = glfw_key(event.key())
+
+        if key is None:
+            super().keyPressEvent(event)
+            return
+
+        self._finish_frame_preparation()
+
+        match key:
+            case glfw.KEY_ESCAPE:
+                self.window().close()
+            case glfw.KEY_F:
+                window = self.window()
+                window.setWindowState(window.windowState() ^ Qt.WindowState.WindowFullScreen)
+            case _:
+                action = glfw.REPEAT if event.isAutoRepeat() else glfw.PRESS
+                self._user_interaction_handler.process_keyboard_event(None, key, event.nativeScanCode(), action, 0)
+
+        # Not all input changes World variables (e.g., the cut mode of the diamond lattice); repaint anyway.
+
+        self._update_animation_timer()
+        self.request_frame()
+
+    def mousePressEvent(self, event):
+        button = QT_TO_GLFW_MOUSE_BUTTONS.get(event.button())
+        if button is not None:
+            self._finish_frame_preparation()
+            position = event.position()
+            self._user_interaction_handler.set_cursor_position(position.x() / self.width(), position.y() / self.height())
+            self._user_interaction_handler.process_mouse_button_event(None, button, glfw.PRESS, 0)
+            self.request_frame()
+
+    def wheelEvent(self, event):
+        # Qt reports the wheel angle in eighths of a degree; GLFW reports steps of 15 degrees.
+        delta = event.angleDelta()
+        self._finish_frame_preparation()
+        self._user_interaction_handler.process_scroll_event(None, delta.x() / 120.0, delta.y() / 120.0)
+        self.request_frame()
+
+
+class SceneWindow(QMainWindow):
+
+    def __init__(self, scene_widget: SceneWidget):
+        super().__init__()
+        self.setWindowTitle("DiamondViewer")
+        self.setCentralWidget(scene_widget)
+        self.resize(640, 480)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Render a diamond lattice in a Qt window, on demand.")
+
+    parser.add_argument("--animation-interval", type=int, default=16,
+                        help="interval between frames while the world time runs [ms]; 0 renders on input only")
+    parser.add_argument("--pipelined", action="store_true",
+                        help="prepare frames on a worker thread")
+    parser.add_argument("--debug", action="store_true", help="check for OpenGL errors after each per-frame call")
+
+    args = parser.parse_args()
+
+    # The scene needs an OpenGL 4.1 core profile context. Qt creates the context of the widget with the default
+    # surface format, which must be set before the application is created.
+
+    surface_format = QSurfaceFormat()
+    surface_format.setVersion(4, 1)
+    surface_format.setProfile(QSurfaceFormat.OpenGLContextProfile.CoreProfile)
+    surface_format.setSamples(8)  # For multi-sampling
+    surface_format.setDepthBufferSize(24)
+    QSurfaceFormat.setDefaultFormat(surface_format)
+
+    app = QApplication()
+
+    scene_widget = SceneWidget(animation_interval=args.animation_interval, pipelined=args.pipelined,
+                               debug=args.debug)
+
+    main_window = SceneWindow(scene_widget)
+    main_window.show()
+
+    app.exec()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#! /usr/bin/env python3
+
+"""Microbenchmark: compare PyOpenGL calls per second to the ctypes fast path."""
+
+import os
+import time
+
+import numpy as np
+
+import glfw
+
+from utilities.opengl_symbols import *
+from utilities.opengl_utilities import create_opengl_program, gl_get_uniform_location_checked
+from utilities.opengl_fast_path import OpenGLFastPath
+
+
+def calls_per_second(function, args, call_count: int) -> float:
+    """Call the function repeatedly with the given arguments, and return the number of calls per second."""
+    t1 = time.perf_counter()
+    for _ in range(call_count):
+        function(*args)
+    t2 = time.perf_counter()
+    return call_count / (t2 - t1)
+
+
+def main():
+
+    if not glfw.init():
+        raise RuntimeError("Unable to initialize GLFW.")
+
+    glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 4)
+    glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 1)
+    glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+    glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, GL_TRUE)
+    glfw.window_hint(glfw.VISIBLE, False)
+
+    window = glfw.create_window(64, 64, "OpenGL fast path benchmark", None, None)
+    if not window:
+        raise RuntimeError("Unable to create window using GLFW.")
+
+    glfw.make_context_current(window)
+
+    # Use the diamond lattice shader program; it has matrix, float, and unsigned integer uniforms.
+
+    shader_source_path = os.path.join(os.path.dirname(__file__), "renderables", "diamond_lattice", "diamond_lattice")
+    (shaders, shader_program) = create_opengl_program(shader_source_path)
+
+    matrix_location = gl_get_uniform_location_checked(shader_program, "projection_matrix")
+    float_location = gl_get_uniform_location_checked(shader_program, "diamond_lattice_side_length")
+    uint_location = gl_get_uniform_location_checked(shader_program, "color_mode")
+
+    vao = glGenVertexArrays(1)
+
+    glUseProgram(shader_program)
+    glBindVertexArray(vao)
+
+    matrix = np.identity(4, dtype=np.float32)
+
+    pyopengl_path = OpenGLFastPath()
+
+    fast_path = OpenGLFastPath()
+    fast_path.resolve()
+
+    error_checked_fast_path = OpenGLFastPath()
+    error_checked_fast_path.resolve(error_checking=True)
+
+    benchmarks = [
+        ("glUseProgram", (shader_program, )),
+        ("glBindVertexArray", (vao, )),
+        ("glEnable", (GL_CULL_FACE, )),
+        ("glUniform1f", (float_location, 19.0)),
+        ("glUniform1ui", (uint_location, 1)),
+        ("glUniformMatrix4fv", (matrix_location, 1, GL_TRUE, matrix)),
+        ("glDrawArrays", (GL_TRIANGLES, 0, 0))
+    ]
+
+    call_count = 100000
+
+    print()
+    print("{:24} {:>16} {:>16} {:>16} {:>10}".format(
+        "function", "PyOpenGL [1/s]", "fast [1/s]", "checked [1/s]", "speedup"))
+
+    for (name, args) in benchmarks:
+        pyopengl_rate = calls_per_second(getattr(pyopengl_path, name), args, call_count)
+        fast_rate = calls_per_second(getattr(fast_path, name), args, call_count)
+        error_checked_rate = calls_per_second(getattr(error_checked_fast_path, name), args, call_count)
+        glFinish()
+        print("{:24} {:16.0f} {:16.0f} {:16.0f} {:10.2f}".format(
+            name, pyopengl_rate, fast_rate, error_checked_rate, fast_rate / pyopengl_rate))
+
+    glBindVertexArray(0)
+    glDeleteVertexArrays(1, (vao, ))
+    glDeleteProgram(shader_program)
+    for shader in shaders:
+        glDeleteShader(shader)
+
+    glfw.destroy_window(window)
+    glfw.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
 """This package provides several renderable objects."""
 
-from .structural import RenderableScene, RenderableModelTransformer, RenderableOptionalModel
+from .structural import (RenderableScene, RenderableModelTransformer, RenderableOptionalModel,
+                         RenderableCompiledScene)
+
+from .dynamic_resolution.dynamic_resolution import RenderableDynamicResolution
 
 from .floor.floor import RenderableFloor
 
 from .sphere_impostor.sphere_impostor import RenderableSphereImpostor
+from .sphere_impostor.sphere_impostor_batch import RenderableSphereImpostorBatch
 from .cylinder_impostor.cylinder_impostor import RenderableCylinderImpostor
 from .diamond_lattice.diamond_lattice import RenderableDiamondLattice
 
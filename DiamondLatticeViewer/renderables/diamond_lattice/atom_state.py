@@ -0,0 +1,206 @@
+"""This module implements the AtomStateBuffer class.
+
+The appearance of each atom of the diamond lattice is modified by a per-atom state byte:
+
+    bit 0       -- hidden (e.g., a vacancy); bonds to a hidden atom are hidden as well.
+    bit 1       -- highlighted (e.g., a selection).
+    bits 2..7   -- color index; 0 keeps the color of the current color mode, other values select an entry of
+                   ATOM_STATE_COLORS (e.g., for dopants).
+
+All bits zero is the default appearance, so a lattice without state changes looks as before.
+
+The state bytes are kept in a NumPy array, and mirrored in an OpenGL buffer that the vertex shader reads through a
+buffer texture. Changes are only applied to the array, and the blocks of atoms that they touch are marked dirty.
+Before the next draw, each run of dirty blocks is uploaded with a single glBufferSubData call. Changing thousands
+of atoms therefore costs a few NumPy operations and a handful of small uploads, and the vertex data of the lattice
+is not touched.
+
+The methods that change states accept an atom id, a slice of atom ids, an array of atom ids, or a boolean mask;
+see RenderableDiamondLattice.atom_ids() for the numbering.
+"""
+
+import numpy as np
+
+from utilities.opengl_symbols import *
+from utilities.opengl_state import gl_state
+from utilities.opengl_fast_path import gl_fast
+
+ATOM_STATE_HIDDEN = 0x01
+ATOM_STATE_HIGHLIGHTED = 0x02
+ATOM_STATE_COLOR_SHIFT = 2
+
+# The colors selected by the nonzero color indices. Entry 0 is a placeholder; index 0 means the color mode's color.
+
+ATOM_STATE_COLORS = np.array([
+    (1.0, 1.0, 1.0),
+    (0.9, 0.2, 0.2),  # Red.
+    (0.2, 0.8, 0.2),  # Green.
+    (0.2, 0.4, 1.0),  # Blue.
+    (1.0, 0.9, 0.2),  # Yellow.
+    (0.9, 0.3, 0.9),  # Magenta.
+    (0.2, 0.9, 0.9),  # Cyan.
+    (1.0, 0.6, 0.1)   # Orange.
+], dtype=np.float32)
+
+# Dirty atoms are tracked per block of this many atoms (i.e., bytes).
+
+DIRTY_BLOCK_SIZE = 256
+
+
+class AtomStateBuffer:
+    """Per-atom state bytes, mirrored in an OpenGL buffer texture that is updated in dirty spans."""
+
+    def __init__(self, atoms_per_unit_cell: int):
+
+        self._atoms_per_unit_cell = atoms_per_unit_cell
+
+        self.unit_cells_per_dimension = 0
+        self.states = np.zeros(0, dtype=np.uint8)
+
+        self._dirty_blocks = np.zeros(0, dtype=bool)
+        self._reallocate = True  # The buffer must be (re-)allocated and uploaded in full.
+
+        self._buffer = glGenBuffers(1)
+        self._texture = glGenTextures(1)
+
+    def close(self) -> None:
+
+        if self._texture is not None:
+            glDeleteTextures(1, (self._texture, ))
+            self._texture = None
+
+        if self._buffer is not None:
+            glDeleteBuffers(1, (self._buffer, ))
+            self._buffer = None
+
+    @property
+    def texture(self) -> int:
+        return self._texture
+
+    def resize(self, unit_cells_per_dimension: int) -> None:
+        """Change the number of unit cells per dimension of the lattice.
+
+        The lattice is centered, and the number of unit cells is odd, so the states of the unit cells that are part
+        of both the old and the new lattice are kept.
+        """
+
+        old_n = self.unit_cells_per_dimension
+        new_n = unit_cells_per_dimension
+
+        if new_n == old_n:
+            return
+
+        old_states = self.states.reshape(old_n, old_n, old_n, self._atoms_per_unit_cell)
+        new_states = np.zeros((new_n, new_n, new_n, self._atoms_per_unit_cell), dtype=np.uint8)
+
+        # The overlap of the old and the new lattice, centered in both.
+
+        overlap = min(old_n, new_n)
+        old_region = slice((old_n - overlap) // 2, (old_n + overlap) // 2)
+        new_region = slice((new_n - overlap) // 2, (new_n + overlap) // 2)
+
+        new_states[new_region, new_region, new_region] = old_states[old_region, old_region, old_region]
+
+        self.unit_cells_per_dimension = new_n
+        self.states = new_states.reshape(-1)
+
+        block_count = (self.states.size + DIRTY_BLOCK_SIZE - 1) // DIRTY_BLOCK_SIZE
+        self._dirty_blocks = np.zeros(block_count, dtype=bool)
+        self._reallocate = True
+
+    def _mark_dirty(self, atoms) -> None:
+        """Mark the blocks that contain the given atoms as dirty."""
+
+        if isinstance(atoms, slice):
+            atom_range = range(*atoms.indices(self.states.size))
+            if len(atom_range) == 0:
+                return
+            (first, last) = sorted((atom_range[0], atom_range[-1]))
+            self._dirty_blocks[first // DIRTY_BLOCK_SIZE:last // DIRTY_BLOCK_SIZE + 1] = True
+            return
+
+        atoms = np.asarray(atoms)
+
+        if atoms.dtype == bool:
+            atoms = np.flatnonzero(atoms)
+
+        self._dirty_blocks[atoms // DIRTY_BLOCK_SIZE] = True
+
+    def set_hidden(self, atoms, hidden: bool = True) -> None:
+        """Hide the given atoms (and their bonds), or show them again."""
+        if hidden:
+            self.states[atoms] |= ATOM_STATE_HIDDEN
+        else:
+            self.states[atoms] &= ~np.uint8(ATOM_STATE_HIDDEN)
+        self._mark_dirty(atoms)
+
+    def set_highlighted(self, atoms, highlighted: bool = True) -> None:
+        """Highlight the given atoms, or remove their highlight."""
+        if highlighted:
+            self.states[atoms] |= ATOM_STATE_HIGHLIGHTED
+        else:
+            self.states[atoms] &= ~np.uint8(ATOM_STATE_HIGHLIGHTED)
+        self._mark_dirty(atoms)
+
+    def set_color_index(self, atoms, color_index: int) -> None:
+        """Give the given atoms a color of ATOM_STATE_COLORS; color index 0 restores the color mode's color."""
+
+        if not 0 <= color_index < len(ATOM_STATE_COLORS):
+            raise ValueError("Bad color index: {}.".format(color_index))
+
+        flags = ATOM_STATE_HIDDEN | ATOM_STATE_HIGHLIGHTED
+
+        self.states[atoms] = (self.states[atoms] & flags) | (color_index << ATOM_STATE_COLOR_SHIFT)
+        self._mark_dirty(atoms)
+
+    def reset(self) -> None:
+        """Restore the default appearance of all atoms."""
+        self.states[:] = 0
+        self._dirty_blocks[:] = True
+
+    def upload(self) -> None:
+        """Upload the dirty spans of the states to the OpenGL buffer. The buffer texture must be bound."""
+
+        if self._reallocate:
+
+            # Allocate at least one byte, so the buffer texture always has a data store.
+
+            states = self.states if self.states.size > 0 else np.zeros(1, dtype=np.uint8)
+
+            glBindBuffer(GL_TEXTURE_BUFFER, self._buffer)
+            glBufferData(GL_TEXTURE_BUFFER, states.nbytes, states, GL_DYNAMIC_DRAW)
+            glBindBuffer(GL_TEXTURE_BUFFER, 0)
+
+            # (Re-)attach the buffer to the buffer texture.
+
+            glTexBuffer(GL_TEXTURE_BUFFER, GL_R8UI, self._buffer)
+
+            self._dirty_blocks[:] = False
+            self._reallocate = False
+            return
+
+        if not self._dirty_blocks.any():
+            return
+
+        # Find the runs of consecutive dirty blocks: their starts and (exclusive) ends.
+
+        edges = np.diff(self._dirty_blocks.astype(np.int8), prepend=0, append=0)
+        run_starts = np.flatnonzero(edges == 1)
+        run_ends = np.flatnonzero(edges == -1)
+
+        glBindBuffer(GL_TEXTURE_BUFFER, self._buffer)
+
+        for (run_start, run_end) in zip(run_starts, run_ends):
+            first = int(run_start) * DIRTY_BLOCK_SIZE
+            end = min(int(run_end) * DIRTY_BLOCK_SIZE, self.states.size)
+            gl_fast.glBufferSubData(GL_TEXTURE_BUFFER, first, end - first, self.states[first:end])
+
+        glBindBuffer(GL_TEXTURE_BUFFER, 0)
+
+        self._dirty_blocks[:] = False
+
+    def bind(self, texture_unit: int) -> None:
+        """Bind the buffer texture to the given texture unit, and upload the dirty states."""
+        gl_state.active_texture(texture_unit)
+        gl_state.bind_texture(GL_TEXTURE_BUFFER, self._texture)
+        self.upload()
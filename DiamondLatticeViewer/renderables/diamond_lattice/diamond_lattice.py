@@ -2,26 +2,95 @@
 
 import itertools
 import os
+import time
 
 import numpy as np
 
 from utilities.matrices import translate, scale, apply_transform_to_vertices
 from utilities.opengl_utilities import create_opengl_program, define_vertex_attributes, gl_get_uniform_location_checked
 from utilities.opengl_symbols import *
+from utilities.opengl_state import gl_state
+from utilities.opengl_fast_path import gl_fast
 from utilities.geometry import (make_unit_sphere_triangles, make_unit_cylinder_triangles,
                                 make_cylinder_placement_transform, normalize)
 
 from renderables.renderable import Renderable
 from utilities.world import World
 
+from .atom_state import AtomStateBuffer, ATOM_STATE_COLORS
+from .picking import DiamondLatticePicker
+
 
 def in_diamond_lattice(ix: int, iy: int, iz: int) -> bool:
     """Return if a given integer (ix, iy, iz) coordinate is occupied in the diamond lattice."""
     return (ix % 2 == iy % 2 == iz % 2) and (ix + iy + iz) % 4 < 2
 
 
+# The integer lattice coordinates of the atoms of a unit cell; the atom index of an atom is its index in this list.
+
+UNIT_CELL_ATOM_POSITIONS = [position for position in itertools.product(range(2, 6), repeat=3)
+                            if in_diamond_lattice(*position)]
+
+ATOMS_PER_UNIT_CELL = len(UNIT_CELL_ATOM_POSITIONS)
+
+
+def unit_cells_per_dimension(diamond_lattice_side_length: int) -> int:
+    """Return the (odd) number of unit cells per dimension that covers a lattice of the given side length."""
+    return 2 * ((diamond_lattice_side_length + 4) // 8) + 1
+
+
+def drawn_diamond_lattice_side_length(diamond_lattice_side_length: int, region_scale) -> int:
+    """Return the side length of the drawn part of the lattice: the given fraction of the side length, rounded to odd."""
+    if region_scale is None or region_scale >= 1.0:
+        return diamond_lattice_side_length
+    return max(1, int(diamond_lattice_side_length * region_scale) | 1)
+
+
+# The per-instance vertex data: the index of the unit cell that the instance draws.
+
+unit_cell_instance_dtype = np.dtype([
+    ("a_unit_cell_index", np.int32)
+])
+
+
+def make_unit_cell_order(unit_cells_per_dimension: int, octant) -> np.ndarray:
+    """Return the unit cell indices, ordered approximately front to back for a camera in the given octant.
+
+    The octant is a tuple of three booleans that indicate if the camera is on the positive side of the lattice center,
+    along the x, y, and z axes. Cells are ordered by their Manhattan distance to the lattice corner nearest to the camera.
+    If the octant is None, the cells are returned in index order.
+    """
+
+    n = unit_cells_per_dimension
+
+    unit_cell_indices = np.arange(n ** 3, dtype=np.int32)
+
+    if octant is None:
+        return unit_cell_indices
+
+    # The index of a unit cell is ix + n * (iy + n * iz); see the vertex shader.
+
+    ix = unit_cell_indices % n
+    iy = unit_cell_indices // n % n
+    iz = unit_cell_indices // n // n
+
+    (sx, sy, sz) = (1 if positive else -1 for positive in octant)
+
+    # Cells with a larger key are closer to the camera.
+
+    key = sx * ix + sy * iy + sz * iz
+
+    return unit_cell_indices[np.argsort(-key, kind="stable")]
+
+
 def make_diamond_lattice_unitcell_triangle_vertex_data(transformation_matrix=None):
-    """Define triangles for the sphere and cylinder impostors that we will upload to the VBO."""
+    """Define triangles for the sphere and cylinder impostors that we will upload to the VBO.
+
+    The sphere impostor triangles precede the cylinder impostor triangles, so the atoms can be drawn
+    without the bonds by drawing only the leading part of the VBO.
+
+    Returns the VBO data and the number of sphere impostor vertices.
+    """
 
     if transformation_matrix is None:
         transformation_matrix = np.identity(4)
@@ -48,10 +117,13 @@ def make_diamond_lattice_unitcell_triangle_vertex_data(transformation_matrix=Non
         ("a_lattice_delta", np.float32, 3),  # Lattice delta (zero vector for sphere, nonzero vector for cylinder)
         ("inverse_placement_matrix_row1", np.float32, 4),  # Row 1 of inverse placement matrix.
         ("inverse_placement_matrix_row2", np.float32, 4),  # Row 2 of inverse placement matrix.
-        ("inverse_placement_matrix_row3", np.float32, 4)  # Row 3 of inverse placement matrix.
+        ("inverse_placement_matrix_row3", np.float32, 4),  # Row 3 of inverse placement matrix.
+        ("a_atom_index", np.int32),  # Index of the (first) atom in the unit cell; see UNIT_CELL_ATOM_POSITIONS.
+        ("a_bonded_atom", np.int32, 4)  # For cylinders: unit cell offset (x, y, z) and index of the second atom.
     ])
 
-    vbo_data_list = []
+    sphere_vbo_data_list = []
+    cylinder_vbo_data_list = []
 
     sphere_impostor_scale_matrix = scale(1.26)
     cylinder_impostor_scale_matrix = scale((1.2, 1.2, 1.01))
@@ -82,6 +154,8 @@ def make_diamond_lattice_unitcell_triangle_vertex_data(transformation_matrix=Non
 
             c1 = np.array((ix - 3.5, iy - 3.5, iz - 3.5))
 
+            atom_index = UNIT_CELL_ATOM_POSITIONS.index((ix, iy, iz))
+
             # Add triangles for a single Carbon sphere.
 
             count_carbons += 1
@@ -102,8 +176,10 @@ def make_diamond_lattice_unitcell_triangle_vertex_data(transformation_matrix=Non
             vbo_data["inverse_placement_matrix_row1"] = inverse_sphere_placement_matrix[0]
             vbo_data["inverse_placement_matrix_row2"] = inverse_sphere_placement_matrix[1]
             vbo_data["inverse_placement_matrix_row3"] = inverse_sphere_placement_matrix[2]
+            vbo_data["a_atom_index"] = atom_index
+            vbo_data["a_bonded_atom"] = (0, 0, 0, 0)
 
-            vbo_data_list.append(vbo_data)
+            sphere_vbo_data_list.append(vbo_data)
 
             for (dx, dy, dz) in itertools.product((-1, 1), repeat=3):
 
@@ -127,6 +203,12 @@ def make_diamond_lattice_unitcell_triangle_vertex_data(transformation_matrix=Non
 
                     c2 = np.array((jx - 3.5, jy - 3.5, jz - 3.5))
 
+                    # The second carbon may be in a neighboring unit cell. Find that cell, and the atom index in it.
+
+                    unit_cell_offset = tuple((j - 2) // 4 for j in (jx, jy, jz))
+                    bonded_atom_position = tuple(j - 4 * offset for (j, offset) in zip((jx, jy, jz), unit_cell_offset))
+                    bonded_atom = (*unit_cell_offset, UNIT_CELL_ATOM_POSITIONS.index(bonded_atom_position))
+
                     # The bond cylinder doesn't have to go from the center of one carbon sphere to the center of
                     # the next carbon sphere; instead, it can go from the intersection of the bond cylinder with
                     # the first carbon sphere to the intersection of the bond cylinder with the second carbon sphere.
@@ -155,16 +237,20 @@ def make_diamond_lattice_unitcell_triangle_vertex_data(transformation_matrix=Non
                     vbo_data["inverse_placement_matrix_row1"] = inverse_cylinder_placement_matrix[0]
                     vbo_data["inverse_placement_matrix_row2"] = inverse_cylinder_placement_matrix[1]
                     vbo_data["inverse_placement_matrix_row3"] = inverse_cylinder_placement_matrix[2]
+                    vbo_data["a_atom_index"] = atom_index
+                    vbo_data["a_bonded_atom"] = bonded_atom
+
+                    cylinder_vbo_data_list.append(vbo_data)
 
-                    vbo_data_list.append(vbo_data)
+    sphere_vertex_count = sum(len(vbo_data) for vbo_data in sphere_vbo_data_list)
 
-    vbo_data = np.concatenate(vbo_data_list)
+    vbo_data = np.concatenate(sphere_vbo_data_list + cylinder_vbo_data_list)
 
     print("Diamond lattice unit cell contains {} carbon atoms and {} carbon-carbon bonds.".format(
         count_carbons, count_carbon_carbon_bonds
     ))
 
-    return vbo_data
+    return (vbo_data, sphere_vertex_count)
 
 
 class RenderableDiamondLattice(Renderable):
@@ -177,8 +263,28 @@ class RenderableDiamondLattice(Renderable):
 
         self._world = world
 
-        self.color_mode = 0
-        self.cut_mode = 0
+        self._color_mode = 0
+        self._cut_mode = 0
+
+        # The uniforms that must be uploaded before the next draw. Initially, all of them.
+        # The set is updated when the variables they depend on change.
+
+        self._dirty_uniforms = {"diamond_lattice_side_length", "color_mode", "cut_mode", "impostor_mode"}
+
+        world.subscribe("diamond_lattice_side_length", self._on_variable_changed)
+        world.subscribe("diamond_lattice_region_scale", self._on_variable_changed)
+        world.subscribe("impostor_mode", self._on_variable_changed)
+
+        self._unit_cells_per_dimension = None
+        self._diamond_lattice_side_length = None
+
+        # The per-atom states. They cover the entire lattice, so the drawn region can change without losing them.
+
+        self.atom_states = AtomStateBuffer(ATOMS_PER_UNIT_CELL)
+
+        diamond_lattice_side_length = world.get_variable("diamond_lattice_side_length")
+        if diamond_lattice_side_length is not None:
+            self.atom_states.resize(unit_cells_per_dimension(diamond_lattice_side_length))
 
         # Compile the shader program.
 
@@ -198,18 +304,51 @@ class RenderableDiamondLattice(Renderable):
         self._cut_mode_location = glGetUniformLocation(self._shader_program, "cut_mode")
         self._color_mode_location = glGetUniformLocation(self._shader_program, "color_mode")
         self._impostor_mode_location = glGetUniformLocation(self._shader_program, "impostor_mode")
+        self._atom_state_unit_cells_per_dimension_location = glGetUniformLocation(self._shader_program, "atom_state_unit_cells_per_dimension")
+
+        # The atom states are read from texture unit 1; the state colors are constant.
+
+        glUseProgram(self._shader_program)
+        glUniform1i(glGetUniformLocation(self._shader_program, "atom_states"), 1)
+        glUniform3fv(glGetUniformLocation(self._shader_program, "atom_state_colors"), len(ATOM_STATE_COLORS), ATOM_STATE_COLORS)
+        glUseProgram(0)
 
         # Make vertex buffer data.
 
-        vbo_data = make_diamond_lattice_unitcell_triangle_vertex_data()
+        (vbo_data, self._sphere_vertex_count) = make_diamond_lattice_unitcell_triangle_vertex_data()
 
         print("Diamond lattice unit cell size: {} triangles, {} vertices, {} bytes ({} bytes per triangle).".format(
             vbo_data.size // 3, vbo_data.size, vbo_data.nbytes, vbo_data.itemsize))
 
         self._vertex_count = vbo_data.size
 
-        # Make Vertex Buffer Object (VBO)
-        self._vbo = glGenBuffers(1)
+        # Picking. A pick that is requested is done when the lattice is drawn next, with the matrices of that draw.
+        # The pick shader program and framebuffer are made on the first GPU pick.
+
+        self._picker = DiamondLatticePicker(vbo_data)
+
+        self._last_draw_matrices = None  # The (projection, view-model) matrices of the last draw.
+        self._pick_request = None  # The normalized device coordinates of the requested pick.
+        self._picked_atom_ids = None  # The highlighted atoms of the last pick.
+
+        self._pick_shaders = None
+        self._pick_shader_program = None
+        self._pick_framebuffer = None
+        self._pick_renderbuffers = None
+
+        # An occlusion query counts the samples that pass the depth test while drawing the lattice.
+        # Its result is read back when available, without stalling the pipeline.
+
+        (self._samples_passed_query, ) = glGenQueries(1)
+        self._samples_passed_query_pending = False
+
+        # The unit cell order of the instances. It is re-calculated when the camera moves to another octant.
+        # The order key is (unit cells per dimension, octant); an octant of None means index order.
+
+        self._unit_cell_order_key = None
+
+        # Make Vertex Buffer Objects (VBOs) for the unit cell vertices and the unit cell order.
+        (self._vbo, self._instance_vbo) = glGenBuffers(2)
 
         glBindBuffer(GL_ARRAY_BUFFER, self._vbo)
         glBufferData(GL_ARRAY_BUFFER, vbo_data.nbytes, vbo_data, GL_STATIC_DRAW)
@@ -223,21 +362,100 @@ class RenderableDiamondLattice(Renderable):
         # Define attributes based on the vbo_data element type and enable them.
         define_vertex_attributes(vbo_data.dtype, True)
 
+        # The unit cell index attribute follows the vertex attributes, and advances once per instance.
+
+        glBindBuffer(GL_ARRAY_BUFFER, self._instance_vbo)
+        define_vertex_attributes(unit_cell_instance_dtype, True, first_attribute_index=len(vbo_data.dtype.fields), divisor=1)
+
         # Unbind VAO
         glBindVertexArray(0)
 
         # Unbind VBO.
         glBindBuffer(GL_ARRAY_BUFFER, 0)
 
+    @property
+    def color_mode(self) -> int:
+        return self._color_mode
+
+    @color_mode.setter
+    def color_mode(self, color_mode: int):
+        self._color_mode = color_mode
+        self._dirty_uniforms.add("color_mode")
+
+    @property
+    def cut_mode(self) -> int:
+        return self._cut_mode
+
+    @cut_mode.setter
+    def cut_mode(self, cut_mode: int):
+        self._cut_mode = cut_mode
+        self._dirty_uniforms.add("cut_mode")
+
+    def atom_ids(self, unit_cells, atom_indices) -> np.ndarray:
+        """Return the ids of atoms in the atom states, for use with the methods of AtomStateBuffer.
+
+        The unit cells are given as (x, y, z) coordinates relative to the center unit cell, and the atom indices
+        as indices into UNIT_CELL_ATOM_POSITIONS. Both are broadcast against each other; e.g., a (k, 3) array of
+        unit cells and an (ATOMS_PER_UNIT_CELL, 1) array of atom indices give the ids of all atoms in k unit cells.
+        """
+
+        n = self.atom_states.unit_cells_per_dimension
+
+        unit_cells = np.asarray(unit_cells) + (n - 1) // 2
+        atom_indices = np.asarray(atom_indices)
+
+        if np.any((unit_cells < 0) | (unit_cells >= n)):
+            raise ValueError("Unit cell outside of the diamond lattice.")
+
+        (ix, iy, iz) = np.moveaxis(unit_cells, -1, 0)
+
+        return ((iz * n + iy) * n + ix) * ATOMS_PER_UNIT_CELL + atom_indices
+
+    def _on_variable_changed(self, name: str, value) -> None:
+        if name == "diamond_lattice_side_length":
+            self.atom_states.resize(unit_cells_per_dimension(value))
+        if name == "diamond_lattice_region_scale":
+            # The region scale determines the side length of the drawn region.
+            name = "diamond_lattice_side_length"
+        self._dirty_uniforms.add(name)
+
     def close(self):
 
+        self._world.unsubscribe("diamond_lattice_side_length", self._on_variable_changed)
+        self._world.unsubscribe("diamond_lattice_region_scale", self._on_variable_changed)
+        self._world.unsubscribe("impostor_mode", self._on_variable_changed)
+
+        self.atom_states.close()
+
+        if self._pick_framebuffer is not None:
+            glDeleteFramebuffers(1, (self._pick_framebuffer, ))
+            self._pick_framebuffer = None
+
+        if self._pick_renderbuffers is not None:
+            glDeleteRenderbuffers(2, self._pick_renderbuffers)
+            self._pick_renderbuffers = None
+
+        if self._pick_shader_program is not None:
+            glDeleteProgram(self._pick_shader_program)
+            self._pick_shader_program = None
+
+        if self._pick_shaders is not None:
+            for shader in self._pick_shaders:
+                glDeleteShader(shader)
+            self._pick_shaders = None
+
         if self._vao is not None:
             glDeleteVertexArrays(1, (self._vao,))
             self._vao = None
 
+        if self._samples_passed_query is not None:
+            glDeleteQueries(1, (self._samples_passed_query, ))
+            self._samples_passed_query = None
+
         if self._vbo is not None:
-            glDeleteBuffers(1, (self._vbo, ))
+            glDeleteBuffers(2, (self._vbo, self._instance_vbo))
             self._vbo = None
+            self._instance_vbo = None
 
         if self._shader_program is not None:
             glDeleteProgram(self._shader_program)
@@ -248,30 +466,272 @@ class RenderableDiamondLattice(Renderable):
                 glDeleteShader(shader)
             self._shaders = None
 
+    def request_pick(self, x: float, y: float) -> None:
+        """Pick the atom or bond at the given normalized device coordinates when the lattice is drawn next.
+
+        The pick is done by the method that the 'diamond_lattice_pick_mode' World variable selects: 'cpu' (a ray
+        cast) or 'gpu' (an ID buffer). The result is shown in the 'diamond_lattice_pick' World variable, and the
+        picked atoms are highlighted.
+        """
+        self._pick_request = (x, y)
+
+    def pick(self, x: float, y: float):
+        """Return the atom or bond at the given normalized device coordinates in the last draw, or None.
+
+        The pick is done by a ray cast on the CPU; it can be called at any time, without an OpenGL context.
+        """
+
+        if self._last_draw_matrices is None:
+            return None
+
+        (projection_matrix, view_model_matrix) = self._last_draw_matrices
+
+        # Unproject the pick position on the near and far planes into the coordinate system of the lattice.
+
+        inverse_matrix = np.linalg.inv(projection_matrix @ view_model_matrix)
+
+        near_point = inverse_matrix @ (x, y, -1.0, 1.0)
+        far_point = inverse_matrix @ (x, y, +1.0, 1.0)
+
+        near_point = near_point[:3] / near_point[3]
+        far_point = far_point[:3] / far_point[3]
+
+        return self._picker.cast_ray(
+            near_point, far_point - near_point, self._unit_cells_per_dimension, self._diamond_lattice_side_length,
+            self._cut_mode, self.atom_states.states, self.atom_states.unit_cells_per_dimension)
+
+    def _make_pick_resources(self) -> None:
+        """Make the pick shader program, and the 1x1 pick framebuffer with an integer ID buffer."""
+
+        shader_source_path = os.path.join(os.path.dirname(__file__), "diamond_lattice")
+        (self._pick_shaders, self._pick_shader_program) = create_opengl_program(shader_source_path, "pick")
+
+        self._pick_framebuffer = glGenFramebuffers(1)
+        self._pick_renderbuffers = glGenRenderbuffers(2)
+
+        (id_renderbuffer, depth_renderbuffer) = self._pick_renderbuffers
+
+        glBindRenderbuffer(GL_RENDERBUFFER, id_renderbuffer)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_RG32UI, 1, 1)
+        glBindRenderbuffer(GL_RENDERBUFFER, depth_renderbuffer)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, 1, 1)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self._pick_framebuffer)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_RENDERBUFFER, id_renderbuffer)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, depth_renderbuffer)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("Pick framebuffer is incomplete (status 0x{:04x}).".format(status))
+
+    def _pick_gpu(self, x: float, y: float, projection_matrix, view_model_matrix, vertex_count: int):
+        """Return the atom or bond at the given normalized device coordinates, or None, using an ID buffer.
+
+        The lattice is drawn with the pick shader program into a 1x1 framebuffer that covers the pixel at the pick
+        position, and the ID of the nearest impostor is read back. The read-back waits for the GPU to finish.
+        The vertex array and the atom states must be bound.
+        """
+
+        # The pick renders into its own framebuffer; restore the current one afterwards.
+
+        framebuffer = glGetIntegerv(GL_DRAW_FRAMEBUFFER_BINDING)
+        viewport = glGetIntegerv(GL_VIEWPORT)
+
+        if self._pick_framebuffer is None:
+            self._make_pick_resources()
+
+        # Narrow the projection to the pixel at the pick position, so the 1x1 framebuffer covers it.
+
+        (framebuffer_width, framebuffer_height) = self._world.get_variable("framebuffer_size")
+
+        pick_projection_matrix = scale((framebuffer_width, framebuffer_height, 1.0)) @ translate((-x, -y, 0.0)) @ projection_matrix
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self._pick_framebuffer)
+        glViewport(0, 0, 1, 1)
+
+        # Zero is the background ID. Integer color buffers can only be cleared by glClearBufferuiv.
+
+        glClearBufferuiv(GL_COLOR, 0, np.zeros(4, dtype=np.uint32))
+        glClear(GL_DEPTH_BUFFER_BIT)
+
+        program = self._pick_shader_program
+
+        gl_state.use_program(program)
+
+        uniform_matrices = {
+            "projection_matrix": pick_projection_matrix,
+            "projection_view_model_matrix": pick_projection_matrix @ view_model_matrix,
+            "view_model_matrix": view_model_matrix,
+            "transposed_inverse_view_model_matrix": np.linalg.inv(view_model_matrix).T
+        }
+
+        for (name, matrix) in uniform_matrices.items():
+            glUniformMatrix4fv(glGetUniformLocation(program, name), 1, GL_TRUE, matrix.astype(np.float32))
+
+        glUniform1ui(glGetUniformLocation(program, "unit_cells_per_dimension"), self._unit_cells_per_dimension)
+        glUniform1f(glGetUniformLocation(program, "diamond_lattice_side_length"), self._diamond_lattice_side_length)
+        glUniform1ui(glGetUniformLocation(program, "cut_mode"), self._cut_mode)
+        glUniform1i(glGetUniformLocation(program, "atom_states"), 1)
+        glUniform1ui(glGetUniformLocation(program, "atom_state_unit_cells_per_dimension"), self.atom_states.unit_cells_per_dimension)
+
+        gl_fast.glDrawArraysInstanced(GL_TRIANGLES, 0, vertex_count, self._unit_cells_per_dimension ** 3)
+
+        pick_id = np.zeros(2, dtype=np.uint32)
+        glReadPixels(0, 0, 1, 1, GL_RG_INTEGER, GL_UNSIGNED_INT, pick_id)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, framebuffer)
+        glViewport(*viewport)
+
+        (unit_cell_id, code) = (int(pick_id[0]), int(pick_id[1]))
+
+        if unit_cell_id == 0:
+            return None
+
+        return self._picker.decode(unit_cell_id - 1, code, self._unit_cells_per_dimension)
+
+    def _show_pick(self, pick_result, pick_mode: str, duration: float) -> None:
+        """Highlight the picked atoms instead of those of the previous pick, and report the pick."""
+
+        if self._picked_atom_ids is not None:
+            self.atom_states.set_highlighted(self._picked_atom_ids, False)
+            self._picked_atom_ids = None
+
+        if pick_result is None:
+            description = "nothing"
+        else:
+            description = pick_result.describe()
+            (unit_cells, atom_indices) = zip(*pick_result.atoms())
+            try:
+                self._picked_atom_ids = self.atom_ids(unit_cells, atom_indices)
+            except ValueError:
+                # The atom at the other end of a bond is outside of the lattice.
+                self._picked_atom_ids = self.atom_ids(unit_cells[:1], atom_indices[:1])
+            self.atom_states.set_highlighted(self._picked_atom_ids)
+
+        print("Picked {} ({} pick, {:.3f} ms).".format(description, pick_mode, duration * 1000.0))
+
+        self._world.set_variable("diamond_lattice_pick", "{} ({}, {:.3f} ms)".format(description, pick_mode, duration * 1000.0))
+
+    def _update_unit_cell_order(self, inverse_view_model_matrix) -> None:
+        """Re-order the unit cell instances if the number of cells changed, or the camera moved to another octant."""
+
+        if self._world.get_variable("diamond_lattice_front_to_back"):
+            # The camera position, in the coordinate system of the lattice.
+            camera_position = inverse_view_model_matrix[:3, 3]
+            octant = tuple(bool(c >= 0.0) for c in camera_position)
+        else:
+            octant = None
+
+        unit_cell_order_key = (self._unit_cells_per_dimension, octant)
+
+        if unit_cell_order_key == self._unit_cell_order_key:
+            return
+
+        unit_cell_order = make_unit_cell_order(self._unit_cells_per_dimension, octant)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self._instance_vbo)
+        if self._unit_cell_order_key is None or self._unit_cell_order_key[0] != self._unit_cells_per_dimension:
+            glBufferData(GL_ARRAY_BUFFER, unit_cell_order.nbytes, unit_cell_order, GL_STATIC_DRAW)
+        else:
+            gl_fast.glBufferSubData(GL_ARRAY_BUFFER, 0, unit_cell_order.nbytes, unit_cell_order)
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self._unit_cell_order_key = unit_cell_order_key
+
+    def _read_samples_passed(self) -> None:
+        """Publish the result of the previous occlusion query, if it is available."""
+        if self._samples_passed_query_pending:
+            if glGetQueryObjectuiv(self._samples_passed_query, GL_QUERY_RESULT_AVAILABLE):
+                samples_passed = int(glGetQueryObjectuiv(self._samples_passed_query, GL_QUERY_RESULT))
+                self._world.set_variable("diamond_lattice_samples_passed", samples_passed)
+                self._samples_passed_query_pending = False
+
     def render(self, projection_matrix, view_matrix, model_matrix):
 
         world = self._world
 
-        glUseProgram(self._shader_program)
+        gl_state.use_program(self._shader_program)
 
-        glUniformMatrix4fv(self._projection_matrix_location, 1, GL_TRUE, projection_matrix.astype(np.float32))
-        glUniformMatrix4fv(self._transposed_inverse_view_matrix_location, 1, GL_TRUE, np.linalg.inv(view_matrix).T.astype(np.float32))
-        glUniformMatrix4fv(self._projection_view_model_matrix_location, 1, GL_TRUE, (projection_matrix @ view_matrix @ model_matrix).astype(np.float32))
-        glUniformMatrix4fv(self._view_model_matrix_location, 1, GL_TRUE, (view_matrix @ model_matrix).astype(np.float32))
+        gl_fast.glUniformMatrix4fv(self._projection_matrix_location, 1, GL_TRUE, projection_matrix.astype(np.float32))
+        gl_fast.glUniformMatrix4fv(self._transposed_inverse_view_matrix_location, 1, GL_TRUE, np.linalg.inv(view_matrix).T.astype(np.float32, order="C"))
+        gl_fast.glUniformMatrix4fv(self._projection_view_model_matrix_location, 1, GL_TRUE, (projection_matrix @ view_matrix @ model_matrix).astype(np.float32))
+        gl_fast.glUniformMatrix4fv(self._view_model_matrix_location, 1, GL_TRUE, (view_matrix @ model_matrix).astype(np.float32))
 
-        glUniformMatrix4fv(self._transposed_inverse_view_model_matrix_location, 1, GL_TRUE, np.linalg.inv(view_matrix @ model_matrix).T.astype(np.float32))
+        inverse_view_model_matrix = np.linalg.inv(view_matrix @ model_matrix)
 
-        diamond_lattice_side_length = world.get_variable("diamond_lattice_side_length")
-        unit_cells_per_dimension = 2 * ((diamond_lattice_side_length + 4) // 8) + 1
+        self._last_draw_matrices = (projection_matrix, view_matrix @ model_matrix)
 
-        glUniform1ui(self._unit_cells_per_dimension_location, unit_cells_per_dimension)
-        glUniform1f(self._diamond_lattice_side_length_location,  diamond_lattice_side_length)
+        gl_fast.glUniformMatrix4fv(self._transposed_inverse_view_model_matrix_location, 1, GL_TRUE, inverse_view_model_matrix.T.astype(np.float32, order="C"))
 
-        glUniform1ui(self._color_mode_location, self.color_mode)
-        glUniform1ui(self._cut_mode_location, self.cut_mode)
+        # Only upload the uniforms whose inputs changed since the previous draw.
 
-        glUniform1ui(self._impostor_mode_location, world.get_variable("impostor_mode"))
+        dirty_uniforms = self._dirty_uniforms
 
-        glEnable(GL_CULL_FACE)
-        glBindVertexArray(self._vao)
-        glDrawArraysInstanced(GL_TRIANGLES, 0, self._vertex_count, unit_cells_per_dimension ** 3)
+        if dirty_uniforms:
+
+            if "diamond_lattice_side_length" in dirty_uniforms:
+                diamond_lattice_side_length = drawn_diamond_lattice_side_length(
+                    world.get_variable("diamond_lattice_side_length"),
+                    world.get_variable("diamond_lattice_region_scale")
+                )
+                self._diamond_lattice_side_length = diamond_lattice_side_length
+                self._unit_cells_per_dimension = unit_cells_per_dimension(diamond_lattice_side_length)
+                gl_fast.glUniform1ui(self._unit_cells_per_dimension_location, self._unit_cells_per_dimension)
+                gl_fast.glUniform1f(self._diamond_lattice_side_length_location,  diamond_lattice_side_length)
+                gl_fast.glUniform1ui(self._atom_state_unit_cells_per_dimension_location, self.atom_states.unit_cells_per_dimension)
+
+            if "color_mode" in dirty_uniforms:
+                gl_fast.glUniform1ui(self._color_mode_location, self._color_mode)
+
+            if "cut_mode" in dirty_uniforms:
+                gl_fast.glUniform1ui(self._cut_mode_location, self._cut_mode)
+
+            if "impostor_mode" in dirty_uniforms:
+                gl_fast.glUniform1ui(self._impostor_mode_location, world.get_variable("impostor_mode"))
+
+            dirty_uniforms.clear()
+
+        # Issue the unit cells approximately front to back, so early depth testing can reject hidden fragments.
+        self._update_unit_cell_order(inverse_view_model_matrix)
+
+        # Upload the atom states that changed since the previous draw.
+        self.atom_states.bind(GL_TEXTURE1)
+
+        gl_state.enable(GL_CULL_FACE)
+        gl_state.bind_vertex_array(self._vao)
+        # At level of detail 1, only the atoms are drawn.
+        vertex_count = self._sphere_vertex_count if world.get_variable("diamond_lattice_lod") == 1 else self._vertex_count
+
+        # Do a requested pick before the draw, so the highlight of the picked atoms shows in this frame.
+
+        if self._pick_request is not None:
+
+            (x, y) = self._pick_request
+            self._pick_request = None
+
+            pick_mode = world.get_variable("diamond_lattice_pick_mode")
+
+            t1 = time.monotonic()
+            if pick_mode == "gpu":
+                pick_result = self._pick_gpu(x, y, projection_matrix, view_matrix @ model_matrix, vertex_count)
+                gl_state.use_program(self._shader_program)
+            else:
+                pick_result = self.pick(x, y)
+            t2 = time.monotonic()
+
+            self._show_pick(pick_result, pick_mode, t2 - t1)
+
+            # Upload the changed highlights.
+            self.atom_states.bind(GL_TEXTURE1)
+
+        self._read_samples_passed()
+
+        if not self._samples_passed_query_pending:
+            gl_fast.glBeginQuery(GL_SAMPLES_PASSED, self._samples_passed_query)
+
+        gl_fast.glDrawArraysInstanced(GL_TRIANGLES, 0, vertex_count, self._unit_cells_per_dimension ** 3)
+
+        if not self._samples_passed_query_pending:
+            gl_fast.glEndQuery(GL_SAMPLES_PASSED)
+            self._samples_passed_query_pending = True
@@ -0,0 +1,100 @@
+#version 410 core
+
+// The pick variant of the diamond lattice fragment shader: instead of a color, it writes the pick ID of the
+// nearest impostor. The hit test and the depth are those of diamond_lattice_f.glsl.
+
+#ifdef GL_ARB_conservative_depth
+#extension GL_ARB_conservative_depth : enable
+#endif
+
+// Input variables provided by the vertex shader.
+
+in VS_OUT {
+    vec3 mv_impostor_surface;
+    vec3 color;
+    flat mat4 modelview_to_object_space_matrix;
+    flat mat4 object_to_projection_space_matrix;
+    flat uint object_type; // 0 == sphere, 1 == cylinder.
+} fs_in;
+
+flat in uvec2 pick_id;
+
+// Fragment shader output variables.
+
+layout (location = 0) out uvec2 fragment_pick_id;
+
+#ifdef GL_ARB_conservative_depth
+layout (depth_greater) out float gl_FragDepth;
+#endif
+
+// Intersection function: ray/sphere and ray/cylinder.
+
+const float INVALID = -1.0;
+
+float intersect_unit_sphere(vec3 origin, vec3 direction)
+{
+    float oo = dot(origin, origin);
+    float uo = dot(direction, origin);
+    float uu = dot(direction, direction);
+    float discriminant = uo*uo - uu * (oo - 1);
+
+    if (discriminant < 0)
+    {
+        return INVALID;
+    }
+
+    return (-uo - sqrt(discriminant)) / uu;
+}
+
+float intersect_unit_cylinder(vec2 origin, vec2 direction)
+{
+    float oo = dot(origin, origin);
+    float uo = dot(direction, origin);
+    float uu = dot(direction, direction);
+    float discriminant = uo*uo - uu * (oo - 1);
+
+    if (discriminant < 0)
+    {
+        return INVALID;
+    }
+
+    return (-uo - sqrt(discriminant)) / uu;
+}
+
+void main()
+{
+    vec3 object_impostor_hit = (fs_in.modelview_to_object_space_matrix * vec4(fs_in.mv_impostor_surface, 1)).xyz;
+    vec3 object_eye = (fs_in.modelview_to_object_space_matrix * vec4(0, 0, 0, 1)).xyz;
+
+    vec3 object_eye_to_impostor_hit_vector = object_impostor_hit - object_eye; // eye-to-hitpoint vector.
+
+    float alpha = (fs_in.object_type == 0) ? intersect_unit_sphere(object_eye, object_eye_to_impostor_hit_vector) : intersect_unit_cylinder(object_eye.xy, object_eye_to_impostor_hit_vector.xy);
+
+    if (alpha < 0)
+    {
+        discard;
+    }
+
+    vec3 object_hit = object_eye + alpha * object_eye_to_impostor_hit_vector;
+
+    if (fs_in.object_type == 1 && abs(object_hit.z) > 0.5)
+    {
+        discard;
+    }
+
+    // The depth of the actual hitpoint decides which impostor is nearest.
+
+    vec4 projection = fs_in.object_to_projection_space_matrix * vec4(object_hit, 1);
+
+    float new_frag_depth =  0.5 + 0.5 *  (projection.z / projection.w);
+
+    if (!(new_frag_depth >= gl_FragCoord.z))
+    {
+        // Keep the promise of the gl_FragDepth declaration; see diamond_lattice_f.glsl.
+        discard;
+    }
+
+    gl_FragDepth = new_frag_depth;
+
+    fragment_pick_id = pick_id;
+}
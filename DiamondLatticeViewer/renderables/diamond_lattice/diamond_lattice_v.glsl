@@ -7,6 +7,11 @@ layout (location = 2) in vec3 a_lattice_delta;
 layout (location = 3) in vec4 a_inverse_placement_matrix_row1;
 layout (location = 4) in vec4 a_inverse_placement_matrix_row2;
 layout (location = 5) in vec4 a_inverse_placement_matrix_row3;
+layout (location = 6) in int a_atom_index;
+layout (location = 7) in ivec4 a_bonded_atom; // Cylinders: unit cell offset and atom index of the second atom.
+
+// Per-instance attribute: the index of the unit cell. Instances are issued in approximate front-to-back order.
+layout (location = 8) in int a_unit_cell_index;
 
 uniform mat4 projection_view_model_matrix;
 uniform mat4 view_model_matrix;
@@ -18,6 +23,17 @@ uniform uint unit_cells_per_dimension;
 uniform float diamond_lattice_side_length;
 uniform uint color_mode;
 
+// The per-atom states of the entire lattice, 8 atoms per unit cell; see atom_state.py.
+uniform usamplerBuffer atom_states;
+uniform uint atom_state_unit_cells_per_dimension;
+uniform vec3 atom_state_colors[8];
+
+const uint ATOM_STATE_HIDDEN = 0x01u;
+const uint ATOM_STATE_HIGHLIGHTED = 0x02u;
+const uint ATOM_STATE_COLOR_SHIFT = 2u;
+
+const vec3 highlight_color = vec3(1.0, 0.8, 0.0);
+
 out VS_OUT {
     vec3 mv_impostor_surface;
     vec3 color;
@@ -26,6 +42,10 @@ out VS_OUT {
     flat uint object_type; // 0 == sphere, 1 == cylinder.
 } vs_out;
 
+// The pick ID: the unit cell index plus one (zero is the background), and the primitive code; see picking.py.
+// Only the pick variant of the fragment shader reads it.
+flat out uvec2 pick_id;
+
 const float UNIT_CELL_SIZE = 4.0;
 
 const vec3 cut100_normal = normalize(vec3(1, 0, 0));
@@ -59,9 +79,23 @@ float crystal_lattice_surface_cut_distance(vec3 pos)
     return negative_infinity; // Inside of crystal.
 }
 
+uint fetch_atom_state(ivec3 unit_cell, int atom_index)
+{
+    // Atoms outside of the state store (beyond the lattice) have the default state.
+
+    int n = int(atom_state_unit_cells_per_dimension);
+
+    if (any(lessThan(unit_cell, ivec3(0))) || any(greaterThanEqual(unit_cell, ivec3(n))))
+    {
+        return 0u;
+    }
+
+    return texelFetch(atom_states, ((unit_cell.z * n + unit_cell.y) * n + unit_cell.x) * 8 + atom_index).r;
+}
+
 void main()
 {
-    uint iz = gl_InstanceID;
+    uint iz = uint(a_unit_cell_index);
     uint ix = iz % unit_cells_per_dimension; iz /= unit_cells_per_dimension;
     uint iy = iz % unit_cells_per_dimension; iz /= unit_cells_per_dimension;
 
@@ -78,8 +112,22 @@ void main()
 
     float carbon_cut_distance = crystal_lattice_surface_cut_distance(lattice_position);
 
+    // The drawn unit cells are centered in the (possibly larger) lattice of the atom states.
+
+    ivec3 atom_state_unit_cell = ivec3(unit_cell_index_vector) + (int(atom_state_unit_cells_per_dimension) - int(unit_cells_per_dimension)) / 2;
+
+    bool is_sphere = (a_lattice_delta.x == 0);
+
+    uint atom_state = fetch_atom_state(atom_state_unit_cell, a_atom_index);
+    uint bonded_atom_state = is_sphere ? 0u : fetch_atom_state(atom_state_unit_cell + a_bonded_atom.xyz, a_bonded_atom.w);
+
     bool render_flag = true;
-    if (carbon_cut_distance > cut_surface_threshold)
+    if (((atom_state | bonded_atom_state) & ATOM_STATE_HIDDEN) != 0u)
+    {
+        // A hidden atom, or a bond to one.
+        render_flag = false;
+    }
+    else if (carbon_cut_distance > cut_surface_threshold)
     {
         render_flag = false;
     }
@@ -105,6 +153,11 @@ void main()
 
         vs_out.object_type = (a_lattice_delta.x == 0) ? 0 : 1;
 
+        uint primitive_code = is_sphere ? uint(a_atom_index) :
+            8u + 8u * uint(a_atom_index) + (a_lattice_delta.x > 0 ? 1u : 0u) + (a_lattice_delta.y > 0 ? 2u : 0u) + (a_lattice_delta.z > 0 ? 4u : 0u);
+
+        pick_id = uvec2(uint(a_unit_cell_index) + 1u, primitive_code);
+
         mat4 inverse_displacement_matrix = mat4(
             1, 0, 0, 0,
             0, 1, 0, 0,
@@ -183,5 +236,23 @@ void main()
                 break;
             }
         }
+
+        // Apply the atom states: a color index replaces the color of an atom, and highlighted atoms (or bonds
+        // between two highlighted atoms) are tinted.
+
+        uint color_index = atom_state >> ATOM_STATE_COLOR_SHIFT;
+
+        if (is_sphere && color_index != 0u)
+        {
+            vs_out.color = atom_state_colors[color_index];
+        }
+
+        bool highlighted = is_sphere ? (atom_state & ATOM_STATE_HIGHLIGHTED) != 0u
+                                     : (atom_state & bonded_atom_state & ATOM_STATE_HIGHLIGHTED) != 0u;
+
+        if (highlighted)
+        {
+            vs_out.color = mix(vs_out.color, highlight_color, 0.6);
+        }
     }
 }
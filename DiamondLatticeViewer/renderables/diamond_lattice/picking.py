@@ -0,0 +1,521 @@
+"""This module implements picking of the atoms and bonds of the diamond lattice.
+
+A pick finds the nearest atom (sphere) or bond (cylinder) that is visible along a ray through a pixel. Two methods
+are provided:
+
+    cpu  -- the DiamondLatticePicker casts the ray through a uniform grid over the unit cells, and intersects it with
+            the spheres and cylinders of the cells that it traverses, in front-to-back order;
+    gpu  -- the lattice is drawn into a 1x1 integer ID buffer that covers the pixel, and the ID is read back;
+            see RenderableDiamondLattice.
+
+Both methods identify the picked impostor by its unit cell and its primitive code (see primitive_code()), so both
+results are decoded in the same way.
+
+The CPU ray cast uses the impostor intersection math of the fragment shader: the ray is transformed into the object
+space of each impostor by its inverse placement matrix, where it is intersected with the unit sphere or the unit
+cylinder. The impostors are taken from the vertex data of the lattice, so the picked geometry is the drawn geometry.
+The per-impostor visibility of the vertex shader (the cut modes and the hidden atom states) is applied as well.
+
+Since the lattice is periodic, the grid cells are the unit cells, and the list of impostors that overlap a grid cell
+(a few of them reach into the neighboring cells) is the same for every cell. The cells along the ray are visited
+with a 3D DDA, after clipping the ray to the visible part of the crystal, and are intersected in vectorized batches
+of growing size. A pick that hits near the front of the crystal therefore costs a few batches of small NumPy
+operations, regardless of the lattice size.
+"""
+
+import itertools
+import math
+
+import numpy as np
+
+from .atom_state import ATOM_STATE_HIDDEN
+
+UNIT_CELL_SIZE = 4.0
+
+# Primitive codes: 0..7 are the atoms (by atom index); a bond is 8 + 8 * (atom index) + (direction code),
+# where the direction code has a bit for each positive component of the lattice delta to the second atom.
+
+PRIMITIVE_CODE_FIRST_BOND = 8
+
+# The cut plane normals of the cut modes 1, 2, and 3; see the vertex shader.
+
+CUT_NORMALS = {
+    1: np.array((1.0, 0.0, 0.0)),
+    2: np.array((1.0, 1.0, 0.0)) / np.sqrt(2.0),
+    3: np.array((1.0, 1.0, 1.0)) / np.sqrt(3.0)
+}
+
+CUT_SURFACE_THRESHOLD = 1e-3
+
+# The impostors of visible atoms and bonds extend less than this beyond the crystal bounding box and the cut plane.
+
+VISIBLE_MARGIN = 0.5
+
+# The number of grid cells that is intersected in the first batch; each next batch is twice as large.
+
+FIRST_BATCH_SIZE = 4
+
+pick_primitive_dtype = np.dtype([
+    ("code", np.int32),
+    ("atom_index", np.int32),
+    ("bonded_atom", np.int32, 4),  # For bonds: unit cell offset (x, y, z) and index of the second atom.
+    ("lattice_position", np.float64, 3),
+    ("lattice_delta", np.float64, 3),
+    ("inverse_placement_matrix", np.float64, (3, 4)),
+    ("bounds_min", np.float64, 3),
+    ("bounds_max", np.float64, 3)
+])
+
+
+def primitive_code(atom_index: int, lattice_delta) -> int:
+    """Return the primitive code of the atom (for a zero lattice delta) or the bond of the unit cell."""
+    if not np.any(lattice_delta):
+        return atom_index
+    direction_code = sum(1 << axis for axis in range(3) if lattice_delta[axis] > 0)
+    return PRIMITIVE_CODE_FIRST_BOND + 8 * atom_index + direction_code
+
+
+def crystal_lattice_surface_cut_distance(positions: np.ndarray, diamond_lattice_side_length: float,
+                                         cut_mode: int) -> np.ndarray:
+    """Return the signed distance of the positions to the crystal surface; positive is outside the crystal."""
+
+    if cut_mode in CUT_NORMALS:
+        distance = positions @ CUT_NORMALS[cut_mode]
+    else:
+        distance = np.full(len(positions), -np.inf)
+
+    candidate = np.max(np.abs(positions), axis=1) <= 0.5 * diamond_lattice_side_length
+
+    return np.where(candidate, distance, np.inf)
+
+
+class PickResult:
+    """A picked atom or bond.
+
+    The unit cells are (x, y, z) coordinates relative to the center unit cell, as used by
+    RenderableDiamondLattice.atom_ids().
+    """
+
+    def __init__(self, unit_cell, atom_index: int, bonded_unit_cell=None, bonded_atom_index: int = None,
+                 distance: float = None):
+        self.unit_cell = tuple(int(c) for c in unit_cell)
+        self.atom_index = int(atom_index)
+        self.bonded_unit_cell = tuple(int(c) for c in bonded_unit_cell) if bonded_unit_cell is not None else None
+        self.bonded_atom_index = int(bonded_atom_index) if bonded_atom_index is not None else None
+        self.distance = distance  # Along the pick ray, in units of the ray direction; None for a GPU pick.
+
+    @property
+    def is_bond(self) -> bool:
+        return self.bonded_unit_cell is not None
+
+    def atoms(self) -> list[tuple[tuple[int, int, int], int]]:
+        """Return the (unit cell, atom index) pairs of the picked atom, or of the two atoms of the picked bond."""
+        atoms = [(self.unit_cell, self.atom_index)]
+        if self.is_bond:
+            atoms.append((self.bonded_unit_cell, self.bonded_atom_index))
+        return atoms
+
+    def describe(self) -> str:
+        if self.is_bond:
+            return "bond {}:{} - {}:{}".format(
+                self.unit_cell, self.atom_index, self.bonded_unit_cell, self.bonded_atom_index)
+        return "atom {}:{}".format(self.unit_cell, self.atom_index)
+
+
+def visible_ray_interval(origin: np.ndarray, direction: np.ndarray, diamond_lattice_side_length: float,
+                         cut_mode: int) -> tuple[float, float]:
+    """Return the interval of ray parameters t >= 0 where the ray is near the visible part of the crystal.
+
+    Outside of it, the ray is farther than VISIBLE_MARGIN from the crystal bounding box, or from the cut plane.
+    The interval is empty (first >= second) if the ray misses it.
+    """
+
+    (t_enter, t_exit) = (0.0, np.inf)
+
+    half_side_length = 0.5 * diamond_lattice_side_length + VISIBLE_MARGIN
+
+    for axis in range(3):
+        if direction[axis] == 0.0:
+            if abs(origin[axis]) > half_side_length:
+                return (0.0, 0.0)
+            continue
+        t1 = (-half_side_length - origin[axis]) / direction[axis]
+        t2 = (+half_side_length - origin[axis]) / direction[axis]
+        t_enter = max(t_enter, min(t1, t2))
+        t_exit = min(t_exit, max(t1, t2))
+
+    if cut_mode in CUT_NORMALS:
+
+        # The visible part is behind the cut plane.
+
+        cut_normal = CUT_NORMALS[cut_mode]
+
+        origin_distance = origin @ cut_normal - (CUT_SURFACE_THRESHOLD + VISIBLE_MARGIN)
+        direction_distance = direction @ cut_normal
+
+        if direction_distance > 0.0:
+            t_exit = min(t_exit, -origin_distance / direction_distance)
+        elif direction_distance < 0.0:
+            t_enter = max(t_enter, -origin_distance / direction_distance)
+        elif origin_distance > 0.0:
+            return (0.0, 0.0)
+
+    return (t_enter, t_exit)
+
+
+def traverse_grid(origin: np.ndarray, direction: np.ndarray, unit_cells_per_dimension: int,
+                  t_enter: float = 0.0, t_exit: float = math.inf):
+    """Yield the unit cells that the ray traverses in front-to-back order, with the ray parameter where it leaves each.
+
+    Only the part of the ray between t_enter and t_exit is traversed. Unit cells are (x, y, z) index tuples in the
+    drawn lattice. This is the 3D DDA of Amanatides and Woo; the cells are generated lazily, since a pick usually
+    ends after a few of them. The computations are done on Python floats, which is faster than on NumPy scalars.
+    """
+
+    n = unit_cells_per_dimension
+
+    # In grid coordinates, unit cell (ix, iy, iz) spans [ix, ix + 1] x [iy, iy + 1] x [iz, iz + 1].
+
+    grid_origin = (origin / UNIT_CELL_SIZE + 0.5 * n).tolist()
+    grid_direction = (direction / UNIT_CELL_SIZE).tolist()
+
+    # Clip the ray to the grid.
+
+    for axis in range(3):
+        if grid_direction[axis] == 0.0:
+            if not 0.0 <= grid_origin[axis] <= n:
+                return
+            continue
+        t1 = (0.0 - grid_origin[axis]) / grid_direction[axis]
+        t2 = (n - grid_origin[axis]) / grid_direction[axis]
+        t_enter = max(t_enter, min(t1, t2))
+        t_exit = min(t_exit, max(t1, t2))
+
+    if not t_enter < t_exit:
+        return
+
+    # The unit cell where the ray starts, and per axis: the step to the next cell, the ray parameter where
+    # the ray crosses the next grid plane, and the ray parameter increment between grid planes.
+
+    cell = [0, 0, 0]
+    step = [0, 0, 0]
+    t_next = [math.inf, math.inf, math.inf]
+    t_delta = [math.inf, math.inf, math.inf]
+
+    for axis in range(3):
+
+        grid_enter = grid_origin[axis] + t_enter * grid_direction[axis]
+
+        if grid_direction[axis] >= 0.0:
+            cell[axis] = min(max(math.floor(grid_enter), 0), n - 1)
+        else:
+            cell[axis] = min(max(math.ceil(grid_enter) - 1, 0), n - 1)
+
+        if grid_direction[axis] > 0.0:
+            step[axis] = +1
+            t_next[axis] = (cell[axis] + 1 - grid_origin[axis]) / grid_direction[axis]
+            t_delta[axis] = 1.0 / grid_direction[axis]
+        elif grid_direction[axis] < 0.0:
+            step[axis] = -1
+            t_next[axis] = (cell[axis] - grid_origin[axis]) / grid_direction[axis]
+            t_delta[axis] = -1.0 / grid_direction[axis]
+
+    while True:
+
+        axis = 0 if t_next[0] <= t_next[1] and t_next[0] <= t_next[2] else (1 if t_next[1] <= t_next[2] else 2)
+
+        t_leave = min(t_next[axis], t_exit)
+
+        yield ((cell[0], cell[1], cell[2]), t_leave)
+
+        if t_leave >= t_exit:
+            return
+
+        cell[axis] += step[axis]
+
+        if not 0 <= cell[axis] < n:
+            return
+
+        t_next[axis] += t_delta[axis]
+
+
+class DiamondLatticePicker:
+    """Cast pick rays through the diamond lattice, on the CPU."""
+
+    def __init__(self, vbo_data: np.ndarray):
+        """Make the pick data from the vertex data of a diamond lattice unit cell."""
+
+        # Each impostor is a run of vertices with the same atom index and lattice delta; take the first vertex of each.
+
+        keys = np.column_stack((vbo_data["a_atom_index"], vbo_data["a_lattice_delta"]))
+        first_vertices = np.flatnonzero(np.any(np.diff(keys, axis=0, prepend=np.nan) != 0, axis=1))
+
+        primitives = np.zeros(len(first_vertices), dtype=pick_primitive_dtype)
+
+        for (primitive, vertex) in zip(primitives, vbo_data[first_vertices]):
+
+            inverse_placement_matrix = np.vstack((
+                vertex["inverse_placement_matrix_row1"],
+                vertex["inverse_placement_matrix_row2"],
+                vertex["inverse_placement_matrix_row3"],
+                (0.0, 0.0, 0.0, 1.0)
+            )).astype(np.float64)
+
+            primitive["code"] = primitive_code(vertex["a_atom_index"], vertex["a_lattice_delta"])
+            primitive["atom_index"] = vertex["a_atom_index"]
+            primitive["bonded_atom"] = vertex["a_bonded_atom"]
+            primitive["lattice_position"] = vertex["a_lattice_position"]
+            primitive["lattice_delta"] = vertex["a_lattice_delta"]
+            primitive["inverse_placement_matrix"] = inverse_placement_matrix[:3]
+
+            # The bounding box of the unit sphere, or of the unit cylinder of height 1, placed in the unit cell.
+
+            is_sphere = primitive["code"] < PRIMITIVE_CODE_FIRST_BOND
+            corners = np.array(list(itertools.product((-1.0, 1.0), (-1.0, 1.0), (-1.0, 1.0) if is_sphere else (-0.5, 0.5))))
+            placed_corners = (np.linalg.inv(inverse_placement_matrix) @ np.column_stack((corners, np.ones(8))).T).T[:, :3]
+
+            primitive["bounds_min"] = placed_corners.min(axis=0)
+            primitive["bounds_max"] = placed_corners.max(axis=0)
+
+        self._primitives = primitives
+        self._primitive_index_by_code = {int(code): index for (index, code) in enumerate(primitives["code"])}
+
+        # The grid cell contents: the impostors of a unit cell, or of a neighboring unit cell at the given offset,
+        # whose bounding boxes overlap the unit cell.
+
+        bucket_offsets = []
+        bucket_primitives = []
+
+        half_size = 0.5 * UNIT_CELL_SIZE
+
+        for offset in itertools.product((-1, 0, 1), repeat=3):
+            displacement = UNIT_CELL_SIZE * np.array(offset)
+            overlap = np.all((primitives["bounds_min"] + displacement < half_size) &
+                             (primitives["bounds_max"] + displacement > -half_size), axis=1)
+            for primitive_index in np.flatnonzero(overlap):
+                bucket_offsets.append(offset)
+                bucket_primitives.append(primitive_index)
+
+        self._bucket_offsets = np.array(bucket_offsets, dtype=np.int64)
+        self._bucket_primitives = np.array(bucket_primitives, dtype=np.int64)
+
+        # The impostor data of the grid cell contents, relative to the grid cell, so a batch of grid cells can be
+        # intersected by broadcasting.
+
+        bucket = primitives[self._bucket_primitives]
+        bucket_displacement = UNIT_CELL_SIZE * self._bucket_offsets
+
+        self._bucket_is_sphere = bucket["code"] < PRIMITIVE_CODE_FIRST_BOND
+        self._bucket_atom_index = bucket["atom_index"]
+        self._bucket_bonded_atom = bucket["bonded_atom"]
+        self._bucket_lattice_position = bucket_displacement + bucket["lattice_position"]
+        self._bucket_lattice_delta = bucket["lattice_delta"]
+
+        # The affine transformation from grid cell coordinates to object coordinates.
+
+        self._bucket_linear = bucket["inverse_placement_matrix"][:, :, :3]
+        self._bucket_translation = bucket["inverse_placement_matrix"][:, :, 3] - np.einsum(
+            "bij,bj->bi", self._bucket_linear, bucket_displacement)
+
+        # The unit cylinder extends along the z axis, so only the x and y components count for its intersection.
+
+        self._bucket_radial_mask = np.where(self._bucket_is_sphere[:, np.newaxis], 1.0, (1.0, 1.0, 0.0))
+
+    def decode(self, unit_cell_index: int, code: int, unit_cells_per_dimension: int) -> PickResult:
+        """Return the pick result of the impostor with the given (drawn) unit cell index and primitive code."""
+
+        n = unit_cells_per_dimension
+
+        unit_cell = (unit_cell_index % n, unit_cell_index // n % n, unit_cell_index // n // n)
+
+        return self._make_result(np.array(unit_cell), self._primitives[self._primitive_index_by_code[code]], n)
+
+    @staticmethod
+    def _make_result(unit_cell: np.ndarray, primitive, unit_cells_per_dimension: int,
+                     distance: float = None) -> PickResult:
+
+        # Make the unit cell relative to the center unit cell.
+
+        unit_cell = unit_cell - (unit_cells_per_dimension - 1) // 2
+
+        if primitive["code"] < PRIMITIVE_CODE_FIRST_BOND:
+            return PickResult(unit_cell, primitive["atom_index"], distance=distance)
+
+        bonded_atom = primitive["bonded_atom"]
+
+        return PickResult(unit_cell, primitive["atom_index"], unit_cell + bonded_atom[:3], bonded_atom[3], distance)
+
+    def cast_ray(self, origin, direction, unit_cells_per_dimension: int, diamond_lattice_side_length: float,
+                 cut_mode: int, atom_states: np.ndarray = None, atom_state_unit_cells_per_dimension: int = 0):
+        """Return the nearest visible atom or bond along the ray origin + t * direction (t >= 0), or None.
+
+        The ray is given in the coordinate system of the lattice. The other arguments are those of the drawn lattice;
+        the atom states, if given, are those of an AtomStateBuffer.
+        """
+
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+
+        (t_enter, t_exit) = visible_ray_interval(origin, direction, diamond_lattice_side_length, cut_mode)
+
+        if not t_enter < t_exit:
+            return None
+
+        if atom_states is not None and not atom_states.any():
+            atom_states = None
+
+        ray = _PickRay(self, origin, direction, unit_cells_per_dimension, diamond_lattice_side_length, cut_mode,
+                       atom_states, atom_state_unit_cells_per_dimension)
+
+        # Intersect the cells along the ray in batches. Once the nearest hit so far lies before the end of a batch,
+        # the cells behind it cannot contain a nearer one.
+
+        traversal = traverse_grid(origin, direction, unit_cells_per_dimension, t_enter, t_exit)
+
+        best = None
+
+        batch_size = FIRST_BATCH_SIZE
+
+        while True:
+
+            batch = list(itertools.islice(traversal, batch_size))
+
+            if len(batch) == 0:
+                break
+
+            (unit_cells, exit_t) = zip(*batch)
+
+            hit = ray.intersect_unit_cells(np.array(unit_cells))
+
+            if hit is not None and (best is None or hit[0] < best[0]):
+                best = hit
+
+            if best is not None and best[0] <= exit_t[-1]:
+                break
+
+            batch_size *= 2
+
+        if best is None:
+            return None
+
+        (t, unit_cell, bucket_index) = best
+
+        return self._make_result(unit_cell, self._primitives[self._bucket_primitives[bucket_index]],
+                                 unit_cells_per_dimension, t)
+
+
+class _PickRay:
+    """A pick ray of a DiamondLatticePicker, with the values that are the same for all grid cells."""
+
+    def __init__(self, picker: DiamondLatticePicker, origin: np.ndarray, direction: np.ndarray,
+                 unit_cells_per_dimension: int, diamond_lattice_side_length: float, cut_mode: int,
+                 atom_states, atom_state_unit_cells_per_dimension: int):
+
+        self._picker = picker
+        self._unit_cells_per_dimension = unit_cells_per_dimension
+        self._diamond_lattice_side_length = diamond_lattice_side_length
+        self._cut_mode = cut_mode
+        self._atom_states = atom_states
+        self._atom_state_unit_cells_per_dimension = atom_state_unit_cells_per_dimension
+
+        # The ray origin in the object space of each impostor, as seen from grid cell (0, 0, 0). For grid cell g,
+        # the origin is displaced by -UNIT_CELL_SIZE * g, so its object space origin is displaced by the linear
+        # part of the transformation, applied to that.
+
+        origin_in_first_cell = origin + 0.5 * UNIT_CELL_SIZE * (unit_cells_per_dimension - 1)
+
+        self._first_cell_object_origin = np.einsum("bij,j->bi", picker._bucket_linear, origin_in_first_cell) + picker._bucket_translation
+        self._cell_step_matrix = UNIT_CELL_SIZE * picker._bucket_linear.reshape(-1, 3).T
+
+        # The ray direction in the object space of each impostor.
+
+        self._object_direction = np.einsum("bij,j->bi", picker._bucket_linear, direction)
+        self._radial_direction = self._object_direction * picker._bucket_radial_mask
+        self._uu = np.einsum("bi,bi->b", self._radial_direction, self._radial_direction)
+
+    def intersect_unit_cells(self, unit_cells: np.ndarray):
+        """Return the nearest hit (t, unit cell, bucket index) of the ray in the given grid cells, or None."""
+
+        picker = self._picker
+
+        n = self._unit_cells_per_dimension
+
+        # Transform the ray into the object space of each impostor, and intersect it with the unit sphere or the
+        # unit cylinder, like the fragment shader. Arrays are indexed by (grid cell, bucket index).
+
+        object_origin = self._first_cell_object_origin - (unit_cells @ self._cell_step_matrix).reshape(len(unit_cells), -1, 3)
+
+        radial_origin = object_origin * picker._bucket_radial_mask
+
+        oo = np.einsum("kbi,kbi->kb", radial_origin, radial_origin)
+        uo = np.einsum("kbi,bi->kb", radial_origin, self._radial_direction)
+        uu = self._uu
+
+        discriminant = uo * uo - uu * (oo - 1.0)
+
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = (-uo - np.sqrt(discriminant)) / uu
+
+        # A miss (a negative discriminant) gives NaN, which fails the comparison.
+
+        (cell_indices, bucket_indices) = np.nonzero(t >= 0.0)
+
+        if len(cell_indices) == 0:
+            return None
+
+        hit_t = t[cell_indices, bucket_indices]
+
+        # The unit cylinder has height 1.
+
+        hit_z = object_origin[cell_indices, bucket_indices, 2] + hit_t * self._object_direction[bucket_indices, 2]
+
+        visible = picker._bucket_is_sphere[bucket_indices] | (np.abs(hit_z) <= 0.5)
+
+        # Apply the visibility rules of the vertex shader to the hits: the impostor must be in the drawn lattice,
+        # not cut away, and not hidden by the atom states.
+
+        owners = unit_cells[cell_indices] + picker._bucket_offsets[bucket_indices]
+
+        visible &= np.all((owners >= 0) & (owners < n), axis=1)
+
+        lattice_position = UNIT_CELL_SIZE * (unit_cells[cell_indices] - 0.5 * (n - 1)) + picker._bucket_lattice_position[bucket_indices]
+        lattice_delta = picker._bucket_lattice_delta[bucket_indices]
+
+        side_length = self._diamond_lattice_side_length
+
+        visible &= crystal_lattice_surface_cut_distance(lattice_position, side_length, self._cut_mode) <= CUT_SURFACE_THRESHOLD
+        visible &= crystal_lattice_surface_cut_distance(lattice_position + lattice_delta, side_length, self._cut_mode) <= CUT_SURFACE_THRESHOLD
+
+        if self._atom_states is not None:
+
+            state_n = self._atom_state_unit_cells_per_dimension
+            state_unit_cells = owners + (state_n - n) // 2
+
+            bonded_atom = picker._bucket_bonded_atom[bucket_indices]
+
+            atom_state = self._fetch_atom_states(state_unit_cells, picker._bucket_atom_index[bucket_indices])
+            bonded_atom_state = self._fetch_atom_states(state_unit_cells + bonded_atom[:, :3], bonded_atom[:, 3])
+            bonded_atom_state[picker._bucket_is_sphere[bucket_indices]] = 0
+
+            visible &= ((atom_state | bonded_atom_state) & ATOM_STATE_HIDDEN) == 0
+
+        if not visible.any():
+            return None
+
+        nearest = np.flatnonzero(visible)[np.argmin(hit_t[visible])]
+
+        return (hit_t[nearest], owners[nearest], bucket_indices[nearest])
+
+    def _fetch_atom_states(self, unit_cells: np.ndarray, atom_indices: np.ndarray) -> np.ndarray:
+        """Return the states of the given atoms; atoms outside of the state store have the default state."""
+
+        n = self._atom_state_unit_cells_per_dimension
+
+        inside = np.all((unit_cells >= 0) & (unit_cells < n), axis=1)
+
+        (ix, iy, iz) = unit_cells[inside].T
+
+        states = np.zeros(len(unit_cells), dtype=np.uint8)
+        states[inside] = self._atom_states[((iz * n + iy) * n + ix) * 8 + atom_indices[inside]]
+
+        return states
@@ -0,0 +1,203 @@
+"""This module implements the RenderableDynamicResolution class."""
+
+import os
+
+from utilities.opengl_symbols import *
+from utilities.opengl_state import gl_state
+from utilities.opengl_fast_path import gl_fast
+from utilities.opengl_utilities import create_opengl_program
+
+from renderables.renderable import Renderable
+
+
+def scaled_framebuffer_size(framebuffer_size: tuple[int, int], render_scale: float) -> tuple[int, int]:
+    """Return the size of the offscreen framebuffer for the given framebuffer size and render scale."""
+    (framebuffer_width, framebuffer_height) = framebuffer_size
+    return (max(1, round(framebuffer_width * render_scale)), max(1, round(framebuffer_height * render_scale)))
+
+
+class RenderableDynamicResolution(Renderable):
+    """Render a model at a fraction of the framebuffer resolution, and upscale the result to the framebuffer.
+
+    The fraction is given by the 'render_scale' World variable, and can be changed at any time.
+    Since the number of fragments is proportional to the square of the render scale, this reduces the cost of
+    fragment-bound models (such as the impostors) roughly quadratically.
+
+    The model is rendered into an offscreen framebuffer object (FBO) with a color texture and a depth buffer.
+    A full-screen pass then draws that texture into the current framebuffer, with bilinear filtering.
+    Renderables outside this one (e.g. the overlay) are rendered at the native resolution.
+
+    At a render scale of 1, the model is rendered directly into the current framebuffer.
+    The framebuffer that the host renders into is given by the 'default_framebuffer' World variable: 0 for a GLFW
+    window, or the framebuffer object of a Qt widget.
+    Note that multi-sampling does not apply to the offscreen framebuffer.
+
+    When compiled, the model is added to the compiled scene between two draw packets that begin and end
+    the offscreen pass, so the nodes of the model are evaluated together with the rest of the scene.
+    """
+
+    def __init__(self, world, model: Renderable):
+
+        self._world = world
+        self._model = model
+
+        # Compile the shader program.
+
+        shader_source_path = os.path.join(os.path.dirname(__file__), "dynamic_resolution")
+        (self._shaders, self._shader_program) = create_opengl_program(shader_source_path)
+
+        # The full-screen triangle is generated from the vertex index, but core profile OpenGL needs a bound VAO.
+
+        self._vao = glGenVertexArrays(1)
+
+        # Make the offscreen framebuffer. Its attachments are allocated in render(), once the size is known.
+
+        self._framebuffer = glGenFramebuffers(1)
+        self._color_texture = glGenTextures(1)
+        self._depth_renderbuffer = glGenRenderbuffers(1)
+
+        glBindTexture(GL_TEXTURE_2D, self._color_texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        self._offscreen_size = None
+        self._offscreen_pass_active = False
+
+        self._begin_pass = _OffscreenPassBoundary(self._begin_offscreen_pass)
+        self._end_pass = _OffscreenPassBoundary(self._end_offscreen_pass)
+
+    def close(self):
+
+        self._model.close()
+
+        if self._framebuffer is not None:
+            glDeleteFramebuffers(1, (self._framebuffer, ))
+            self._framebuffer = None
+
+        if self._depth_renderbuffer is not None:
+            glDeleteRenderbuffers(1, (self._depth_renderbuffer, ))
+            self._depth_renderbuffer = None
+
+        if self._color_texture is not None:
+            glDeleteTextures(1, (self._color_texture, ))
+            self._color_texture = None
+
+        if self._vao is not None:
+            glDeleteVertexArrays(1, (self._vao, ))
+            self._vao = None
+
+        if self._shader_program is not None:
+            glDeleteProgram(self._shader_program)
+            self._shader_program = None
+
+        if self._shaders is not None:
+            for shader in self._shaders:
+                glDeleteShader(shader)
+            self._shaders = None
+
+    def _allocate_offscreen_framebuffer(self, offscreen_size: tuple[int, int]) -> None:
+        """(Re-)allocate the attachments of the offscreen framebuffer."""
+
+        (offscreen_width, offscreen_height) = offscreen_size
+
+        print("Allocating offscreen framebuffer:", offscreen_width, offscreen_height)
+
+        # Bind the texture through the state cache, to keep the cache in sync.
+
+        gl_state.active_texture(GL_TEXTURE0)
+        gl_state.bind_texture(GL_TEXTURE_2D, self._color_texture)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, offscreen_width, offscreen_height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+
+        glBindRenderbuffer(GL_RENDERBUFFER, self._depth_renderbuffer)
+        glRenderbufferStorage(GL_RENDERBUFFER, GL_DEPTH_COMPONENT24, offscreen_width, offscreen_height)
+        glBindRenderbuffer(GL_RENDERBUFFER, 0)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self._framebuffer)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self._color_texture, 0)
+        glFramebufferRenderbuffer(GL_FRAMEBUFFER, GL_DEPTH_ATTACHMENT, GL_RENDERBUFFER, self._depth_renderbuffer)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, self._world.get_variable("default_framebuffer"))
+
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("Offscreen framebuffer is incomplete (status 0x{:04x}).".format(status))
+
+        self._offscreen_size = offscreen_size
+
+    def _begin_offscreen_pass(self) -> None:
+        """Direct rendering to the offscreen framebuffer, unless the render scale is 1."""
+
+        world = self._world
+
+        render_scale = world.get_variable("render_scale")
+
+        self._offscreen_pass_active = render_scale < 1.0
+
+        if not self._offscreen_pass_active:
+            # Render at the native resolution.
+            return
+
+        framebuffer_size = world.get_variable("framebuffer_size")
+
+        offscreen_size = scaled_framebuffer_size(framebuffer_size, render_scale)
+        if offscreen_size != self._offscreen_size:
+            self._allocate_offscreen_framebuffer(offscreen_size)
+
+        # Render the model into the offscreen framebuffer.
+        # The projection matrix only depends on the aspect ratio, which is (nearly) unchanged.
+
+        gl_fast.glBindFramebuffer(GL_FRAMEBUFFER, self._framebuffer)
+        gl_fast.glViewport(0, 0, *offscreen_size)
+
+        glClear(GL_COLOR_BUFFER_BIT | GL_DEPTH_BUFFER_BIT)
+
+    def _end_offscreen_pass(self) -> None:
+        """Upscale the offscreen color texture to the framebuffer, if the offscreen pass is active."""
+
+        if not self._offscreen_pass_active:
+            return
+
+        gl_fast.glBindFramebuffer(GL_FRAMEBUFFER, self._world.get_variable("default_framebuffer"))
+        gl_fast.glViewport(0, 0, *self._world.get_variable("framebuffer_size"))
+
+        gl_state.use_program(self._shader_program)
+
+        gl_state.active_texture(GL_TEXTURE0)
+        gl_state.bind_texture(GL_TEXTURE_2D, self._color_texture)
+        gl_state.bind_vertex_array(self._vao)
+
+        gl_state.enable(GL_CULL_FACE)
+
+        # The upscaled image covers the entire framebuffer, regardless of what was drawn before.
+        gl_state.disable(GL_DEPTH_TEST)
+
+        gl_fast.glDrawArrays(GL_TRIANGLES, 0, 3)
+
+        gl_state.enable(GL_DEPTH_TEST)
+
+        self._offscreen_pass_active = False
+
+    def render(self, projection_matrix, view_matrix, model_matrix):
+        self._begin_offscreen_pass()
+        self._model.render(projection_matrix, view_matrix, model_matrix)
+        self._end_offscreen_pass()
+
+    def compile(self, compiled_scene, parent_node, prefix_matrix) -> None:
+        compiled_scene.add_draw_packet(self._begin_pass, parent_node, prefix_matrix)
+        self._model.compile(compiled_scene, parent_node, prefix_matrix)
+        compiled_scene.add_draw_packet(self._end_pass, parent_node, prefix_matrix)
+
+
+class _OffscreenPassBoundary(Renderable):
+    """A draw packet renderable that begins or ends the offscreen pass of a RenderableDynamicResolution."""
+
+    def __init__(self, func):
+        self._func = func
+
+    def close(self) -> None:
+        self._func = None
+
+    def render(self, projection_matrix, view_matrix, model_matrix):
+        self._func()
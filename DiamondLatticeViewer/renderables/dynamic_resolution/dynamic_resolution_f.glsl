@@ -0,0 +1,13 @@
+#version 410 core
+
+layout(location = 0) out vec4 fragment_color;
+
+in vec2 texture_coordinate;
+
+uniform sampler2D scene_texture;
+
+void main()
+{
+    // The scene texture is sampled with bilinear filtering, which upscales it to the framebuffer size.
+    fragment_color = texture(scene_texture, texture_coordinate);
+}
@@ -0,0 +1,13 @@
+#version 410 core
+
+// A single triangle that covers the entire framebuffer, generated from the vertex index.
+
+out vec2 texture_coordinate;
+
+void main()
+{
+    vec2 corner = vec2(float((gl_VertexID << 1) & 2), float(gl_VertexID & 2));
+
+    texture_coordinate = corner;
+    gl_Position = vec4(2.0 * corner - 1.0, 0.0, 1.0);
+}
@@ -5,6 +5,8 @@ import os
 import numpy as np
 
 from utilities.opengl_symbols import *
+from utilities.opengl_state import gl_state
+from utilities.opengl_fast_path import gl_fast
 from utilities.opengl_utilities import create_opengl_program
 
 from renderables.renderable import Renderable
@@ -74,12 +76,12 @@ class RenderableFloor(Renderable):
 
     def render(self, projection_matrix, view_matrix, model_matrix):
 
-        glUseProgram(self._shader_program)
+        gl_state.use_program(self._shader_program)
 
         projection_view_model_matrix = projection_matrix @ view_matrix @ model_matrix
-        glUniformMatrix4fv(self._projection_view_model_matrix_location, 1, GL_TRUE, projection_view_model_matrix.astype(np.float32))
+        gl_fast.glUniformMatrix4fv(self._projection_view_model_matrix_location, 1, GL_TRUE, projection_view_model_matrix.astype(np.float32))
 
-        glEnable(GL_CULL_FACE)
+        gl_state.enable(GL_CULL_FACE)
 
-        glBindVertexArray(self._vao)
-        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+        gl_state.bind_vertex_array(self._vao)
+        gl_fast.glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
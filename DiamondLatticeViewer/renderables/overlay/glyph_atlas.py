@@ -0,0 +1,118 @@
+"""This module implements the GlyphAtlas class.
+
+A glyph atlas holds the rasterized glyphs of a TrueType font in a single image.
+Strings are not rendered into an image; instead, they are laid out as a sequence of (position, glyph index)
+pairs that the overlay shader turns into textured quads, one instance per glyph.
+"""
+
+import math
+
+from PIL import Image, ImageDraw, ImageFont
+
+import numpy as np
+
+# The atlas covers the printable ASCII range. Characters outside this range are rendered as '?'.
+# Note: the number of glyphs must not exceed the size of the 'glyph_rects' array in the overlay vertex shader.
+
+FIRST_CHARACTER = 32
+LAST_CHARACTER = 126
+
+GLYPH_COUNT = LAST_CHARACTER - FIRST_CHARACTER + 1
+
+# The per-instance vertex data for a single glyph: its top-left position in pixels, relative to the
+# top-left corner of the text box, and its index in the atlas.
+
+glyph_instance_dtype = np.dtype([
+    ("a_glyph_position", np.float32, 2),
+    ("a_glyph_index", np.int32)
+])
+
+
+class GlyphAtlas:
+    """Rasterized glyphs of a TrueType font, packed into a single-channel image."""
+
+    def __init__(self, truetype_font_path: str, truetype_font_size: int, atlas_width: int = 256,
+                 line_spacing: int = 4, padding: int = 1):
+
+        font = ImageFont.truetype(truetype_font_path, truetype_font_size)
+
+        (ascent, descent) = font.getmetrics()
+        self.line_height = ascent + descent + line_spacing
+
+        # Determine the bounding box and advance of each glyph.
+
+        bboxes = []
+        self._advances = np.empty(GLYPH_COUNT, dtype=np.float64)
+        for glyph_index in range(GLYPH_COUNT):
+            character = chr(FIRST_CHARACTER + glyph_index)
+            bboxes.append(font.getbbox(character))
+            self._advances[glyph_index] = font.getlength(character)
+
+        # Pack the glyphs into rows ("shelves") of the atlas.
+
+        self._rects = np.zeros((GLYPH_COUNT, 4), dtype=np.float32)  # (x, y, width, height) in atlas pixels.
+        self._offsets = np.zeros((GLYPH_COUNT, 2), dtype=np.float32)  # Glyph placement relative to the pen.
+
+        x = padding
+        y = padding
+        shelf_height = 0
+        for (glyph_index, (left, top, right, bottom)) in enumerate(bboxes):
+            (width, height) = (right - left, bottom - top)
+            if x + width + padding > atlas_width:
+                x = padding
+                y += shelf_height + padding
+                shelf_height = 0
+            self._rects[glyph_index] = (x, y, width, height)
+            self._offsets[glyph_index] = (left, top)
+            x += width + padding
+            shelf_height = max(shelf_height, height)
+
+        atlas_height = y + shelf_height + padding
+
+        # Rasterize the glyphs into the atlas.
+
+        self.image = Image.new("L", (atlas_width, atlas_height), 0)
+        draw = ImageDraw.Draw(self.image)
+        for glyph_index in range(GLYPH_COUNT):
+            (x, y, width, height) = self._rects[glyph_index]
+            if width > 0 and height > 0:
+                (left, top) = self._offsets[glyph_index]
+                draw.text((x - left, y - top), chr(FIRST_CHARACTER + glyph_index), font=font, fill=255)
+
+        print("Glyph atlas: {} glyphs in {}x{} pixels.".format(GLYPH_COUNT, atlas_width, atlas_height))
+
+    def glyph_rects(self) -> np.ndarray:
+        """Return the (x, y, width, height) atlas rectangle of each glyph, in pixels."""
+        return self._rects
+
+    def layout(self, text: str) -> tuple:
+        """Lay out a (multi-line) string.
+
+        Returns the glyph instance array and the (width, height) of the text, in pixels.
+        Glyphs without visible pixels (e.g. spaces) only advance the pen and do not produce an instance.
+        """
+
+        instances = np.empty(len(text), dtype=glyph_instance_dtype)
+        instance_count = 0
+
+        text_width = 0.0
+
+        lines = text.split("\n")
+
+        for (line_index, line) in enumerate(lines):
+            pen_x = 0.0
+            pen_y = line_index * self.line_height
+            for character in line:
+                glyph_index = ord(character) - FIRST_CHARACTER
+                if not (0 <= glyph_index < GLYPH_COUNT):
+                    glyph_index = ord("?") - FIRST_CHARACTER
+                if self._rects[glyph_index, 2] > 0 and self._rects[glyph_index, 3] > 0:
+                    # Round to whole pixels, so the atlas is sampled texel-exact.
+                    glyph_position = (round(pen_x + self._offsets[glyph_index, 0]),
+                                      round(pen_y + self._offsets[glyph_index, 1]))
+                    instances[instance_count] = (glyph_position, glyph_index)
+                    instance_count += 1
+                pen_x += self._advances[glyph_index]
+            text_width = max(text_width, pen_x)
+
+        return (instances[:instance_count], (math.ceil(text_width), len(lines) * self.line_height))
@@ -2,31 +2,45 @@
 
 import os
 
-from PIL import Image, ImageDraw, ImageFont
-
 import numpy as np
 
 from utilities.opengl_symbols import *
+from utilities.opengl_state import gl_state
+from utilities.opengl_fast_path import gl_fast
 from renderables.renderable import Renderable
 from utilities.opengl_utilities import create_opengl_program, define_vertex_attributes
+from renderables.overlay.glyph_atlas import GlyphAtlas, GLYPH_COUNT, glyph_instance_dtype
+
+# The world variables shown by the overlay.
+
+OVERLAY_TEXT_VARIABLES = (
+    "diamond_lattice_side_length",
+    "diamond_lattice_front_to_back",
+    "diamond_lattice_samples_passed",
+    "diamond_lattice_pick",
+    "render_distance",
+    "framebuffer_size",
+    "render_scale",
+    "ms_per_frame",
+    "gl_state_calls",
+    "quality_status"
+)
 
 
 def make_overlay_vertex_data():
 
-    triangles = [
-        ((-1, -1), (1, -1), (1, 1)),
-        ((-1, 1), (-1, -1), (+1, +1))
-    ]
+    # The corners of a unit quad, to be drawn as a triangle strip.
+    # Pixel coordinates have the y-axis pointing down, so this order gives counter-clockwise triangles on screen.
 
-    triangle_vertices = np.array(triangles).reshape(-1, 2)
+    quad_corners = [(0, 1), (1, 1), (0, 0), (1, 0)]
 
     vbo_dtype = np.dtype([
-        ("a_vertex", np.float32, 2)
+        ("a_corner", np.float32, 2)
     ])
 
-    vbo_data = np.empty(dtype=vbo_dtype, shape=len(triangle_vertices))
+    vbo_data = np.empty(dtype=vbo_dtype, shape=len(quad_corners))
 
-    vbo_data["a_vertex"] = triangle_vertices
+    vbo_data["a_corner"] = quad_corners
 
     return vbo_data
 
@@ -45,44 +59,68 @@ class RenderableOverlay(Renderable):
         # Find the location of uniform shader program variables.
 
         self._frame_buffer_size_location = glGetUniformLocation(self._shader_program, "frame_buffer_size")
-        self._projection_view_model_matrix_location = glGetUniformLocation(self._shader_program, "projection_view_model_matrix")
+        self._text_box_origin_location = glGetUniformLocation(self._shader_program, "text_box_origin")
+        self._text_box_size_location = glGetUniformLocation(self._shader_program, "text_box_size")
+        self._draw_mode_location = glGetUniformLocation(self._shader_program, "draw_mode")
+        self._glyph_rects_location = glGetUniformLocation(self._shader_program, "glyph_rects")
+        self._background_color_location = glGetUniformLocation(self._shader_program, "background_color")
+        self._text_color_location = glGetUniformLocation(self._shader_program, "text_color")
 
         # Make vertex buffer data.
 
         vbo_data = make_overlay_vertex_data()
 
-        print("Overlay size: {} triangles, {} vertices, {} bytes ({} bytes per triangle).".format(
-            vbo_data.size // 3, vbo_data.size, vbo_data.nbytes, vbo_data.itemsize))
-
         self._vertex_count = vbo_data.size
 
-        # Prepare texture.
+        # Rasterize the font glyphs once, into the glyph atlas.
 
         truetype_font_source_path = os.path.join(os.path.dirname(__file__), "fonts/AtariClassic_ExtraSmooth.ttf")
         truetype_font_size = 12
 
-        self._last_text = None
-        self._font = ImageFont.truetype(truetype_font_source_path, truetype_font_size)
-        self._texture_background = (40, 70, 200, 64)
-        self._texture_image = Image.new("RGBA", (512, 64), self._texture_background)
-        self._texture_draw = ImageDraw.Draw(self._texture_image)
+        self._glyph_atlas = GlyphAtlas(truetype_font_source_path, truetype_font_size)
+
+        # The glyph atlas texture and the glyph rectangles do not change after this point.
+
+        atlas_image = self._glyph_atlas.image
 
         self._texture = glGenTextures(1)
         glBindTexture(GL_TEXTURE_2D, self._texture)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_REPEAT)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
-        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_S, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_WRAP_T, GL_CLAMP_TO_EDGE)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
 
+        # The single-channel atlas rows are not necessarily 4-byte aligned.
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
         glTexImage2D(
-            GL_TEXTURE_2D, 0, GL_RGBA,
-            self._texture_image.size[0], self._texture_image.size[1], 0, GL_RGBA, GL_UNSIGNED_BYTE,
-            self._texture_image.tobytes()
+            GL_TEXTURE_2D, 0, GL_R8,
+            atlas_image.size[0], atlas_image.size[1], 0, GL_RED, GL_UNSIGNED_BYTE,
+            atlas_image.tobytes()
         )
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 4)
+
+        glUseProgram(self._shader_program)
+        glUniform4fv(self._glyph_rects_location, GLYPH_COUNT, self._glyph_atlas.glyph_rects())
+        glUniform4f(self._background_color_location, 40 / 255, 70 / 255, 200 / 255, 64 / 255)
+        glUniform4f(self._text_color_location, 1.0, 1.0, 0.0, 1.0)
+
+        self._last_text = None
+        self._text_size = (0, 0)
+        self._text_variable_versions = None
 
-        # Make Vertex Buffer Object (VBO)
+        # The uniforms that must be uploaded before the next draw. Initially, all of them.
 
-        self._vbo = glGenBuffers(1)
+        self._dirty_uniforms = {"frame_buffer_size", "text_box_size"}
+
+        world.subscribe("framebuffer_size", self._on_framebuffer_size_changed)
+
+        # The glyph instances of the current text, as uploaded to the instance VBO.
+        self._instances = np.empty(0, dtype=glyph_instance_dtype)
+        self._instance_capacity = 256
+
+        # Make Vertex Buffer Objects (VBOs) for the quad corners and the glyph instances.
+
+        (self._vbo, self._instance_vbo) = glGenBuffers(2)
 
         glBindBuffer(GL_ARRAY_BUFFER, self._vbo)
         glBufferData(GL_ARRAY_BUFFER, vbo_data.nbytes, vbo_data, GL_STATIC_DRAW)
@@ -96,24 +134,37 @@ class RenderableOverlay(Renderable):
         # Define attributes based on the vbo_data element type and enable them.
         define_vertex_attributes(vbo_data.dtype, True)
 
+        # The glyph instance attributes follow the quad corner attribute, and advance once per instance.
+
+        glBindBuffer(GL_ARRAY_BUFFER, self._instance_vbo)
+        glBufferData(GL_ARRAY_BUFFER, self._instance_capacity * glyph_instance_dtype.itemsize, None, GL_DYNAMIC_DRAW)
+        define_vertex_attributes(glyph_instance_dtype, True, first_attribute_index=1, divisor=1)
+
         # Unbind VAO
         glBindVertexArray(0)
 
         # Unbind VBO.
         glBindBuffer(GL_ARRAY_BUFFER, 0)
 
+    def _on_framebuffer_size_changed(self, _name: str, _value) -> None:
+        self._dirty_uniforms.add("frame_buffer_size")
+
     def close(self):
 
+        self._world.unsubscribe("framebuffer_size", self._on_framebuffer_size_changed)
+
         if self._texture is not None:
             glDeleteTextures(1, (self._texture, ))
+            self._texture = None
 
         if self._vao is not None:
             glDeleteVertexArrays(1, (self._vao, ))
             self._vao = None
 
         if self._vbo is not None:
-            glDeleteBuffers(1, (self._vbo, ))
+            glDeleteBuffers(2, (self._vbo, self._instance_vbo))
             self._vbo = None
+            self._instance_vbo = None
 
         if self._shader_program is not None:
             glDeleteProgram(self._shader_program)
@@ -124,56 +175,117 @@ class RenderableOverlay(Renderable):
                 glDeleteShader(shader)
             self._shaders = None
 
+    def _update_instances(self, instances: np.ndarray) -> None:
+        """Upload the glyph instances of a new text, sending only the range that differs from the previous text."""
+
+        glBindBuffer(GL_ARRAY_BUFFER, self._instance_vbo)
+
+        if len(instances) > self._instance_capacity:
+            # Grow the instance VBO. Its contents are lost, so everything is uploaded.
+            while len(instances) > self._instance_capacity:
+                self._instance_capacity *= 2
+            glBufferData(GL_ARRAY_BUFFER, self._instance_capacity * glyph_instance_dtype.itemsize, None, GL_DYNAMIC_DRAW)
+            first = 0
+            last = len(instances)
+        else:
+            # Find the range of instances that changed. Typically, only a few digits of a readout change.
+            common_count = min(len(instances), len(self._instances))
+            changed = np.flatnonzero(instances[:common_count] != self._instances[:common_count])
+            first = changed[0] if len(changed) > 0 else common_count
+            last = changed[-1] + 1 if len(instances) == common_count and len(changed) > 0 else len(instances)
+
+        if first < last:
+            itemsize = glyph_instance_dtype.itemsize
+            gl_fast.glBufferSubData(GL_ARRAY_BUFFER, first * itemsize, (last - first) * itemsize, instances[first:last])
+
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self._instances = instances
+
     def render(self, projection_matrix, view_matrix, model_matrix):
 
         world = self._world
 
-        glUseProgram(self._shader_program)
+        # Only re-format the text if one of the variables it shows changed.
 
-        glUniformMatrix4fv(
-            self._projection_view_model_matrix_location, 1, GL_TRUE,
-            (projection_matrix @ view_matrix @ model_matrix).astype(np.float32)
-        )
+        text_variable_versions = tuple(world.get_variable_version(name) for name in OVERLAY_TEXT_VARIABLES)
+
+        if text_variable_versions != self._text_variable_versions:
+
+            unit_cell_size = 0.3567  # [nm] Carbon (diamond)
+            # unit_cell_size = 0.543   # [nm] Silicon
+
+            # Update the text we want to render.
+            text = "diamond lattice side length: {} ({:.3f} nm)\ndiamond lattice samples passed: {} (front to back: {})\npicked: {}\nrender distance: {}\nframebuffer size: {} (render scale {:.3f})\nrender time per frame: {:.3f} ms\nGL state calls: {} issued, {} skipped\nquality: {}".format(
+                world.get_variable("diamond_lattice_side_length"),
+                world.get_variable("diamond_lattice_side_length") / 4 * unit_cell_size,
+                world.get_variable("diamond_lattice_samples_passed"),
+                "on" if world.get_variable("diamond_lattice_front_to_back") else "off",
+                world.get_variable("diamond_lattice_pick"),
+                world.get_variable("render_distance"),
+                world.get_variable("framebuffer_size"),
+                world.get_variable("render_scale"),
+                world.get_variable("ms_per_frame"),
+                *world.get_variable("gl_state_calls"),
+                world.get_variable("quality_status")
+            )
+
+            if text != self._last_text:
+                # The text changed; lay it out and upload the glyph instances that changed.
+                (instances, text_size) = self._glyph_atlas.layout(text)
+                self._update_instances(instances)
+                self._last_text = text
+                if text_size != self._text_size:
+                    self._text_size = text_size
+                    self._dirty_uniforms.add("text_box_size")
+
+            self._text_variable_versions = text_variable_versions
+
+        gl_state.use_program(self._shader_program)
 
         (framebuffer_width, framebuffer_height) = world.get_variable("framebuffer_size")
 
-        # We need to inform the shader program about the size of the window we're rendering, so it can
-        # re-scale the overlay texture to render at one texture pixel per framebuffer pixel.
-        glUniform2ui(self._frame_buffer_size_location, framebuffer_width, framebuffer_height)
+        # The text box is placed in the bottom-right corner of the framebuffer, with a small margin around the text.
 
-        glBindTexture(GL_TEXTURE_2D, self._texture)
+        margin = 2
+        (text_box_width, text_box_height) = (self._text_size[0] + 2 * margin, self._text_size[1] + 2 * margin)
 
-        unit_cell_size = 0.3567  # [nm] Carbon (diamond)
-        # unit_cell_size = 0.543   # [nm] Silicon
+        # Only upload the uniforms whose inputs changed since the previous draw.
 
-        # Update the text we want to render.
-        text = "diamond lattice side length: {} ({:.3f} nm)\nrender distance: {}\nframebuffer size: {}\nrender time per frame: {:.3f} ms".format(
-            world.get_variable("diamond_lattice_side_length"),
-            world.get_variable("diamond_lattice_side_length") / 4 * unit_cell_size,
-            world.get_variable("render_distance"),
-            (framebuffer_width, framebuffer_height),
-            world.get_variable("ms_per_frame")
-        )
+        if "frame_buffer_size" in self._dirty_uniforms:
+            # We need to inform the shader program about the size of the window we're rendering, so it can
+            # place the glyphs at one atlas pixel per framebuffer pixel.
+            gl_fast.glUniform2ui(self._frame_buffer_size_location, framebuffer_width, framebuffer_height)
 
-        if text != self._last_text:
-            # If the text has render the text and upload it to texture memory.
-            self._texture_image.paste(
-                self._texture_background,
-                (0, 0, self._texture_image.size[0], self._texture_image.size[1])
-            )
-            self._texture_draw.multiline_text((0, 0), text, font=self._font, fill='yellow')
-            glTexSubImage2D(
-                GL_TEXTURE_2D, 0,
-                0, 0,
-                self._texture_image.size[0], self._texture_image.size[1],
-                GL_RGBA, GL_UNSIGNED_BYTE, self._texture_image.tobytes()
-            )
-            self._last_text = text
+        if "text_box_size" in self._dirty_uniforms:
+            gl_fast.glUniform2f(self._text_box_size_location, text_box_width, text_box_height)
 
-        glBindVertexArray(self._vao)
+        self._dirty_uniforms.clear()
+
+        gl_state.active_texture(GL_TEXTURE0)
+        gl_state.bind_texture(GL_TEXTURE_2D, self._texture)
+        gl_state.bind_vertex_array(self._vao)
+
+        gl_state.enable(GL_CULL_FACE)
+        gl_state.enable(GL_BLEND)
+        gl_state.blend_func(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
+
+        # The overlay is drawn on top of everything.
+        gl_state.disable(GL_DEPTH_TEST)
+
+        # Draw the text box background.
+
+        gl_fast.glUniform1ui(self._draw_mode_location, 0)
+        gl_fast.glUniform2f(self._text_box_origin_location,
+                    framebuffer_width - text_box_width, framebuffer_height - text_box_height)
+        gl_fast.glDrawArraysInstanced(GL_TRIANGLE_STRIP, 0, self._vertex_count, 1)
+
+        # Draw the glyphs, one instance per glyph.
+
+        gl_fast.glUniform1ui(self._draw_mode_location, 1)
+        gl_fast.glUniform2f(self._text_box_origin_location,
+                    framebuffer_width - text_box_width + margin, framebuffer_height - text_box_height + margin)
+        gl_fast.glDrawArraysInstanced(GL_TRIANGLE_STRIP, 0, self._vertex_count, len(self._instances))
 
-        glEnable(GL_CULL_FACE)
-        glEnable(GL_BLEND)
-        glBlendFunc(GL_SRC_ALPHA, GL_ONE_MINUS_SRC_ALPHA)
-        glDrawArrays(GL_TRIANGLES, 0, self._vertex_count)
-        glDisable(GL_BLEND)
+        gl_state.enable(GL_DEPTH_TEST)
+        gl_state.disable(GL_BLEND)
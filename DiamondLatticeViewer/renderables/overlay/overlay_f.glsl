@@ -1,15 +1,27 @@
-
 #version 410 core
 
 out vec4 fragment_color;
 
 in VS_OUT {
-   vec2 overlay_texture_coordinate;
+   vec2 atlas_texture_coordinate;
 } fs_in;
 
-uniform sampler2D overlay_texture;
+uniform uint draw_mode;  // 0: draw the text box background; 1: draw glyphs.
+
+uniform vec4 background_color;
+uniform vec4 text_color;
+
+uniform sampler2D glyph_atlas;
 
 void main()
 {
-    fragment_color = texture(overlay_texture, fs_in.overlay_texture_coordinate);
+    if (draw_mode == 0u)
+    {
+        fragment_color = background_color;
+    }
+    else
+    {
+        float coverage = texture(glyph_atlas, fs_in.atlas_texture_coordinate).r;
+        fragment_color = vec4(text_color.rgb, text_color.a * coverage);
+    }
 }
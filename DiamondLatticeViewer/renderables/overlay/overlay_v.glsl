@@ -1,39 +1,49 @@
-
 #version 410 core
 
-layout(location = 0) in vec2 a_vertex;
+// Per-vertex attribute: the corner of the unit quad.
+layout(location = 0) in vec2 a_corner;
+
+// Per-instance attributes: the glyph position (in pixels, relative to the text box) and its atlas index.
+layout(location = 1) in vec2 a_glyph_position;
+layout(location = 2) in int a_glyph_index;
 
 out VS_OUT {
-    vec2 overlay_texture_coordinate;
+    vec2 atlas_texture_coordinate;
 } vs_out;
 
 uniform uvec2 frame_buffer_size;
 
-uniform sampler2D overlay_texture;
-
-void main()
-{
-    // Make 4D vertex from 3D value.
-    vec4 v = vec4(a_vertex, -1, 1.0);
+uniform vec2 text_box_origin;  // Top-left corner of the text box, in pixels.
+uniform vec2 text_box_size;    // Size of the text box, in pixels.
 
-    uvec2 texture_size = textureSize(overlay_texture, 0);
+uniform uint draw_mode;  // 0: draw the text box background; 1: draw glyphs.
 
-    //   texture.x = 0.5 + 0.5 * vertex.x;
-    //   texture.y = 0.5 - 0.5 * vertex.y;
+// The (x, y, width, height) rectangle of each glyph in the atlas, in pixels.
+// Note: the array size must be at least the GLYPH_COUNT of the glyph atlas.
+uniform vec4 glyph_rects[96];
 
-    vs_out.overlay_texture_coordinate = vec2(0.5 + 0.5 * a_vertex.x, 0.5 - 0.5 * a_vertex.y);
+uniform sampler2D glyph_atlas;
 
-    //   clipspace.x = vertex.x * texture_size.x / frame_buffer_size.x + offset_x
-    //   -1 --> -1
-    //   +1 --> -1 +
-    //   clipspace.y = vertex.y * texture_size.y / frame_buffer_size.y
-
-
-    float offset_x = 1 - float(texture_size.x) / frame_buffer_size.x;
-    float offset_y = 1 - float(texture_size.y) / frame_buffer_size.y;
+void main()
+{
+    vec2 pixel;
+
+    if (draw_mode == 0u)
+    {
+        pixel = text_box_origin + a_corner * text_box_size;
+        vs_out.atlas_texture_coordinate = vec2(0.0, 0.0);
+    }
+    else
+    {
+        vec4 rect = glyph_rects[a_glyph_index];
+        pixel = text_box_origin + a_glyph_position + a_corner * rect.zw;
+        vs_out.atlas_texture_coordinate = (rect.xy + a_corner * rect.zw) / vec2(textureSize(glyph_atlas, 0));
+    }
+
+    // Pixel coordinates have their origin at the top-left of the framebuffer, with y pointing down.
 
     gl_Position = vec4(
-        a_vertex.x * texture_size.x / frame_buffer_size.x + offset_x,
-        a_vertex.y * texture_size.y / frame_buffer_size.y - offset_y, 0.0, 1.0
+        2.0 * pixel.x / frame_buffer_size.x - 1.0,
+        1.0 - 2.0 * pixel.y / frame_buffer_size.y, 0.0, 1.0
     );
 }
@@ -11,3 +11,11 @@ class Renderable:
     def close(self) -> None:
         """Must be implemented by derived classes."""
         raise NotImplementedError()
+
+    def compile(self, compiled_scene, parent_node, prefix_matrix) -> None:
+        """Add this renderable to a compiled scene.
+
+        By default, a renderable is added as a single draw packet.
+        Structural renderables override this to add their children.
+        """
+        compiled_scene.add_draw_packet(self, parent_node, prefix_matrix)
@@ -7,6 +7,8 @@ from PIL import Image
 import numpy as np
 
 from utilities.opengl_symbols import *
+from utilities.opengl_state import gl_state
+from utilities.opengl_fast_path import gl_fast
 from utilities.matrices import apply_transform_to_vertices, scale
 from renderables.renderable import Renderable
 from utilities.opengl_utilities import create_opengl_program, define_vertex_attributes, gl_get_uniform_location_checked
@@ -58,6 +60,9 @@ class RenderableSphereImpostor(Renderable):
 
         self._impostor_mode_location = glGetUniformLocation(self._shader_program, "impostor_mode")
 
+        self._impostor_mode_dirty = True
+        world.subscribe("impostor_mode", self._on_impostor_mode_changed)
+
         # Make vertex buffer data.
 
         vbo_data = make_sphere_impostor_triangle_vertex_data(m_xform)
@@ -106,8 +111,13 @@ class RenderableSphereImpostor(Renderable):
         # Unbind VBO.
         glBindBuffer(GL_ARRAY_BUFFER, 0)
 
+    def _on_impostor_mode_changed(self, _name: str, _value) -> None:
+        self._impostor_mode_dirty = True
+
     def close(self):
 
+        self._world.unsubscribe("impostor_mode", self._on_impostor_mode_changed)
+
         if self._vao is not None:
             glDeleteVertexArrays(1, (self._vao, ))
             self._vao = None
@@ -129,19 +139,23 @@ class RenderableSphereImpostor(Renderable):
 
         world = self._world
 
-        glUseProgram(self._shader_program)
+        gl_state.use_program(self._shader_program)
 
-        glUniformMatrix4fv(self._projection_matrix_location, 1, GL_TRUE, projection_matrix.astype(np.float32))
+        gl_fast.glUniformMatrix4fv(self._projection_matrix_location, 1, GL_TRUE, projection_matrix.astype(np.float32))
 
-        glUniformMatrix4fv(self._view_model_matrix_location, 1, GL_TRUE, (view_matrix @ model_matrix).astype(np.float32))
-        glUniformMatrix4fv(self._projection_view_model_matrix_location, 1, GL_TRUE, (projection_matrix @ view_matrix @ model_matrix).astype(np.float32))
-        glUniformMatrix4fv(self._transposed_inverse_view_matrix_location, 1, GL_TRUE, np.linalg.inv(view_matrix).T.astype(np.float32))
-        glUniformMatrix4fv(self._transposed_inverse_view_model_matrix_location, 1, GL_TRUE, np.linalg.inv(view_matrix @ model_matrix).T.astype(np.float32))
+        gl_fast.glUniformMatrix4fv(self._view_model_matrix_location, 1, GL_TRUE, (view_matrix @ model_matrix).astype(np.float32))
+        gl_fast.glUniformMatrix4fv(self._projection_view_model_matrix_location, 1, GL_TRUE, (projection_matrix @ view_matrix @ model_matrix).astype(np.float32))
+        gl_fast.glUniformMatrix4fv(self._transposed_inverse_view_matrix_location, 1, GL_TRUE, np.linalg.inv(view_matrix).T.astype(np.float32, order="C"))
+        gl_fast.glUniformMatrix4fv(self._transposed_inverse_view_model_matrix_location, 1, GL_TRUE, np.linalg.inv(view_matrix @ model_matrix).T.astype(np.float32, order="C"))
 
-        glUniform1ui(self._impostor_mode_location, world.get_variable("impostor_mode"))
+        # The impostor mode is only uploaded if it changed since the previous draw.
+        if self._impostor_mode_dirty:
+            gl_fast.glUniform1ui(self._impostor_mode_location, world.get_variable("impostor_mode"))
+            self._impostor_mode_dirty = False
 
-        glBindTexture(GL_TEXTURE_2D, self._texture)
-        glBindVertexArray(self._vao)
+        gl_state.active_texture(GL_TEXTURE0)
+        gl_state.bind_texture(GL_TEXTURE_2D, self._texture)
+        gl_state.bind_vertex_array(self._vao)
 
-        glEnable(GL_CULL_FACE)
-        glDrawArrays(GL_TRIANGLES, 0, self._vertex_count)
+        gl_state.enable(GL_CULL_FACE)
+        gl_fast.glDrawArrays(GL_TRIANGLES, 0, self._vertex_count)
@@ -0,0 +1,214 @@
+"""This module implements the RenderableSphereImpostorBatch class."""
+
+import os
+
+from PIL import Image
+
+import numpy as np
+
+from utilities.opengl_symbols import *
+from utilities.opengl_state import gl_state
+from utilities.opengl_fast_path import gl_fast
+from renderables.renderable import Renderable
+from utilities.opengl_utilities import create_opengl_program, define_vertex_attributes, gl_get_uniform_location_checked
+from renderables.sphere_impostor.sphere_impostor import make_sphere_impostor_triangle_vertex_data
+
+# The per-instance vertex data: the instance model matrix, stored column by column as OpenGL expects it,
+# and the layer of the texture array that textures the instance.
+
+sphere_instance_dtype = np.dtype([
+    ("a_model_matrix_column1", np.float32, 4),
+    ("a_model_matrix_column2", np.float32, 4),
+    ("a_model_matrix_column3", np.float32, 4),
+    ("a_model_matrix_column4", np.float32, 4),
+    ("a_texture_layer", np.int32)
+])
+
+
+class RenderableSphereImpostorBatch(Renderable):
+    """Many textured sphere impostors, drawn with a single instanced draw call.
+
+    The textures are packed into the layers of a single texture array.
+    The 'instances_func' function is called every frame; it returns an array of N model matrices (shape (N, 4, 4))
+    and an array of N texture layer indices, one for each sphere.
+    """
+
+    def __init__(self, world, texture_filenames: list[str], instances_func, initial_capacity: int = 16):
+
+        self._world = world
+        self._instances_func = instances_func
+
+        # Compile the shader program.
+
+        # The vertex shader is specific to the batch. The fragment shader is shared with the RenderableSphereImpostor,
+        # and reads the sphere textures from a texture array.
+
+        shader_source_path = os.path.join(os.path.dirname(__file__), "sphere_impostor")
+        (self._shaders, self._shader_program) = create_opengl_program(shader_source_path, "batch", ("TEXTURE_ARRAY", ))
+
+        # Find the location of uniform shader program variables.
+
+        self._projection_matrix_location = gl_get_uniform_location_checked(self._shader_program, "projection_matrix")
+        self._view_model_matrix_location = gl_get_uniform_location_checked(self._shader_program, "view_model_matrix")
+        self._transposed_inverse_view_matrix_location = gl_get_uniform_location_checked(self._shader_program, "transposed_inverse_view_matrix")
+
+        self._impostor_mode_location = glGetUniformLocation(self._shader_program, "impostor_mode")
+
+        self._impostor_mode_dirty = True
+        world.subscribe("impostor_mode", self._on_impostor_mode_changed)
+
+        # Make vertex buffer data.
+
+        vbo_data = make_sphere_impostor_triangle_vertex_data()
+
+        print("Sphere impostor batch size: {} triangles, {} vertices, {} bytes ({} bytes per triangle).".format(
+            vbo_data.size // 3, vbo_data.size, vbo_data.nbytes, vbo_data.itemsize))
+
+        self._vertex_count = vbo_data.size
+
+        # Make texture array. All images are resized to the size of the first image.
+
+        images = []
+        for texture_filename in texture_filenames:
+            texture_image_path = os.path.join(os.path.dirname(__file__), texture_filename)
+            with Image.open(texture_image_path) as im:
+                im = im.convert("RGB")
+                if images and im.size != (images[0].shape[1], images[0].shape[0]):
+                    im = im.resize((images[0].shape[1], images[0].shape[0]))
+                images.append(np.array(im))
+
+        (texture_height, texture_width) = images[0].shape[:2]
+
+        self._texture = glGenTextures(1)
+        glBindTexture(GL_TEXTURE_2D_ARRAY, self._texture)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_S, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_WRAP_T, GL_REPEAT)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_2D_ARRAY, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+
+        glTexImage3D(GL_TEXTURE_2D_ARRAY, 0, GL_RGB8, texture_width, texture_height, len(images), 0,
+                     GL_RGB, GL_UNSIGNED_BYTE, None)
+        for (layer, image) in enumerate(images):
+            glTexSubImage3D(GL_TEXTURE_2D_ARRAY, 0, 0, 0, layer, texture_width, texture_height, 1,
+                            GL_RGB, GL_UNSIGNED_BYTE, image)
+        glGenerateMipmap(GL_TEXTURE_2D_ARRAY)
+
+        # The instance data is kept in a numpy array that is updated in place, and uploaded every frame.
+
+        self._instance_capacity = initial_capacity
+        self._instance_data = np.zeros(self._instance_capacity, dtype=sphere_instance_dtype)
+        self._instance_count = 0
+
+        # Make Vertex Buffer Objects (VBOs) for the impostor hull vertices and the sphere instances.
+
+        (self._vbo, self._instance_vbo) = glGenBuffers(2)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self._vbo)
+        glBufferData(GL_ARRAY_BUFFER, vbo_data.nbytes, vbo_data, GL_STATIC_DRAW)
+
+        # Create a vertex array object (VAO)
+        # If a GL_ARRAY_BUFFER is bound, it will be associated with the VAO.
+
+        self._vao = glGenVertexArrays(1)
+        glBindVertexArray(self._vao)
+
+        # Define attributes based on the vbo_data element type and enable them.
+        define_vertex_attributes(vbo_data.dtype, True)
+
+        # The instance attributes follow the hull vertex attribute, and advance once per instance.
+
+        glBindBuffer(GL_ARRAY_BUFFER, self._instance_vbo)
+        glBufferData(GL_ARRAY_BUFFER, self._instance_data.nbytes, None, GL_DYNAMIC_DRAW)
+        define_vertex_attributes(sphere_instance_dtype, True, first_attribute_index=1, divisor=1)
+
+        # Unbind VAO
+        glBindVertexArray(0)
+
+        # Unbind VBO.
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+    def _on_impostor_mode_changed(self, _name: str, _value) -> None:
+        self._impostor_mode_dirty = True
+
+    def close(self):
+
+        self._world.unsubscribe("impostor_mode", self._on_impostor_mode_changed)
+
+        if self._texture is not None:
+            glDeleteTextures(1, (self._texture, ))
+            self._texture = None
+
+        if self._vao is not None:
+            glDeleteVertexArrays(1, (self._vao, ))
+            self._vao = None
+
+        if self._vbo is not None:
+            glDeleteBuffers(2, (self._vbo, self._instance_vbo))
+            self._vbo = None
+            self._instance_vbo = None
+
+        if self._shader_program is not None:
+            glDeleteProgram(self._shader_program)
+            self._shader_program = None
+
+        if self._shaders is not None:
+            for shader in self._shaders:
+                glDeleteShader(shader)
+            self._shaders = None
+
+    def _update_instances(self) -> None:
+        """Fill the instance data array in place, and upload it to the instance VBO."""
+
+        (model_matrices, texture_layers) = self._instances_func()
+
+        instance_count = len(model_matrices)
+
+        glBindBuffer(GL_ARRAY_BUFFER, self._instance_vbo)
+
+        if instance_count > self._instance_capacity:
+            while instance_count > self._instance_capacity:
+                self._instance_capacity *= 2
+            self._instance_data = np.zeros(self._instance_capacity, dtype=sphere_instance_dtype)
+            glBufferData(GL_ARRAY_BUFFER, self._instance_data.nbytes, None, GL_DYNAMIC_DRAW)
+
+        instance_data = self._instance_data[:instance_count]
+
+        instance_data["a_model_matrix_column1"] = model_matrices[:, :, 0]
+        instance_data["a_model_matrix_column2"] = model_matrices[:, :, 1]
+        instance_data["a_model_matrix_column3"] = model_matrices[:, :, 2]
+        instance_data["a_model_matrix_column4"] = model_matrices[:, :, 3]
+        instance_data["a_texture_layer"] = texture_layers
+
+        if instance_count > 0:
+            gl_fast.glBufferSubData(GL_ARRAY_BUFFER, 0, instance_data.nbytes, instance_data)
+
+        glBindBuffer(GL_ARRAY_BUFFER, 0)
+
+        self._instance_count = instance_count
+
+    def render(self, projection_matrix, view_matrix, model_matrix):
+
+        world = self._world
+
+        self._update_instances()
+
+        if self._instance_count == 0:
+            return
+
+        gl_state.use_program(self._shader_program)
+
+        gl_fast.glUniformMatrix4fv(self._projection_matrix_location, 1, GL_TRUE, projection_matrix.astype(np.float32))
+        gl_fast.glUniformMatrix4fv(self._view_model_matrix_location, 1, GL_TRUE, (view_matrix @ model_matrix).astype(np.float32))
+        gl_fast.glUniformMatrix4fv(self._transposed_inverse_view_matrix_location, 1, GL_TRUE, np.linalg.inv(view_matrix).T.astype(np.float32, order="C"))
+
+        # The impostor mode is only uploaded if it changed since the previous draw.
+        if self._impostor_mode_dirty:
+            gl_fast.glUniform1ui(self._impostor_mode_location, world.get_variable("impostor_mode"))
+            self._impostor_mode_dirty = False
+
+        gl_state.active_texture(GL_TEXTURE0)
+        gl_state.bind_texture(GL_TEXTURE_2D_ARRAY, self._texture)
+        gl_state.bind_vertex_array(self._vao)
+
+        gl_state.enable(GL_CULL_FACE)
+        gl_fast.glDrawArraysInstanced(GL_TRIANGLES, 0, self._vertex_count, self._instance_count)
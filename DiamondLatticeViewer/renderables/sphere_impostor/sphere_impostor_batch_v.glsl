@@ -0,0 +1,36 @@
+#version 410 core
+
+layout (location = 0) in vec3 a_vertex;
+
+// Per-instance attributes: the instance model matrix (occupying locations 1 to 4) and its texture layer.
+layout (location = 1) in mat4 a_model_matrix;
+layout (location = 5) in int a_texture_layer;
+
+uniform mat4 projection_matrix;
+uniform mat4 view_model_matrix;
+
+out VS_OUT {
+    vec3 mv_impostor_surface;
+    flat mat4 modelview_to_object_space_matrix;
+    flat mat4 object_to_projection_space_matrix;
+    flat int texture_layer;
+} vs_out;
+
+void main()
+{
+    // Make 4D vertex from 3D value.
+    vec4 v = vec4(a_vertex, 1.0);
+
+    mat4 instance_view_model_matrix = view_model_matrix * a_model_matrix;
+
+    vec4 mv_v = instance_view_model_matrix * v;
+
+    gl_Position = projection_matrix * mv_v;
+    vs_out.mv_impostor_surface = mv_v.xyz;
+
+    vs_out.modelview_to_object_space_matrix = inverse(instance_view_model_matrix);
+
+    vs_out.object_to_projection_space_matrix = projection_matrix * instance_view_model_matrix;
+
+    vs_out.texture_layer = a_texture_layer;
+}
@@ -13,7 +13,12 @@ const float PI = 4 * atan(1);
 
 uniform mat4 transposed_inverse_view_matrix;
 uniform uint impostor_mode;
+#ifdef TEXTURE_ARRAY
+// The batched renderable draws spheres with different textures, stored as the layers of a texture array.
+uniform sampler2DArray my_textures;
+#else
 uniform sampler2D my_texture;
+#endif
 
 // Input variables provided by the vertex shader.
 
@@ -21,6 +26,9 @@ in VS_OUT {
     vec3 mv_impostor_surface;
     flat mat4 modelview_to_object_space_matrix;
     flat mat4 object_to_projection_space_matrix;
+#ifdef TEXTURE_ARRAY
+    flat int texture_layer;
+#endif
 } fs_in;
 
 // Fragment shader output variables.
@@ -127,7 +135,11 @@ void main()
     float u = 0.5 + 0.5 * atan(object_hit.x, object_hit.z) / PI;
     float v = 0.5 - 0.5 * object_hit.y;
 
+#ifdef TEXTURE_ARRAY
+    vec3 k_material = texture(my_textures, vec3(u, v, fs_in.texture_layer)).xyz;
+#else
     vec3 k_material = texture(my_texture, vec2(u, v)).xyz;
+#endif
 
     // Determine fragment color using Phong shading.
 
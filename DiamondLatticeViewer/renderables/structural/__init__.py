@@ -3,3 +3,4 @@
 from .scene import RenderableScene
 from .model_transformer import RenderableModelTransformer
 from .optional_model import RenderableOptionalModel
+from .compiled_scene import RenderableCompiledScene
@@ -0,0 +1,148 @@
+"""This module implements the RenderableCompiledScene class."""
+
+import numpy as np
+
+from ..renderable import Renderable
+
+
+class SceneNode:
+    """A dynamic node of a compiled scene: either a transformation or a condition.
+
+    Each frame, a node determines if it is enabled, its model matrix, and if that matrix changed
+    since the previous frame.
+    """
+
+    def __init__(self, parent, transform_func=None, condition_func=None, prefix_matrix=None):
+        self.parent = parent
+        self.transform_func = transform_func
+        self.condition_func = condition_func
+        self.prefix_matrix = prefix_matrix  # Constant transformation between the parent and this node.
+        self.enabled = True
+        self.changed = True
+        self.value = None  # The most recent value returned by the transform function.
+        self.matrix = None  # None if the matrix must be recalculated.
+
+    def evaluate(self) -> None:
+
+        parent = self.parent
+
+        if not parent.enabled:
+            # Descendants of a disabled node are not evaluated.
+            self.enabled = False
+            self.matrix = None
+            return
+
+        if self.condition_func is not None:
+            self.enabled = bool(self.condition_func())
+            if not self.enabled:
+                self.matrix = None
+                return
+            self.changed = parent.changed or self.matrix is None
+            self.matrix = parent.matrix
+            return
+
+        self.enabled = True
+
+        value = self.transform_func()
+        if parent.changed or self.matrix is None or not np.array_equal(value, self.value):
+            self.value = value
+            if self.prefix_matrix is None:
+                self.matrix = parent.matrix @ value
+            else:
+                self.matrix = parent.matrix @ self.prefix_matrix @ value
+            self.changed = True
+        else:
+            self.changed = False
+
+
+class DrawPacket:
+    """A leaf renderable, with the node that determines its visibility and model matrix."""
+
+    def __init__(self, renderable: Renderable, node: SceneNode, prefix_matrix):
+        self.renderable = renderable
+        self.node = node
+        self.prefix_matrix = prefix_matrix
+        self.matrix = None
+
+
+class RenderableCompiledScene(Renderable):
+    """A renderable scene graph, compiled into a flat list of nodes and draw packets.
+
+    Rendering a tree of RenderableScene, RenderableOptionalModel and RenderableModelTransformer instances walks
+    the tree every frame. The compiled scene instead evaluates a flat list of its dynamic nodes, once per node,
+    in parent-before-child order, and then draws the packets whose nodes are enabled.
+
+    Constant transformations are folded into their descendants at compile time, and the model matrix of a node
+    or a packet is only recalculated if its inputs changed.
+
+    Rendering is split into prepare(), which evaluates the nodes and makes a list of draws, and submit(), which
+    renders that list. This allows the two steps to run on different threads.
+    """
+
+    def __init__(self, model: Renderable):
+
+        self._model = model
+
+        # The root node represents the model matrix passed to render().
+
+        self._root = SceneNode(None)
+
+        self._nodes = []
+        self._packets = []
+        self._draws = []
+
+        model.compile(self, self._root, None)
+
+        print("Compiled scene: {} dynamic nodes, {} draw packets.".format(len(self._nodes), len(self._packets)))
+
+    def add_transform_node(self, transform_func, parent_node: SceneNode, prefix_matrix) -> SceneNode:
+        node = SceneNode(parent_node, transform_func=transform_func, prefix_matrix=prefix_matrix)
+        self._nodes.append(node)
+        return node
+
+    def add_condition_node(self, condition_func, parent_node: SceneNode) -> SceneNode:
+        node = SceneNode(parent_node, condition_func=condition_func)
+        self._nodes.append(node)
+        return node
+
+    def add_draw_packet(self, renderable: Renderable, parent_node: SceneNode, prefix_matrix) -> None:
+        self._packets.append(DrawPacket(renderable, parent_node, prefix_matrix))
+
+    def close(self) -> None:
+        self._model.close()
+        self._model = None
+        self._nodes = None
+        self._packets = None
+
+    def prepare(self, model_matrix, draws: list) -> None:
+        """Evaluate the nodes, and fill 'draws' with the (renderable, model matrix) pairs of the enabled packets.
+
+        This issues no OpenGL calls, so it can run on a frame preparation thread.
+        """
+
+        root = self._root
+        root.changed = root.matrix is None or not np.array_equal(root.matrix, model_matrix)
+        if root.changed:
+            root.matrix = model_matrix
+
+        for node in self._nodes:
+            node.evaluate()
+
+        draws.clear()
+
+        for packet in self._packets:
+            node = packet.node
+            if node.enabled:
+                if node.changed or packet.matrix is None:
+                    packet.matrix = node.matrix if packet.prefix_matrix is None else node.matrix @ packet.prefix_matrix
+                draws.append((packet.renderable, packet.matrix))
+
+    @staticmethod
+    def submit(projection_matrix, view_matrix, draws: list) -> None:
+        """Render the (renderable, model matrix) pairs of a prepared frame."""
+        for (renderable, matrix) in draws:
+            renderable.render(projection_matrix, view_matrix, matrix)
+
+    def render(self, projection_matrix, view_matrix, model_matrix) -> None:
+        self.prepare(model_matrix, self._draws)
+        self.submit(projection_matrix, view_matrix, self._draws)
@@ -4,7 +4,11 @@ from ..renderable import Renderable
 
 
 class RenderableModelTransformer(Renderable):
-    """A renderable wrapper that changes the model transformation matrix dynamically."""
+    """A renderable wrapper that changes the model transformation matrix dynamically.
+
+    The 'func' argument is either a function that returns the transformation matrix,
+    or a constant transformation matrix.
+    """
 
     def __init__(self, model, func):
 
@@ -17,5 +21,14 @@ class RenderableModelTransformer(Renderable):
         self._func = None
 
     def render(self, projection_matrix, view_matrix, model_matrix):
-        m_func = self._func()
+        m_func = self._func() if callable(self._func) else self._func
         self._model.render(projection_matrix, view_matrix, model_matrix @ m_func)
+
+    def compile(self, compiled_scene, parent_node, prefix_matrix) -> None:
+        if callable(self._func):
+            node = compiled_scene.add_transform_node(self._func, parent_node, prefix_matrix)
+            self._model.compile(compiled_scene, node, None)
+        else:
+            # A constant transformation is folded into the prefix matrix of the descendants.
+            prefix_matrix = self._func if prefix_matrix is None else prefix_matrix @ self._func
+            self._model.compile(compiled_scene, parent_node, prefix_matrix)
@@ -1,4 +1,4 @@
-"""This module implements the RenderableModelTransformer class."""
+"""This module implements the RenderableOptionalModel class."""
 
 from ..renderable import Renderable
 
@@ -19,3 +19,7 @@ class RenderableOptionalModel(Renderable):
     def render(self, m_projection, m_view, m_model) -> None:
         if self._func():
             self._model.render(m_projection, m_view, m_model)
+
+    def compile(self, compiled_scene, parent_node, prefix_matrix) -> None:
+        node = compiled_scene.add_condition_node(self._func, parent_node)
+        self._model.compile(compiled_scene, node, prefix_matrix)
@@ -19,3 +19,7 @@ class RenderableScene(Renderable):
     def render(self, projection_matrix, model_matrix, view_matrix) -> None:
         for model in self._models:
             model.render(projection_matrix, model_matrix, view_matrix)
+
+    def compile(self, compiled_scene, parent_node, prefix_matrix) -> None:
+        for model in self._models:
+            model.compile(compiled_scene, parent_node, prefix_matrix)
@@ -0,0 +1,70 @@
+"""Clocks that drive the time of the World.
+
+A clock provides the current time through get_time(). The main loop calls advance() once per frame,
+after the frame has been rendered. Only the wall clock depends on real time; the other clocks make
+a run reproducible, frame by frame.
+"""
+
+import time
+
+import glfw
+
+
+class WallClock:
+    """Real time, as measured by GLFW."""
+
+    def advance(self) -> None:
+        pass
+
+    def get_time(self) -> float:
+        return glfw.get_time()
+
+
+class MonotonicClock:
+    """Real time, as measured by the monotonic clock of the operating system.
+
+    Unlike the wall clock, this clock does not need GLFW to be initialized, so it can be used by other hosts.
+    """
+
+    def __init__(self):
+        self._start_time = time.monotonic()
+
+    def advance(self) -> None:
+        pass
+
+    def get_time(self) -> float:
+        return time.monotonic() - self._start_time
+
+
+class FixedTimestepClock:
+    """Time that advances by a fixed amount per frame, regardless of how long a frame takes to render."""
+
+    def __init__(self, timestep: float, start_time: float = 0.0):
+        self._timestep = timestep
+        self._time = start_time
+
+    def advance(self) -> None:
+        self._time += self._timestep
+
+    def get_time(self) -> float:
+        return self._time
+
+
+class ScriptedClock:
+    """Time that follows a given sequence of per-frame times, e.g. the frame times of a recorded run.
+
+    After the last scripted time, the clock stays at that time.
+    """
+
+    def __init__(self, times: list[float]):
+        if len(times) == 0:
+            raise ValueError("A scripted clock needs at least one time.")
+        self._times = times
+        self._index = 0
+
+    def advance(self) -> None:
+        if self._index < len(self._times) - 1:
+            self._index += 1
+
+    def get_time(self) -> float:
+        return self._times[self._index]
@@ -0,0 +1,80 @@
+"""Prepare frames on a worker thread, while the main thread submits the previous frame to OpenGL.
+
+Preparing a frame (sampling the world time, evaluating the transformation and condition functions of the scene,
+and making the list of draws) issues no OpenGL calls. The FramePipeline runs it on a worker thread, for frame N+1,
+while the main thread submits frame N. The OpenGL calls (and the buffer swap) release the GIL while they run,
+so the Python work of the worker thread overlaps with them.
+
+The prepared data is handed over through two FramePacket instances: the worker thread fills one of them, while
+the main thread submits the other one.
+
+The preparation function must hold the World lock (see World.lock) while it reads the World, and changes that the
+main thread makes while a frame may be in preparation must hold it as well. Otherwise, a frame could see a change
+that is only partially applied.
+
+Note that user input that is received while submitting frame N takes effect in frame N+2, and that renderables
+that read World variables while rendering see the values of the frame being prepared.
+"""
+
+import queue
+import threading
+
+
+class FramePacket:
+    """The data that is needed to submit a frame."""
+
+    def __init__(self):
+        self.frame = None
+        self.clock_time = None
+        self.projection_matrix = None  # None if there is nothing to render (e.g., a minimized window).
+        self.view_matrix = None
+        self.draws = []  # The (renderable, model matrix) pairs to render.
+
+
+class FramePipeline:
+    """Prepare frames on a worker thread, using double-buffered frame packets."""
+
+    def __init__(self, prepare_func):
+        """Create the pipeline and start its worker thread.
+
+        The 'prepare_func' function is called on the worker thread with the FramePacket to fill.
+        """
+        self._prepare_func = prepare_func
+        self._frame_packets = (FramePacket(), FramePacket())
+        self._requests = queue.Queue(maxsize=1)
+        self._results = queue.Queue(maxsize=1)
+        self._thread = threading.Thread(target=self._run, name="FramePreparation", daemon=True)
+        self._thread.start()
+
+    def request(self, frame: int) -> None:
+        """Start preparing the given frame on the worker thread."""
+        frame_packet = self._frame_packets[frame % 2]
+        frame_packet.frame = frame
+        self._requests.put(frame_packet)
+
+    def wait(self) -> FramePacket:
+        """Wait until the requested frame is prepared, and return its frame packet.
+
+        An exception raised while preparing the frame is re-raised here.
+        """
+        (frame_packet, exception) = self._results.get()
+        if exception is not None:
+            raise exception
+        return frame_packet
+
+    def close(self) -> None:
+        """Stop the worker thread, after it finishes the frame it is preparing."""
+        self._requests.put(None)
+        self._thread.join()
+
+    def _run(self) -> None:
+        while True:
+            frame_packet = self._requests.get()
+            if frame_packet is None:
+                break
+            try:
+                self._prepare_func(frame_packet)
+            except BaseException as exception:
+                self._results.put((frame_packet, exception))
+            else:
+                self._results.put((frame_packet, None))
@@ -0,0 +1,60 @@
+"""Record keyboard input to a file, and replay it.
+
+A recording is a text file with one JSON object per line. There are two kinds of records:
+
+    {"frame": 12, "time": 0.2}                                               (the clock time of a frame)
+    {"frame": 12, "key": 262, "scancode": 114, "action": 1, "mods": 0}       (a keyboard event)
+
+Keyboard events are tagged with the frame during which they were received. When replaying, they are
+delivered at the same point of the same frame. Combined with a ScriptedClock that follows the recorded
+frame times, this reproduces the exact frame sequence of the recorded run.
+"""
+
+import json
+
+
+class InputRecorder:
+    """Write frame times and keyboard events to a recording file."""
+
+    def __init__(self, filename: str):
+        self._file = open(filename, "w")
+
+    def close(self) -> None:
+        self._file.close()
+
+    def record_frame(self, frame: int, time: float) -> None:
+        self._write({"frame": frame, "time": time})
+
+    def record_keyboard_event(self, frame: int, key: int, scancode: int, action: int, mods: int) -> None:
+        self._write({"frame": frame, "key": key, "scancode": scancode, "action": action, "mods": mods})
+
+    def _write(self, record: dict) -> None:
+        print(json.dumps(record), file=self._file)
+
+
+class InputReplayer:
+    """Read a recording file, and provide its frame times and keyboard events."""
+
+    def __init__(self, filename: str):
+
+        self._frame_times = []
+        self._keyboard_events = {}
+
+        with open(filename, "r") as fi:
+            for line in fi:
+                record = json.loads(line)
+                if "time" in record:
+                    self._frame_times.append(record["time"])
+                else:
+                    event = (record["key"], record["scancode"], record["action"], record["mods"])
+                    self._keyboard_events.setdefault(record["frame"], []).append(event)
+
+    def frame_times(self) -> list[float]:
+        return self._frame_times
+
+    def frame_count(self) -> int:
+        return len(self._frame_times)
+
+    def keyboard_events(self, frame: int) -> list[tuple[int, int, int, int]]:
+        """Return the (key, scancode, action, mods) keyboard events received during the given frame."""
+        return self._keyboard_events.get(frame, [])
@@ -0,0 +1,134 @@
+"""Low-overhead bindings for the OpenGL functions that are called every frame.
+
+PyOpenGL wraps every call with argument conversion and error checking. For per-frame calls (uniform uploads,
+binds and draws), that overhead dominates the CPU time of a frame with many small draws.
+
+This module provides the 'gl_fast' object. After an OpenGL context has been made current, calling
+
+    gl_fast.resolve()
+
+replaces its functions by ctypes functions that call the raw OpenGL function pointers directly, with fixed
+argument types and without error checking. Calling gl_fast.resolve(error_checking=True) adds a glGetError()
+check after each call, for debugging.
+
+The function names and argument order are those of PyOpenGL, so client code can do:
+
+    from utilities.opengl_fast_path import gl_fast
+
+    gl_fast.glUniform1ui(self._color_mode_location, self.color_mode)
+
+Array arguments must be C-contiguous numpy arrays; arrays of floats must have dtype np.float32.
+Until resolve() is called, the PyOpenGL functions are used.
+"""
+
+import ctypes
+
+import numpy as np
+
+from OpenGL import platform
+
+from . import opengl_symbols
+
+# OpenGL types.
+
+GLenum = ctypes.c_uint
+GLboolean = ctypes.c_ubyte
+GLint = ctypes.c_int
+GLuint = ctypes.c_uint
+GLsizei = ctypes.c_int
+GLfloat = ctypes.c_float
+GLintptr = ctypes.c_ssize_t
+GLsizeiptr = ctypes.c_ssize_t
+
+# Pointer types that accept numpy arrays.
+
+GLfloat_array = np.ctypeslib.ndpointer(dtype=np.float32, flags="C_CONTIGUOUS")
+GLvoid_array = np.ctypeslib.ndpointer(flags="C_CONTIGUOUS")
+
+# The argument types of the functions that have a fast path. All of these functions return void.
+
+FAST_PATH_SIGNATURES = {
+    "glUseProgram": (GLuint, ),
+    "glBindVertexArray": (GLuint, ),
+    "glActiveTexture": (GLenum, ),
+    "glBindTexture": (GLenum, GLuint),
+    "glEnable": (GLenum, ),
+    "glDisable": (GLenum, ),
+    "glBlendFunc": (GLenum, GLenum),
+    "glBindFramebuffer": (GLenum, GLuint),
+    "glViewport": (GLint, GLint, GLsizei, GLsizei),
+    "glUniform1f": (GLint, GLfloat),
+    "glUniform2f": (GLint, GLfloat, GLfloat),
+    "glUniform4f": (GLint, GLfloat, GLfloat, GLfloat, GLfloat),
+    "glUniform1ui": (GLint, GLuint),
+    "glUniform2ui": (GLint, GLuint, GLuint),
+    "glUniform4fv": (GLint, GLsizei, GLfloat_array),
+    "glUniformMatrix4fv": (GLint, GLsizei, GLboolean, GLfloat_array),
+    "glBufferSubData": (GLenum, GLintptr, GLsizeiptr, GLvoid_array),
+    "glDrawArrays": (GLenum, GLint, GLsizei),
+    "glDrawArraysInstanced": (GLenum, GLint, GLsizei, GLsizei),
+    "glBeginQuery": (GLenum, GLuint),
+    "glEndQuery": (GLenum, )
+}
+
+
+def get_function_address(name: str) -> int:
+    """Find the address of an OpenGL function in the current context."""
+
+    address = platform.PLATFORM.getExtensionProcedure(name.encode())
+
+    if not address:
+        # OpenGL 1.1 functions are not always available through the extension mechanism (e.g., on Windows).
+        # Look them up in the OpenGL library itself.
+        try:
+            address = getattr(platform.PLATFORM.GL, name)
+        except AttributeError:
+            raise RuntimeError("Unable to resolve OpenGL function {!r}.".format(name)) from None
+
+    if not isinstance(address, int):
+        address = ctypes.cast(address, ctypes.c_void_p).value
+
+    return address
+
+
+def make_raw_function(name: str, restype, argtypes):
+    """Make a ctypes function that calls the given OpenGL function directly."""
+    function_type = platform.PLATFORM.functionTypeFor(platform.PLATFORM.GL)
+    return function_type(restype, *argtypes)(get_function_address(name))
+
+
+class OpenGLFastPath:
+    """Per-frame OpenGL functions, called through raw function pointers once resolved."""
+
+    def __init__(self):
+        self.resolved = False
+        for name in FAST_PATH_SIGNATURES:
+            setattr(self, name, getattr(opengl_symbols, name))
+
+    def resolve(self, error_checking: bool = False) -> None:
+        """Resolve the raw function pointers. This requires a current OpenGL context."""
+
+        gl_get_error = make_raw_function("glGetError", GLenum, ())
+
+        for (name, argtypes) in FAST_PATH_SIGNATURES.items():
+            raw_function = make_raw_function(name, None, argtypes)
+            if error_checking:
+                raw_function = OpenGLFastPath._error_checked(name, raw_function, gl_get_error)
+            setattr(self, name, raw_function)
+
+        self.resolved = True
+
+    @staticmethod
+    def _error_checked(name: str, raw_function, gl_get_error):
+        """Wrap a raw function so it raises an exception if it causes an OpenGL error."""
+
+        def error_checked_function(*args):
+            raw_function(*args)
+            error = gl_get_error()
+            if error != 0:
+                raise RuntimeError("OpenGL error 0x{:04x} in {}{}.".format(error, name, args))
+
+        return error_checked_function
+
+
+gl_fast = OpenGLFastPath()
@@ -0,0 +1,118 @@
+"""This module implements the OpenGLStateCache class.
+
+Each PyOpenGL call has a significant Python overhead, and renderables tend to set the same state every frame.
+The state cache remembers the current program, vertex array, texture bindings, enabled capabilities and blend
+function, and only issues an OpenGL call if it actually changes the state.
+
+Renderables access the cache through the module-level 'gl_state' instance:
+
+    from utilities.opengl_state import gl_state
+
+    gl_state.use_program(self._shader_program)
+
+Note that OpenGL calls that bypass the cache make it go out of sync with the actual OpenGL state.
+After such calls (e.g. when creating OpenGL objects), call gl_state.invalidate().
+"""
+
+from .opengl_symbols import *
+from .opengl_fast_path import gl_fast
+
+
+class OpenGLStateCache:
+    """Track OpenGL state to elide redundant state changes and binds."""
+
+    def __init__(self):
+        self._program = None
+        self._vertex_array = None
+        self._active_texture = None
+        self._textures = {}
+        self._capabilities = {}
+        self._blend_func = None
+        self._issued = 0
+        self._skipped = 0
+
+    def invalidate(self) -> None:
+        """Forget all tracked state. The next request for each state will be issued unconditionally."""
+        self._program = None
+        self._vertex_array = None
+        self._active_texture = None
+        self._textures.clear()
+        self._capabilities.clear()
+        self._blend_func = None
+
+    def end_frame(self) -> tuple[int, int]:
+        """Return the number of issued and skipped calls since the previous call, and reset the counters."""
+        counts = (self._issued, self._skipped)
+        self._issued = 0
+        self._skipped = 0
+        return counts
+
+    def use_program(self, program: int) -> None:
+        if program == self._program:
+            self._skipped += 1
+            return
+        gl_fast.glUseProgram(program)
+        self._program = program
+        self._issued += 1
+
+    def bind_vertex_array(self, vertex_array: int) -> None:
+        if vertex_array == self._vertex_array:
+            self._skipped += 1
+            return
+        gl_fast.glBindVertexArray(vertex_array)
+        self._vertex_array = vertex_array
+        self._issued += 1
+
+    def active_texture(self, texture_unit: int) -> None:
+        if texture_unit == self._active_texture:
+            self._skipped += 1
+            return
+        gl_fast.glActiveTexture(texture_unit)
+        self._active_texture = texture_unit
+        self._issued += 1
+
+    def bind_texture(self, target: int, texture: int) -> None:
+        """Bind a texture to the active texture unit."""
+        key = (self._active_texture, target)
+        if self._active_texture is not None and self._textures.get(key) == texture:
+            self._skipped += 1
+            return
+        gl_fast.glBindTexture(target, texture)
+        if self._active_texture is not None:
+            self._textures[key] = texture
+        self._issued += 1
+
+    def enable(self, capability: int) -> None:
+        if self._capabilities.get(capability) is True:
+            self._skipped += 1
+            return
+        gl_fast.glEnable(capability)
+        self._capabilities[capability] = True
+        self._issued += 1
+
+    def disable(self, capability: int) -> None:
+        if self._capabilities.get(capability) is False:
+            self._skipped += 1
+            return
+        gl_fast.glDisable(capability)
+        self._capabilities[capability] = False
+        self._issued += 1
+
+    def is_enabled(self, capability: int) -> bool:
+        enabled = self._capabilities.get(capability)
+        if enabled is None:
+            enabled = bool(glIsEnabled(capability))
+            self._capabilities[capability] = enabled
+        return enabled
+
+    def blend_func(self, source_factor: int, destination_factor: int) -> None:
+        blend_func = (source_factor, destination_factor)
+        if blend_func == self._blend_func:
+            self._skipped += 1
+            return
+        gl_fast.glBlendFunc(source_factor, destination_factor)
+        self._blend_func = blend_func
+        self._issued += 1
+
+
+gl_state = OpenGLStateCache()
@@ -31,6 +31,7 @@ from OpenGL.GL import (
     GL_CULL_FACE,
     GL_TRIANGLES,
     GL_TEXTURE_2D,
+    GL_TEXTURE_2D_ARRAY,
     GL_TEXTURE_WRAP_S,
     GL_TEXTURE_WRAP_T,
     GL_TEXTURE_MAG_FILTER,
@@ -38,6 +39,7 @@ from OpenGL.GL import (
     GL_LINEAR,
     GL_REPEAT,
     GL_RGB,
+    GL_RGB8,
     GL_UNSIGNED_BYTE,
     GL_TRIANGLE_STRIP,
     GL_DEPTH_TEST,
@@ -54,6 +56,31 @@ from OpenGL.GL import (
     GL_MULTISAMPLE,
     GL_SRC_ALPHA,
     GL_ONE_MINUS_SRC_ALPHA,
+    GL_DYNAMIC_DRAW,
+    GL_RED,
+    GL_NEAREST,
+    GL_CLAMP_TO_EDGE,
+    GL_UNPACK_ALIGNMENT,
+    GL_TEXTURE0,
+    GL_RGBA8,
+    GL_FRAMEBUFFER,
+    GL_RENDERBUFFER,
+    GL_COLOR_ATTACHMENT0,
+    GL_DEPTH_ATTACHMENT,
+    GL_DEPTH_COMPONENT24,
+    GL_FRAMEBUFFER_COMPLETE,
+    GL_SAMPLES_PASSED,
+    GL_QUERY_RESULT,
+    GL_QUERY_RESULT_AVAILABLE,
+    GL_TEXTURE1,
+    GL_TEXTURE_BUFFER,
+    GL_R8UI,
+    GL_RG32UI,
+    GL_RG_INTEGER,
+    GL_UNSIGNED_INT,
+    GL_COLOR,
+    GL_DRAW_FRAMEBUFFER_BINDING,
+    GL_VIEWPORT,
 
     # OpenGL functions.
 
@@ -67,7 +94,7 @@ from OpenGL.GL import (
     glGetShaderiv,
     glGetProgramiv,
     glUseProgram,
-    glUniform1f, glUniform1ui, glUniform2ui, glUniformMatrix4fv,
+    glUniform1f, glUniform1i, glUniform1ui, glUniform2f, glUniform2ui, glUniform3fv, glUniform4f, glUniform4fv, glUniformMatrix4fv,
     glDeleteProgram,
     glDeleteShader,
     glGetShaderInfoLog,
@@ -75,6 +102,7 @@ from OpenGL.GL import (
     #
     glGenVertexArrays, glVertexAttribPointer,
     glVertexAttribIPointer,
+    glVertexAttribDivisor,
     glEnableVertexAttribArray,
     glDrawArraysInstanced,
     glDeleteVertexArrays,
@@ -83,14 +111,33 @@ from OpenGL.GL import (
     glGenBuffers,
     glBindBuffer,
     glBufferData,
+    glBufferSubData,
     glDeleteBuffers,
     #
     glGenTextures, glDeleteTextures,
     glTexParameteri,
     glBindTexture,
+    glActiveTexture,
     glTexImage2D,
     glTexSubImage2D,
+    glTexImage3D,
+    glTexSubImage3D,
+    glTexBuffer,
     glGenerateMipmap,
+    glPixelStorei,
+    #
+    glGenFramebuffers, glDeleteFramebuffers,
+    glBindFramebuffer,
+    glFramebufferTexture2D,
+    glFramebufferRenderbuffer,
+    glCheckFramebufferStatus,
+    glGenRenderbuffers, glDeleteRenderbuffers,
+    glBindRenderbuffer,
+    glRenderbufferStorage,
+    #
+    glGenQueries, glDeleteQueries,
+    glBeginQuery, glEndQuery,
+    glGetQueryObjectuiv,
     #
     glEnable, glDisable, glIsEnabled,
     glDrawArrays,
@@ -98,6 +145,10 @@ from OpenGL.GL import (
     glClearColor,
     glCullFace,
     glClear,
+    glClearBufferuiv,
+    glReadPixels,
+    glGetIntegerv,
+    glFinish,
     glViewport,
     glBlendFunc,
     glGetError
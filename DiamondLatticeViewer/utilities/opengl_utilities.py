@@ -8,8 +8,11 @@ import numpy as np
 from .opengl_symbols import *
 
 
-def make_shader(filename: str, shader_type):
-    """Read a shader source from disk and compile it."""
+def make_shader(filename: str, shader_type, defines=()):
+    """Read a shader source from disk and compile it.
+
+    The given preprocessor macros are defined directly after the #version line of the source.
+    """
     try:
         with open(filename, "rb") as fi:
             shader_source = fi.read()
@@ -17,6 +20,13 @@ def make_shader(filename: str, shader_type):
         print("Shader source not found: {!r} from {!r}".format(filename, os.getcwd()))
         return None
 
+    if defines:
+        # The #version directive must come first, so the macros go directly after it.
+        version_index = shader_source.index(b"#version")
+        version_end = shader_source.index(b"\n", version_index) + 1
+        define_lines = b"".join("#define {}\n".format(define).encode() for define in defines)
+        shader_source = shader_source[:version_end] + define_lines + shader_source[version_end:]
+
     shader = None
     try:
         shader = glCreateShader(shader_type)
@@ -39,7 +49,12 @@ def make_shader(filename: str, shader_type):
     return shader
 
 
-def create_opengl_program(prefix: str) -> tuple:
+def create_opengl_program(prefix: str, variant: str = None, defines=()) -> tuple:
+    """Compile and link the shaders {prefix}_v.glsl, {prefix}_g.glsl, and {prefix}_f.glsl, as far as they exist.
+
+    For a variant, a shader {prefix}_{variant}_{letter}.glsl replaces the corresponding shader, if it exists.
+    The given preprocessor macros are defined in all shaders, so variants can share a source using #ifdef.
+    """
 
     shader_type_definitions = [
         ("v", GL_VERTEX_SHADER),
@@ -55,7 +70,12 @@ def create_opengl_program(prefix: str) -> tuple:
         shader_program = glCreateProgram()
 
         for (letter, shader_type) in shader_type_definitions:
-            shader = make_shader("{}_{}.glsl".format(prefix, letter), shader_type)
+            filename = "{}_{}.glsl".format(prefix, letter)
+            if variant is not None:
+                variant_filename = "{}_{}_{}.glsl".format(prefix, variant, letter)
+                if os.path.exists(variant_filename):
+                    filename = variant_filename
+            shader = make_shader(filename, shader_type, defines)
             if shader is not None:
                 shaders.append(shader)
 
@@ -82,10 +102,14 @@ def create_opengl_program(prefix: str) -> tuple:
     return shaders, shader_program
 
 
-def define_vertex_attributes(vbo_dtype, enable_flag: bool):
-    """Examine a numpy structured array dtype and declare and enable the corresponding vertex attributes."""
+def define_vertex_attributes(vbo_dtype, enable_flag: bool, first_attribute_index: int = 0, divisor: int = 0):
+    """Examine a numpy structured array dtype and declare and enable the corresponding vertex attributes.
 
-    for (attribute_index, field_info_tuple) in enumerate(vbo_dtype.fields.values()):
+    Attribute indices are assigned consecutively, starting at 'first_attribute_index'.
+    A nonzero 'divisor' declares the attributes as per-instance attributes.
+    """
+
+    for (attribute_index, field_info_tuple) in enumerate(vbo_dtype.fields.values(), start=first_attribute_index):
 
         field_dtype = field_info_tuple[0]
         field_offset = field_info_tuple[1]
@@ -128,6 +152,9 @@ def define_vertex_attributes(vbo_dtype, enable_flag: bool):
             case _:
                 raise RuntimeError("Unknown field type.")
 
+        if divisor != 0:
+            glVertexAttribDivisor(attribute_index, divisor)
+
         if enable_flag:
             glEnableVertexAttribArray(attribute_index)
 
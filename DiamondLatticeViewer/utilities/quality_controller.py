@@ -0,0 +1,122 @@
+"""This module implements the QualityController class.
+
+The quality controller keeps the frame time near a target by stepping through a ladder of quality levels.
+Each level is a set of values for the quality knobs, which are World variables:
+
+    msaa_enabled                    Multi-sample anti-aliasing on or off.
+    diamond_lattice_lod             Diamond lattice level of detail: 0 draws atoms and bonds, 1 draws atoms only.
+    diamond_lattice_region_scale    The fraction of the diamond lattice side length that is drawn.
+    render_scale                    The fraction of the framebuffer resolution at which the 3D models are rendered.
+
+To prevent oscillation, the controller uses hysteresis: the quality is lowered only if the smoothed frame time
+exceeds the target by a margin for a number of consecutive frames, and raised only if it stays well below the
+target for a longer period. After each change, the controller waits for the frame time to settle.
+"""
+
+# The quality levels, from highest to lowest quality.
+
+QUALITY_LEVELS = [
+    {"msaa_enabled": True, "render_scale": 1.0, "diamond_lattice_lod": 0, "diamond_lattice_region_scale": 1.0},
+    {"msaa_enabled": False, "render_scale": 1.0, "diamond_lattice_lod": 0, "diamond_lattice_region_scale": 1.0},
+    {"msaa_enabled": False, "render_scale": 0.75, "diamond_lattice_lod": 0, "diamond_lattice_region_scale": 1.0},
+    {"msaa_enabled": False, "render_scale": 0.75, "diamond_lattice_lod": 1, "diamond_lattice_region_scale": 1.0},
+    {"msaa_enabled": False, "render_scale": 0.5, "diamond_lattice_lod": 1, "diamond_lattice_region_scale": 1.0},
+    {"msaa_enabled": False, "render_scale": 0.5, "diamond_lattice_lod": 1, "diamond_lattice_region_scale": 0.75},
+    {"msaa_enabled": False, "render_scale": 0.5, "diamond_lattice_lod": 1, "diamond_lattice_region_scale": 0.5},
+    {"msaa_enabled": False, "render_scale": 0.35, "diamond_lattice_lod": 1, "diamond_lattice_region_scale": 0.35}
+]
+
+
+class QualityController:
+    """Adjust the quality knobs to keep the frame time near a target frame time."""
+
+    def __init__(self, world, target_frame_time: float,
+                 upper_margin: float = 0.15, lower_margin: float = 0.35,
+                 degrade_frames: int = 20, improve_frames: int = 120, settle_frames: int = 30,
+                 smoothing: float = 0.1):
+        """Create a quality controller.
+
+        The frame time is smoothed using an exponential moving average with the given smoothing factor.
+        The quality is lowered after 'degrade_frames' consecutive frames with a smoothed frame time above
+        target * (1 + upper_margin), and raised after 'improve_frames' consecutive frames with a smoothed frame
+        time below target * (1 - lower_margin).
+        """
+        self._world = world
+        self._target_frame_time = target_frame_time
+        self._upper_threshold = target_frame_time * (1.0 + upper_margin)
+        self._lower_threshold = target_frame_time * (1.0 - lower_margin)
+        self._degrade_frames = degrade_frames
+        self._improve_frames = improve_frames
+        self._settle_frames = settle_frames
+        self._smoothing = smoothing
+
+        self._smoothed_frame_time = None
+        self._slow_frame_count = 0
+        self._fast_frame_count = 0
+        self._settle_count = 0
+
+        # The values that the knobs had before the controller took over, e.g. as set by hand.
+        self._saved_settings = {name: world.get_variable(name) for name in QUALITY_LEVELS[0]}
+
+        self._level = 0
+        self._apply_level("initial")
+
+    def level(self) -> int:
+        return self._level
+
+    def close(self) -> None:
+        """Restore the settings from before the controller was created, e.g. when it is switched off."""
+        for (name, value) in self._saved_settings.items():
+            if value is not None:
+                self._world.set_variable(name, value)
+        self._world.set_variable("quality_status", "off")
+
+    def update(self, frame_time: float) -> None:
+        """Process the duration of the most recent frame, and change the quality level if needed."""
+
+        if self._smoothed_frame_time is None:
+            self._smoothed_frame_time = frame_time
+        else:
+            self._smoothed_frame_time += self._smoothing * (frame_time - self._smoothed_frame_time)
+
+        if self._settle_count > 0:
+            self._settle_count -= 1
+            return
+
+        if self._smoothed_frame_time > self._upper_threshold:
+            self._slow_frame_count += 1
+            self._fast_frame_count = 0
+        elif self._smoothed_frame_time < self._lower_threshold:
+            self._fast_frame_count += 1
+            self._slow_frame_count = 0
+        else:
+            self._slow_frame_count = 0
+            self._fast_frame_count = 0
+
+        if self._slow_frame_count >= self._degrade_frames and self._level < len(QUALITY_LEVELS) - 1:
+            self._level += 1
+            self._apply_level("lowered")
+        elif self._fast_frame_count >= self._improve_frames and self._level > 0:
+            self._level -= 1
+            self._apply_level("raised")
+
+    def _apply_level(self, decision: str) -> None:
+
+        for (name, value) in QUALITY_LEVELS[self._level].items():
+            self._world.set_variable(name, value)
+
+        if self._smoothed_frame_time is None:
+            reason = "target {:.1f} ms".format(self._target_frame_time * 1000.0)
+        else:
+            reason = "{:.1f} ms vs. target {:.1f} ms".format(
+                self._smoothed_frame_time * 1000.0, self._target_frame_time * 1000.0)
+
+        status = "{} to level {} ({})".format(decision, self._level, reason)
+
+        print("Quality controller: {}; settings: {}.".format(status, QUALITY_LEVELS[self._level]))
+
+        self._world.set_variable("quality_status", status)
+
+        self._slow_frame_count = 0
+        self._fast_frame_count = 0
+        self._settle_count = self._settle_frames
@@ -1,21 +1,37 @@
 """This module implements the World class."""
 
-from typing import Any
+import threading
+from typing import Any, Callable
 
-import glfw
+from .clocks import WallClock
 
 
 class World:
 
-    def __init__(self):
-        self._sample_time = glfw.get_time()
+    def __init__(self, clock=None):
+        if clock is None:
+            clock = WallClock()
+        self._clock = clock
+        self._sample_time = clock.get_time()
         self._alpha = 0.0
         self._beta = 1.0
         self._freeze_time = None  # None if not frozen.
         self._variables = {}
+        self._variable_types = {}
+        self._variable_versions = {}
+        self._subscribers = {}
+        self._all_subscribers = []
+        # A frame preparation thread holds the lock while it reads the World, and all changes of the World
+        # (including the callbacks of changed variables) hold it, so a frame never sees a half-applied change.
+        self.lock = threading.RLock()
 
     def sample_time(self):
-        self._sample_time = glfw.get_time()
+        with self.lock:
+            self._sample_time = self._clock.get_time()
+
+    def sampled_time(self) -> float:
+        """Return the clock time of the last sample_time() call."""
+        return self._sample_time
 
     def time(self):
         if self._freeze_time is not None:
@@ -23,35 +39,91 @@ class World:
         return self._alpha + self._beta * self._sample_time
 
     def set_realtime_factor(self, realtime_factor: float):
-        t = glfw.get_time()
-        # self._alpha + self._beta * t == new_alpha + rtf * t
-        # new_alpha == self._alpha + (self._beta - rtf) * t
-        self._alpha += (self._beta - realtime_factor) * t
-        self._beta = realtime_factor
+        with self.lock:
+            # Use the sampled time rather than the current clock time, so the change does not depend on when
+            # the event arrives during the frame. This keeps replays of recorded input identical.
+            t = self._sample_time
+            # self._alpha + self._beta * t == new_alpha + rtf * t
+            # new_alpha == self._alpha + (self._beta - rtf) * t
+            self._alpha += (self._beta - realtime_factor) * t
+            self._beta = realtime_factor
 
     def get_realtime_factor(self):
         return self._beta
 
     def set_freeze_status(self, freeze_status: bool):
-        if freeze_status:
-            # We're being asked to freeze time.
-            if self._freeze_time is None:
-                self._freeze_time = self.time()
-        else:
-            # We're being asked to unfreeze time.
-            if self._freeze_time is not None:
-                t = glfw.get_time()
-                # freeze_time == new_alpha + self._beta * t
-                # new_alpha = freeze_time - self._beta * t
-                self._alpha = self._freeze_time - self._beta * t
-                self._freeze_time = None
+        with self.lock:
+            if freeze_status:
+                # We're being asked to freeze time.
+                if self._freeze_time is None:
+                    self._freeze_time = self.time()
+            else:
+                # We're being asked to unfreeze time.
+                if self._freeze_time is not None:
+                    t = self._sample_time
+                    # freeze_time == new_alpha + self._beta * t
+                    # new_alpha = freeze_time - self._beta * t
+                    self._alpha = self._freeze_time - self._beta * t
+                    self._freeze_time = None
 
     def get_freeze_status(self) -> bool:
         return self._freeze_time is not None
 
     def set_variable(self, name: str, value: Any):
+        """Set a variable.
+
+        The type of a variable is determined when it is first set; setting it to a value of a different
+        type is an error. If the value changes, the version of the variable is incremented and the
+        subscribers of the variable are notified.
+        """
         # print("Setting variable {!r} to value {}.".format(name, value))
-        self._variables[name] = value
+
+        with self.lock:
+            variable_type = self._variable_types.get(name)
+            if variable_type is None:
+                self._variable_types[name] = type(value)
+            elif not isinstance(value, variable_type):
+                raise TypeError("Variable {!r} has type {}; cannot set it to a value of type {}.".format(
+                    name, variable_type.__name__, type(value).__name__))
+            elif World._is_unchanged(self._variables[name], value):
+                return
+
+            self._variables[name] = value
+            self._variable_versions[name] = self._variable_versions.get(name, 0) + 1
+
+            for callback in self._subscribers.get(name, ()):
+                callback(name, value)
+
+            for callback in self._all_subscribers:
+                callback(name, value)
 
     def get_variable(self, name):
         return self._variables.get(name)
+
+    def get_variable_version(self, name: str) -> int:
+        """Return the number of times the variable changed; zero if it has not been set."""
+        return self._variable_versions.get(name, 0)
+
+    def subscribe(self, name: str, callback: Callable[[str, Any], None]):
+        """Call callback(name, value) whenever the variable changes."""
+        self._subscribers.setdefault(name, []).append(callback)
+
+    def unsubscribe(self, name: str, callback: Callable[[str, Any], None]):
+        self._subscribers[name].remove(callback)
+
+    def subscribe_all(self, callback: Callable[[str, Any], None]):
+        """Call callback(name, value) whenever any variable changes."""
+        self._all_subscribers.append(callback)
+
+    def unsubscribe_all(self, callback: Callable[[str, Any], None]):
+        self._all_subscribers.remove(callback)
+
+    @staticmethod
+    def _is_unchanged(old_value: Any, new_value: Any) -> bool:
+        if old_value is new_value:
+            return True
+        try:
+            return bool(old_value == new_value)
+        except ValueError:
+            # Comparison doesn't yield a single truth value (e.g., for numpy arrays).
+            return False
@@ -4,6 +4,8 @@
 
 import math
 import time
+import json
+import decimal
 import contextlib
 from enum import Enum
 
@@ -12,6 +14,16 @@ import numpy as np
 import glfw
 from OpenGL.GL import *
 
+from mandelbrot_cpu import MandelbrotCpuEngine, colorize
+from progressive_state import ProgressiveState
+from perturbation import ReferenceOrbitTexture, precision_digits
+from tile_cache import IterationTileCache
+from present_target import PresentTarget
+from precision import Precision, SHADER_DEFINES, select_precision
+from iteration_buffer import IterationBuffer
+from palette_texture import PaletteTexture
+from palettes import PALETTES
+
 
 def video_mode_preference(mode) -> tuple[int, int]:
     return (mode.size.width * mode.size.height, mode.refresh_rate)
@@ -46,7 +58,31 @@ def create_glfw_fullscreen_window(exit_stack, monitor, version_major: int, versi
     return window
 
 
-def create_opengl_program(exit_stack):
+def read_fragment_shader_source(filename: str, defines=()) -> str:
+    """Read a fragment shader source file.
+
+    Lines of the form '#include "filename"' are replaced by the (recursively included) contents of that file, and
+    the given macros are defined right after the '#version' line.
+    """
+
+    with open(filename, "r") as fi:
+        lines = fi.read().splitlines()
+
+    source_lines = []
+
+    for line in lines:
+        if line.startswith("#include"):
+            include_filename = line.split('"')[1]
+            source_lines.extend(read_fragment_shader_source(include_filename).splitlines())
+        else:
+            source_lines.append(line)
+            if line.startswith("#version"):
+                source_lines.extend("#define {}".format(define) for define in defines)
+
+    return "\n".join(source_lines) + "\n"
+
+
+def create_opengl_program(exit_stack, fragment_shader_filename: str = "fragment_shader.glsl", defines=()):
 
     vertex_shader = glCreateShader(GL_VERTEX_SHADER)
     exit_stack.callback(glDeleteShader, vertex_shader)
@@ -63,8 +99,7 @@ def create_opengl_program(exit_stack):
 
     fragment_shader = glCreateShader(GL_FRAGMENT_SHADER)
     exit_stack.callback(glDeleteShader, fragment_shader)
-    with open("fragment_shader.glsl", "rb") as fi:
-        shader_source = fi.read()
+    shader_source = read_fragment_shader_source(fragment_shader_filename, defines)
     glShaderSource(fragment_shader, shader_source)
 
     glCompileShader(fragment_shader)
@@ -72,7 +107,7 @@ def create_opengl_program(exit_stack):
     if status != GL_TRUE:
         info = glGetShaderInfoLog(fragment_shader)
         print(info.decode())
-        raise RuntimeError("Error while compiling the fragment shader.")
+        raise RuntimeError("Error while compiling the fragment shader {!r}.".format(fragment_shader_filename))
 
     program = glCreateProgram()
     exit_stack.callback(glDeleteProgram, program)
@@ -137,19 +172,52 @@ class ControlMode(Enum):
 
 class MandelbrotRenderer:
 
+    # The uniform variables that describe the view. They are uploaded to every shader program that uses them.
+
+    PARAMETER_UNIFORMS = ("window_size", "map_center", "map_scale", "map_angle", "max_iterations", "interior_checks")
+
     def __init__(self):
-        self.map_center = (0.0, 0.0)
+        self.window_size = (0, 0)
+        self.map_center = (decimal.Decimal(0), decimal.Decimal(0))  # Arbitrary precision, for deep zoom.
         self.map_scale = 4.0
         self.map_angle = 0.0
         self.max_iterations = 256
+        self.interior_checks = True  # Cardioid and bulb tests, and periodicity checking.
         self.control_mode = ControlMode.MOVE_OBSERVER
+        self.validation_requested = False
+
+        # In progressive mode, each frame advances every unfinished pixel by at most 'iteration_budget' iterations.
+
+        self.progressive = False
+        self.iteration_budget = 256
+
+        # In deep zoom mode, the image is calculated using perturbation theory, relative to the map center.
+
+        self.deep_zoom = False
+
+        # In tiled mode, the view is snapped to a pixel lattice, and tiles of iteration counts are cached,
+        # so only newly exposed tiles are computed while panning.
+
+        self.tiled = True
+
+        # The precision of the direct and tiled kernels. If precision_mode is None, it is selected per view;
+        # native doubles are only preferred over the double-float emulation if measured to be at least as fast.
+
+        self.precision_mode = None
+        self.fast_doubles = None
+
+        # The kernels write escape values to the iteration buffer, which the palette pass colors. Changing the
+        # palette, or cycling it by 'palette_cycling_speed' entries per frame, only repeats the palette pass.
+
+        self.palette_name = "classic"
+        self.smooth_coloring = False
+        self.palette_offset = 0.0
+        self.palette_cycling = False
+        self.palette_cycling_speed = 0.5
 
-        self.window_size_shader_location = None
-        self.frame_counter_shader_location = None
-        self.map_center_shader_location = None
-        self.map_scale_shader_location = None
-        self.map_angle_shader_location = None
-        self.max_iterations_shader_location = None
+        # Uniform locations, per shader program.
+
+        self.uniform_locations = {}
 
     def key_callback(self, window, key: int, scancode: int, action: int, mods: int):
         if action in (glfw.PRESS, glfw.REPEAT):
@@ -160,69 +228,50 @@ class MandelbrotRenderer:
                             angle = math.radians(self.map_angle)
                         case ControlMode.MOVE_OBSERVED:
                             angle = math.radians(self.map_angle + 180)
-                    dx = 0.10 * math.cos(angle) * self.map_scale
-                    dy = 0.10 * math.sin(angle) * self.map_scale
-                    self.map_center = (self.map_center[0] + dx, self.map_center[1] + dy)
-                    glUniform2d(self.map_center_shader_location, self.map_center[0], self.map_center[1])
+                    self.move_center(angle)
                 case glfw.KEY_UP | glfw.KEY_W:
                     match self.control_mode:
                         case ControlMode.MOVE_OBSERVER:
                             angle = math.radians(self.map_angle + 90)
                         case ControlMode.MOVE_OBSERVED:
                             angle = math.radians(self.map_angle + 270)
-                    dx = 0.10 * math.cos(angle) * self.map_scale
-                    dy = 0.10 * math.sin(angle) * self.map_scale
-                    self.map_center = (self.map_center[0] + dx, self.map_center[1] + dy)
-                    glUniform2d(self.map_center_shader_location, self.map_center[0], self.map_center[1])
+                    self.move_center(angle)
                 case glfw.KEY_LEFT | glfw.KEY_A:
                     match self.control_mode:
                         case ControlMode.MOVE_OBSERVER:
                             angle = math.radians(self.map_angle + 180)
                         case ControlMode.MOVE_OBSERVED:
                             angle = math.radians(self.map_angle)
-                    dx = 0.10 * math.cos(angle) * self.map_scale
-                    dy = 0.10 * math.sin(angle) * self.map_scale
-                    self.map_center = (self.map_center[0] + dx, self.map_center[1] + dy)
-                    glUniform2d(self.map_center_shader_location, self.map_center[0], self.map_center[1])
+                    self.move_center(angle)
                 case glfw.KEY_DOWN | glfw.KEY_S:
                     match self.control_mode:
                         case ControlMode.MOVE_OBSERVER:
                             angle = math.radians(self.map_angle + 270)
                         case ControlMode.MOVE_OBSERVED:
                             angle = math.radians(self.map_angle + 90)
-                    dx = 0.10 * math.cos(angle) * self.map_scale
-                    dy = 0.10 * math.sin(angle) * self.map_scale
-                    self.map_center = (self.map_center[0] + dx, self.map_center[1] + dy)
-                    glUniform2d(self.map_center_shader_location, self.map_center[0], self.map_center[1])
+                    self.move_center(angle)
                 case glfw.KEY_X:
                     self.map_scale *= 0.75
-                    glUniform1d(self.map_scale_shader_location, self.map_scale)
                 case glfw.KEY_Z:
                     self.map_scale *= 1.5
-                    glUniform1d(self.map_scale_shader_location, self.map_scale)
                 case glfw.KEY_C:
                     self.max_iterations = max(1, self.max_iterations // 2)
-                    glUniform1ui(self.max_iterations_shader_location, self.max_iterations)
                 case glfw.KEY_V:
                     self.max_iterations *= 2
-                    glUniform1ui(self.max_iterations_shader_location, self.max_iterations)
                 case glfw.KEY_LEFT_BRACKET:
                     match self.control_mode:
                         case ControlMode.MOVE_OBSERVER:
                             self.map_angle += 10
                         case ControlMode.MOVE_OBSERVED:
                             self.map_angle -= 10
-                    glUniform1d(self.map_angle_shader_location, self.map_angle)
                 case glfw.KEY_RIGHT_BRACKET:
                     match self.control_mode:
                         case ControlMode.MOVE_OBSERVER:
                             self.map_angle -= 10
                         case ControlMode.MOVE_OBSERVED:
                             self.map_angle += 10
-                    glUniform1d(self.map_angle_shader_location, self.map_angle)
                 case glfw.KEY_BACKSLASH:
                     self.map_angle = 0.0
-                    glUniform1d(self.map_angle_shader_location, self.map_angle)
 
         if action == glfw.PRESS:
             match key:
@@ -232,6 +281,41 @@ class MandelbrotRenderer:
                             self.control_mode = ControlMode.MOVE_OBSERVED
                         case ControlMode.MOVE_OBSERVED:
                             self.control_mode = ControlMode.MOVE_OBSERVER
+                case glfw.KEY_K:
+                    self.validation_requested = True
+                case glfw.KEY_P:
+                    self.progressive = not self.progressive
+                    print("progressive mode:", self.progressive)
+                case glfw.KEY_G:
+                    self.deep_zoom = not self.deep_zoom
+                    print("deep zoom mode:", self.deep_zoom)
+                case glfw.KEY_T:
+                    self.tiled = not self.tiled
+                    print("tiled mode:", self.tiled)
+                case glfw.KEY_I:
+                    self.interior_checks = not self.interior_checks
+                    print("interior checks:", self.interior_checks)
+                case glfw.KEY_F:
+                    # Cycle through: automatic, float, double-float, double.
+                    modes = [None] + list(Precision)
+                    self.precision_mode = modes[(modes.index(self.precision_mode) + 1) % len(modes)]
+                    print("precision mode:", "automatic" if self.precision_mode is None else self.precision_mode.value)
+                case glfw.KEY_E:
+                    self.print_poster_export_command()
+                case glfw.KEY_J:
+                    self.append_keyframe("keyframes.json")
+                case glfw.KEY_N:
+                    names = list(PALETTES)
+                    self.palette_name = names[(names.index(self.palette_name) + 1) % len(names)]
+                    print("palette:", self.palette_name)
+                case glfw.KEY_M:
+                    self.smooth_coloring = not self.smooth_coloring
+                    print("smooth coloring:", self.smooth_coloring)
+                case glfw.KEY_O:
+                    self.palette_cycling = not self.palette_cycling
+                    if not self.palette_cycling:
+                        self.palette_offset = 0.0
+                    print("palette cycling:", self.palette_cycling)
                 case glfw.KEY_ESCAPE:
                     glfw.set_window_should_close(window, True)
 
@@ -239,9 +323,211 @@ class MandelbrotRenderer:
             self.map_center[0], self.map_center[1],
             self.map_scale, self.map_angle, self.max_iterations))
 
+    def validate(self, width: int, height: int):
+        """Compare the rendered image to the image computed by the CPU engine."""
+
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        gpu_image = glReadPixels(0, 0, width, height, GL_RGB, GL_UNSIGNED_BYTE)
+        gpu_image = np.frombuffer(gpu_image, dtype=np.uint8).reshape(height, width, 3)[::-1]
+
+        with MandelbrotCpuEngine(interior_checks=self.interior_checks) as engine:
+            map_center = (float(self.map_center[0]), float(self.map_center[1]))
+            iterations = engine.compute((width, height), map_center, self.map_scale, self.map_angle,
+                                        self.max_iterations)
+
+        cpu_image = colorize(iterations, self.max_iterations)
+
+        mismatch_count = np.count_nonzero((gpu_image != cpu_image).any(axis=2))
+
+        print("validation: {} of {} pixels differ between the GPU and the CPU engine.".format(
+            mismatch_count, width * height))
+
+        if self.tiled and not (self.deep_zoom or self.progressive):
+            print("note: tiled mode shifts the view by up to half a pixel; press T to validate the direct shader.")
+
+        if (self.palette_name, self.smooth_coloring, self.palette_offset) != ("classic", False, 0.0):
+            print("note: the CPU engine colors with the classic palette, without smoothing or cycling.")
+
+        if self.precision() != Precision.DOUBLE and not (self.deep_zoom or self.progressive):
+            print("note: the view is rendered in {} precision; the CPU engine uses double.".format(self.precision().value))
+
+    def print_poster_export_command(self):
+        """Print the command that exports the current view as a poster, with the aspect ratio of the window."""
+
+        # The poster is about 32k pixels along its shorter side.
+
+        factor = math.ceil(32768 / min(self.window_size))
+        (width, height) = (self.window_size[0] * factor, self.window_size[1] * factor)
+
+        interior_checks_option = "" if self.interior_checks else " --no-interior-checks"
+
+        print("poster export: python3 poster_export.py --size {} {} --center {} {} --scale {!r} --angle {!r} "
+              "--max-iterations {}{} --output poster.png".format(
+                width, height, self.map_center[0], self.map_center[1], self.map_scale, self.map_angle,
+                self.max_iterations, interior_checks_option))
+
+    def append_keyframe(self, filename: str):
+        """Append the current view to a keyframe file, for rendering a zoom animation (see zoom_animation.py)."""
+
+        try:
+            with open(filename, "r") as fi:
+                keyframes = json.load(fi)
+        except FileNotFoundError:
+            keyframes = []
+
+        keyframes.append({
+            "center": [float(self.map_center[0]), float(self.map_center[1])],
+            "scale": self.map_scale,
+            "angle": self.map_angle,
+            "max_iterations": self.max_iterations
+        })
+
+        with open(filename, "w") as fo:
+            json.dump(keyframes, fo, indent=4)
+
+        print("keyframe {} appended to {}.".format(len(keyframes), filename))
+
+    def move_center(self, angle: float):
+        """Move the map center by 10% of the map scale, in the given direction [radians]."""
+        with decimal.localcontext() as context:
+            context.prec = precision_digits(self.map_scale)
+            dx = decimal.Decimal(0.10 * math.cos(angle) * self.map_scale)
+            dy = decimal.Decimal(0.10 * math.sin(angle) * self.map_scale)
+            self.map_center = (self.map_center[0] + dx, self.map_center[1] + dy)
+
+    def precision(self) -> Precision:
+        """Return the precision of the direct and tiled kernels for the current view."""
+        if self.precision_mode is not None:
+            return self.precision_mode
+        return select_precision(self.map_center, self.map_scale, self.window_size, self.fast_doubles)
+
+    def measure_fast_doubles(self, programs, framebuffer) -> bool:
+        """Return whether native doubles are at least as fast as the double-float emulation.
+
+        The double and double-float programs both draw the current view a few times, into the given framebuffer.
+        The parameters must have been uploaded, and the vertex array object must be bound.
+        """
+
+        glBindFramebuffer(GL_FRAMEBUFFER, framebuffer)
+
+        durations = {}
+
+        for precision in (Precision.DOUBLE_FLOAT, Precision.DOUBLE):
+            glUseProgram(programs[precision])
+            durations[precision] = math.inf
+            for repeat in range(3):
+                glFinish()
+                t1 = time.monotonic()
+                glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+                glFinish()
+                t2 = time.monotonic()
+                durations[precision] = min(durations[precision], t2 - t1)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        print("kernel duration: double-float {:.3f} ms, double {:.3f} ms".format(
+            durations[Precision.DOUBLE_FLOAT] * 1e3, durations[Precision.DOUBLE] * 1e3))
+
+        return durations[Precision.DOUBLE] <= durations[Precision.DOUBLE_FLOAT]
+
+    def parameters(self) -> tuple:
+        """Return the values of the parameter uniforms. If they change, all pixels must be recomputed."""
+        return (self.window_size, self.map_center, self.map_scale, self.map_angle, self.max_iterations,
+                self.interior_checks)
+
+    def find_uniform_locations(self, program, names) -> None:
+        self.uniform_locations[program] = {name: glGetUniformLocation(program, name) for name in names}
+
+    def upload_parameters(self, program) -> None:
+        """Upload the parameter uniforms to the given shader program, which must be current."""
+        locations = self.uniform_locations[program]
+        glUniform2ui(locations["window_size"], self.window_size[0], self.window_size[1])
+        glUniform2d(locations["map_center"], float(self.map_center[0]), float(self.map_center[1]))
+        glUniform1d(locations["map_scale"], self.map_scale)
+        glUniform1d(locations["map_angle"], self.map_angle)
+        glUniform1ui(locations["max_iterations"], self.max_iterations)
+        glUniform1i(locations["interior_checks"], self.interior_checks)
+
+    def render_tiles(self, tile_cache, tile_framebuffer, tile_program, tile_composite_program, target_framebuffer,
+                     precision):
+        """Draw the view from cached tiles of escape values, computing only the tiles that are not cached."""
+
+        (width, height) = self.window_size
+        tile_size = tile_cache.tile_size
+
+        pixel_size = self.map_scale / min(width, height)
+
+        # The lattice coordinates of the map center: the center, rotated by -map_angle and divided by the pixel size.
+        # The angle is used in single precision, as in the shaders.
+
+        angle = np.float32(self.map_angle) * np.float32(math.pi / 180.0)
+        sin_angle = float(np.sin(angle))
+        cos_angle = float(np.cos(angle))
+
+        (cx, cy) = (float(self.map_center[0]), float(self.map_center[1]))
+
+        lattice_center_x = (cos_angle * cx + sin_angle * cy) / pixel_size
+        lattice_center_y = (-sin_angle * cx + cos_angle * cy) / pixel_size
+
+        # The lattice pixel shown in the bottom-left window pixel. Snapping to the lattice shifts the view by
+        # at most half a pixel.
+
+        origin_x = round(lattice_center_x - 0.5 * width)
+        origin_y = round(lattice_center_y - 0.5 * height)
+
+        tile_range_x = range(origin_x // tile_size, (origin_x + width - 1) // tile_size + 1)
+        tile_range_y = range(origin_y // tile_size, (origin_y + height - 1) // tile_size + 1)
+
+        hit_count = tile_cache.hit_count
+
+        for tile_y in tile_range_y:
+            for tile_x in tile_range_x:
+
+                key = (pixel_size, self.map_angle, self.max_iterations, self.interior_checks, precision, tile_x, tile_y)
+
+                texture = tile_cache.get(key)
+
+                if texture is None:
+
+                    # Compute the newly exposed tile.
+
+                    texture = tile_cache.allocate(key)
+
+                    glBindFramebuffer(GL_FRAMEBUFFER, tile_framebuffer)
+                    glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, texture, 0)
+                    glViewport(0, 0, tile_size, tile_size)
+
+                    glUseProgram(tile_program)
+                    glUniform2d(self.uniform_locations[tile_program]["tile_origin"], tile_x * tile_size, tile_y * tile_size)
+                    glUniform1d(self.uniform_locations[tile_program]["pixel_size"], pixel_size)
+
+                    glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+
+                    glBindFramebuffer(GL_FRAMEBUFFER, target_framebuffer)
+
+                # Draw the tile at its place in the window.
+
+                (tile_window_x, tile_window_y) = (tile_x * tile_size - origin_x, tile_y * tile_size - origin_y)
+
+                glViewport(tile_window_x, tile_window_y, tile_size, tile_size)
+
+                glUseProgram(tile_composite_program)
+                glUniform2i(self.uniform_locations[tile_composite_program]["tile_window_origin"], tile_window_x, tile_window_y)
+
+                glBindTexture(GL_TEXTURE_2D, texture)
+                glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glViewport(0, 0, width, height)
+
+        computed_count = len(tile_range_x) * len(tile_range_y) - (tile_cache.hit_count - hit_count)
+        if computed_count > 0:
+            print("tiles: {} computed, {} reused, {:.1f} MB cached".format(
+                computed_count, tile_cache.hit_count - hit_count, tile_cache.memory_usage() / 1024 ** 2))
+
     def framebuffer_size_callback(self, window, width: int, height: int):
         glViewport(0, 0, width, height)
-        glUniform2ui(self.window_size_shader_location, width, height)
+        self.window_size = (width, height)
 
     def run(self):
 
@@ -262,19 +548,78 @@ class MandelbrotRenderer:
 
             glfw.make_context_current(window)
 
-            # Create an OpenGL shader program and make it current.
+            # Create the OpenGL shader programs.
+            # The direct programs compute the image in a single pass; there is one for each kernel precision.
+            # The progressive programs advance the per-pixel iteration state, and display it.
 
-            program = create_opengl_program(exit_stack)
-            glUseProgram(program)
+            programs = {precision: create_opengl_program(exit_stack, "fragment_shader.glsl", [SHADER_DEFINES[precision]])
+                        for precision in Precision}
+            progressive_iterate_program = create_opengl_program(exit_stack, "progressive_iterate_fragment_shader.glsl")
+            progressive_display_program = create_opengl_program(exit_stack, "progressive_display_fragment_shader.glsl")
+            palette_program = create_opengl_program(exit_stack, "palette_fragment_shader.glsl")
+            perturbation_program = create_opengl_program(exit_stack, "perturbation_fragment_shader.glsl")
+            tile_programs = {precision: create_opengl_program(exit_stack, "tile_fragment_shader.glsl", [SHADER_DEFINES[precision]])
+                             for precision in Precision}
+            tile_composite_program = create_opengl_program(exit_stack, "tile_composite_fragment_shader.glsl")
 
             # Get locations of all uniform variables
 
-            self.window_size_shader_location = glGetUniformLocation(program, "window_size")
-            self.frame_counter_shader_location = glGetUniformLocation(program, "frame_counter")
-            self.map_center_shader_location = glGetUniformLocation(program, "map_center")
-            self.map_scale_shader_location = glGetUniformLocation(program, "map_scale")
-            self.map_angle_shader_location = glGetUniformLocation(program, "map_angle")
-            self.max_iterations_shader_location = glGetUniformLocation(program, "max_iterations")
+            for program in programs.values():
+                self.find_uniform_locations(program, self.PARAMETER_UNIFORMS)
+            self.find_uniform_locations(progressive_iterate_program, self.PARAMETER_UNIFORMS + ("iteration_budget", "state_z", "state_status"))
+            self.find_uniform_locations(progressive_display_program, self.PARAMETER_UNIFORMS + ("state_z", "state_status"))
+            self.find_uniform_locations(palette_program, self.PARAMETER_UNIFORMS + ("escape_values", "palette", "palette_offset", "smooth_coloring"))
+            self.find_uniform_locations(perturbation_program, self.PARAMETER_UNIFORMS + ("reference_orbit", "reference_orbit_length"))
+            for tile_program in tile_programs.values():
+                self.find_uniform_locations(tile_program, self.PARAMETER_UNIFORMS + ("tile_origin", "pixel_size"))
+            self.find_uniform_locations(tile_composite_program, ("tile_escape_values", "tile_window_origin"))
+
+            # The progressive state textures are read from texture units 0 (z) and 1 (status).
+
+            glUseProgram(progressive_iterate_program)
+            glUniform1i(self.uniform_locations[progressive_iterate_program]["state_z"], 0)
+            glUniform1i(self.uniform_locations[progressive_iterate_program]["state_status"], 1)
+
+            glUseProgram(progressive_display_program)
+            glUniform1i(self.uniform_locations[progressive_display_program]["state_z"], 0)
+            glUniform1i(self.uniform_locations[progressive_display_program]["state_status"], 1)
+
+            progressive_state = ProgressiveState()
+            exit_stack.callback(progressive_state.close)
+
+            # The reference orbit of the deep zoom mode is read from texture unit 2.
+
+            glUseProgram(perturbation_program)
+            glUniform1i(self.uniform_locations[perturbation_program]["reference_orbit"], 2)
+
+            reference_orbit_texture = ReferenceOrbitTexture()
+            exit_stack.callback(reference_orbit_texture.close)
+
+            # The tiles of the tiled mode are computed into the tile framebuffer, one at a time.
+
+            tile_cache = IterationTileCache()
+            exit_stack.callback(tile_cache.close)
+
+            tile_framebuffer = glGenFramebuffers(1)
+            exit_stack.callback(glDeleteFramebuffers, 1, (tile_framebuffer, ))
+
+            # The view is rendered into the present target only when it changes, and copied to the window each frame.
+
+            present_target = PresentTarget()
+            exit_stack.callback(present_target.close)
+
+            # The kernels write to the iteration buffer. The palette pass reads it from texture unit 3, and the
+            # palette from texture unit 4, and writes the colors to the present target.
+
+            iteration_buffer = IterationBuffer()
+            exit_stack.callback(iteration_buffer.close)
+
+            palette_texture = PaletteTexture()
+            exit_stack.callback(palette_texture.close)
+
+            glUseProgram(palette_program)
+            glUniform1i(self.uniform_locations[palette_program]["escape_values"], 3)
+            glUniform1i(self.uniform_locations[palette_program]["palette"], 4)
 
             # Register callbacks
 
@@ -284,11 +629,6 @@ class MandelbrotRenderer:
             viewport = glGetIntegerv(GL_VIEWPORT)
             self.framebuffer_size_callback(window, viewport[2], viewport[3])
 
-            glUniform2d(self.map_center_shader_location, self.map_center[0], self.map_center[1])
-            glUniform1d(self.map_scale_shader_location, self.map_scale)
-            glUniform1d(self.map_angle_shader_location, self.map_angle)
-            glUniform1ui(self.max_iterations_shader_location, self.max_iterations)
-
             # Create OpenGL Vertex Array Object
             vao = create_opengl_vertex_array_object(exit_stack)
 
@@ -301,19 +641,194 @@ class MandelbrotRenderer:
             frame_counter = 0
             t1 = time.monotonic()
 
+            uploaded_parameters = None
+
+            # The view that is currently held by the present target, and the number of progressive iteration
+            # frames since the last reset.
+
+            rendered_view = None
+            progressive_frame_count = 0
+
+            # The palette settings of the image in the present target.
+
+            rendered_coloring = None
+
+            shown_precision = None
+
             glClearColor(1.0, 1.0, 1.0, 1.0)
 
             while not glfw.window_should_close(window):
 
-                glUniform1ui(self.frame_counter_shader_location, frame_counter)
+                # Upload the parameters if they changed; the progressive iteration then starts over.
 
-                glBindVertexArray(vao)
-                glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
-                glBindVertexArray(0)
+                parameters = self.parameters()
+                if parameters != uploaded_parameters:
+                    for parameter_program in (*programs.values(), progressive_iterate_program, progressive_display_program,
+                                              perturbation_program, *tile_programs.values(), palette_program):
+                        glUseProgram(parameter_program)
+                        self.upload_parameters(parameter_program)
+                    if progressive_state.size != self.window_size:
+                        progressive_state.allocate(*self.window_size)
+                        present_target.allocate(*self.window_size)
+                        iteration_buffer.allocate(*self.window_size)
+                    else:
+                        progressive_state.reset()
+                    progressive_frame_count = 0
+                    uploaded_parameters = parameters
+
+                # Measure the speed of native doubles once, on the initial view.
+
+                if self.fast_doubles is None:
+                    glBindVertexArray(vao)
+                    self.fast_doubles = self.measure_fast_doubles(programs, iteration_buffer.framebuffer)
+                    glBindVertexArray(0)
+
+                precision = self.precision()
+                if precision != shown_precision:
+                    print("precision:", precision.value)
+                    shown_precision = precision
+
+                view = (parameters, self.deep_zoom, self.progressive, self.tiled, precision)
+
+                # The progressive iteration is finished once every pixel received max_iterations iterations.
+
+                progressive_pending = self.progressive and not self.deep_zoom and \
+                    progressive_frame_count * self.iteration_budget < self.max_iterations
+
+                render_needed = (view != rendered_view) or progressive_pending
+
+                if render_needed:
+
+                    glBindFramebuffer(GL_FRAMEBUFFER, iteration_buffer.framebuffer)
+
+                    glBindVertexArray(vao)
+
+                    if self.deep_zoom:
+
+                        # The reference orbit is only re-calculated if the center, iteration count or precision changed.
+
+                        reference_orbit_texture.update(self.map_center, self.max_iterations, self.map_scale)
+
+                        glUseProgram(perturbation_program)
+                        glUniform1ui(self.uniform_locations[perturbation_program]["reference_orbit_length"], reference_orbit_texture.length)
+
+                        glActiveTexture(GL_TEXTURE2)
+                        glBindTexture(GL_TEXTURE_BUFFER, reference_orbit_texture.texture)
+
+                        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+
+                        glBindTexture(GL_TEXTURE_BUFFER, 0)
+                        glActiveTexture(GL_TEXTURE0)
+
+                    elif self.progressive:
+
+                        # Advance the iteration state, from the source to the destination framebuffer.
+
+                        glUseProgram(progressive_iterate_program)
+                        glUniform1ui(self.uniform_locations[progressive_iterate_program]["iteration_budget"], self.iteration_budget)
+
+                        (state_z_texture, state_status_texture) = progressive_state.source_textures()
+                        glActiveTexture(GL_TEXTURE0)
+                        glBindTexture(GL_TEXTURE_2D, state_z_texture)
+                        glActiveTexture(GL_TEXTURE1)
+                        glBindTexture(GL_TEXTURE_2D, state_status_texture)
+
+                        glBindFramebuffer(GL_FRAMEBUFFER, progressive_state.destination_framebuffer())
+                        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+                        glBindFramebuffer(GL_FRAMEBUFFER, iteration_buffer.framebuffer)
+
+                        progressive_state.swap()
+                        progressive_frame_count += 1
+
+                        # Write the partial result to the iteration buffer.
+
+                        glUseProgram(progressive_display_program)
+
+                        (state_z_texture, state_status_texture) = progressive_state.source_textures()
+                        glBindTexture(GL_TEXTURE_2D, state_status_texture)
+                        glActiveTexture(GL_TEXTURE0)
+                        glBindTexture(GL_TEXTURE_2D, state_z_texture)
+                        glActiveTexture(GL_TEXTURE1)
+
+                        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+
+                        glBindTexture(GL_TEXTURE_2D, 0)
+                        glActiveTexture(GL_TEXTURE0)
+                        glBindTexture(GL_TEXTURE_2D, 0)
+
+                    elif self.tiled:
+
+                        self.render_tiles(tile_cache, tile_framebuffer, tile_programs[precision], tile_composite_program,
+                                          iteration_buffer.framebuffer, precision)
+
+                    else:
+
+                        glUseProgram(programs[precision])
+
+                        glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+
+                    glBindVertexArray(0)
+
+                    glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+                    rendered_view = view
+                    frame_counter += 1
+
+                # Color the escape values, if they or the palette settings changed.
+
+                if self.palette_cycling:
+                    self.palette_offset += self.palette_cycling_speed
+
+                coloring = (self.palette_name, self.smooth_coloring, self.palette_offset)
+
+                if render_needed or coloring != rendered_coloring:
+
+                    palette_texture.update(self.palette_name)
+
+                    glBindFramebuffer(GL_FRAMEBUFFER, present_target.framebuffer)
+
+                    glUseProgram(palette_program)
+                    glUniform1f(self.uniform_locations[palette_program]["palette_offset"], self.palette_offset)
+                    glUniform1i(self.uniform_locations[palette_program]["smooth_coloring"], self.smooth_coloring)
+
+                    glActiveTexture(GL_TEXTURE3)
+                    glBindTexture(GL_TEXTURE_2D, iteration_buffer.texture)
+                    glActiveTexture(GL_TEXTURE4)
+                    glBindTexture(GL_TEXTURE_1D, palette_texture.texture)
+
+                    glBindVertexArray(vao)
+                    glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+                    glBindVertexArray(0)
+
+                    glBindTexture(GL_TEXTURE_1D, 0)
+                    glActiveTexture(GL_TEXTURE3)
+                    glBindTexture(GL_TEXTURE_2D, 0)
+                    glActiveTexture(GL_TEXTURE0)
+
+                    glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+                    rendered_coloring = coloring
+
+                if self.validation_requested:
+                    (width, height) = glfw.get_framebuffer_size(window)
+                    glBindFramebuffer(GL_READ_FRAMEBUFFER, present_target.framebuffer)
+                    self.validate(width, height)
+                    glBindFramebuffer(GL_READ_FRAMEBUFFER, 0)
+                    self.validation_requested = False
+
+                # Re-presenting the view is a cheap copy, independent of the iteration count.
+
+                present_target.present()
 
                 glfw.swap_buffers(window)
-                glfw.poll_events()
-                frame_counter += 1
+
+                # Block until the next event if the view is complete; keep going while the progressive iteration or
+                # the palette cycling runs.
+
+                if progressive_pending or self.palette_cycling:
+                    glfw.poll_events()
+                else:
+                    glfw.wait_events()
 
             t2 = time.monotonic()
             duration = (t2 - t1)
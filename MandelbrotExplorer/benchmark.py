@@ -0,0 +1,186 @@
+#! /usr/bin/env python3
+
+"""Benchmark suite for the Mandelbrot engines, on a fixed catalogue of views.
+
+Each view of the catalogue is computed at several max_iterations, by the GPU kernel (see benchmark_gpu.py), the
+CPU engine, or both. Every measurement is repeated, and the shortest duration is kept. The primary metrics are
+the duration in seconds and the speed in pixels per second.
+
+For reference, the nominal iterations are also reported: the sum of the iteration counts of all pixels, as returned
+by the engine. Points that the interior checks recognize are not iterated, but count with max_iterations, so the
+nominal iterations are not the work actually performed. Nominal iteration rates are inflated on interior-heavy
+views, and cannot be compared between runs with and without interior checks; compare the pixel rates instead.
+
+The results are written as JSON, to stdout or to a file. Diagnostic output goes to stderr.
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from mandelbrot_cpu import MandelbrotCpuEngine
+from precision import Precision
+
+# The catalogue of views: map center and map scale.
+
+BENCHMARK_VIEWS = {
+    "full-set": ((-0.5, 0.0), 3.0),
+    "seahorse-valley": ((-0.7453, 0.1127), 0.01),
+    "deep-minibrot": ((-1.423501285988552, 0.013263144068274996), 2.0e-7),  # A period-20 minibrot.
+    "interior-heavy": ((-0.2, 0.0), 1.2)
+}
+
+BENCHMARK_MAX_ITERATIONS = (256, 1024, 4096)
+
+
+def benchmark_result(engine: str, view_name: str, max_iterations: int, window_size: tuple[int, int],
+                     duration: float, iterations: np.ndarray, **details) -> dict:
+    """Return the JSON record of a single measurement."""
+
+    (width, height) = window_size
+
+    # Interior points that were not iterated count with max_iterations.
+    nominal_iterations = int(iterations.sum(dtype=np.uint64))
+
+    return {
+        "engine": engine,
+        **details,
+        "view": view_name,
+        "max_iterations": max_iterations,
+        "pixels": width * height,
+        "seconds": duration,
+        "pixels_per_second": width * height / duration,
+        "nominal_iterations": nominal_iterations,
+        "nominal_iterations_per_second": nominal_iterations / duration
+    }
+
+
+def benchmark_cpu(window_size: tuple[int, int], view_names, max_iterations_list, repeats: int,
+                  interior_checks: bool, workers: int = None) -> list[dict]:
+
+    results = []
+
+    with MandelbrotCpuEngine(workers, interior_checks=interior_checks, verbose=False) as engine:
+
+        # Start the worker processes before timing.
+
+        engine.compute((64, 64), (0.0, 0.0), 4.0, 0.0, 1)
+
+        for view_name in view_names:
+            (map_center, map_scale) = BENCHMARK_VIEWS[view_name]
+            for max_iterations in max_iterations_list:
+
+                duration = float("inf")
+                for repeat in range(repeats):
+                    t1 = time.monotonic()
+                    iterations = engine.compute(window_size, map_center, map_scale, 0.0, max_iterations)
+                    t2 = time.monotonic()
+                    duration = min(duration, t2 - t1)
+
+                result = benchmark_result("cpu", view_name, max_iterations, window_size, duration, iterations,
+                                          workers=engine.max_workers)
+                print("benchmark: cpu {} max {}: {:.3f} s".format(view_name, max_iterations, duration), file=sys.stderr)
+                results.append(result)
+
+    return results
+
+
+def benchmark_gpu(window_size: tuple[int, int], view_names, max_iterations_list, repeats: int,
+                  interior_checks: bool, precision_option: str) -> tuple[str, list[dict]]:
+    """Return the name of the OpenGL renderer, and the results."""
+
+    from benchmark_gpu import GpuKernelBenchmark
+
+    results = []
+
+    gpu_benchmark = GpuKernelBenchmark(window_size)
+
+    try:
+        for view_name in view_names:
+            (map_center, map_scale) = BENCHMARK_VIEWS[view_name]
+            for max_iterations in max_iterations_list:
+
+                gpu_benchmark.set_view(map_center, map_scale, 0.0, max_iterations, interior_checks)
+
+                # 'auto' measures the precision that the explorer selects for the view.
+
+                match precision_option:
+                    case "auto":
+                        precisions = [gpu_benchmark.selected_precision()]
+                    case "all":
+                        precisions = list(Precision)
+                    case _:
+                        precisions = [Precision(precision_option)]
+
+                for precision in precisions:
+                    (duration, iterations) = gpu_benchmark.run(precision, repeats)
+                    result = benchmark_result("gpu", view_name, max_iterations, window_size, duration, iterations,
+                                              precision=precision.value)
+                    print("benchmark: gpu {} max {} {}: {:.3f} s".format(
+                        view_name, max_iterations, precision.value, duration), file=sys.stderr)
+                    results.append(result)
+
+        return (gpu_benchmark.renderer_name, results)
+
+    finally:
+        gpu_benchmark.close()
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Benchmark the Mandelbrot engines on a fixed catalogue of views.")
+    parser.add_argument("--engines", nargs="+", choices=("gpu", "cpu"), default=("gpu", "cpu"))
+    parser.add_argument("--size", type=int, nargs=2, default=(1024, 768), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--views", nargs="+", choices=tuple(BENCHMARK_VIEWS), default=tuple(BENCHMARK_VIEWS))
+    parser.add_argument("--max-iterations", type=int, nargs="+", default=BENCHMARK_MAX_ITERATIONS)
+    parser.add_argument("--repeats", type=int, default=3, help="number of runs per measurement; the fastest counts")
+    parser.add_argument("--precision", choices=("auto", "all") + tuple(precision.value for precision in Precision),
+                        default="auto", help="kernel precision of the GPU engine (default: as selected per view)")
+    parser.add_argument("--workers", type=int, help="number of worker processes of the CPU engine (default: number of CPUs)")
+    parser.add_argument("--no-interior-checks", dest="interior_checks", action="store_false",
+                        help="iterate interior points in full")
+    parser.add_argument("--output", default="-", help="write the JSON results to this file (default: stdout)")
+
+    args = parser.parse_args()
+
+    window_size = tuple(args.size)
+
+    report = {
+        "window_size": window_size,
+        "repeats": args.repeats,
+        "interior_checks": args.interior_checks,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": []
+    }
+
+    # Keep stdout clean for the JSON results.
+
+    with contextlib.redirect_stdout(sys.stderr):
+
+        if "gpu" in args.engines:
+            (report["gpu_renderer"], results) = benchmark_gpu(window_size, args.views, args.max_iterations,
+                                                              args.repeats, args.interior_checks, args.precision)
+            report["results"].extend(results)
+
+        if "cpu" in args.engines:
+            results = benchmark_cpu(window_size, args.views, args.max_iterations, args.repeats,
+                                    args.interior_checks, args.workers)
+            report["results"].extend(results)
+
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=4)
+        print()
+    else:
+        with open(args.output, "w") as fo:
+            json.dump(report, fo, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Time the direct fragment shader on the GPU, for the benchmark suite.
+
+The kernel draws into an offscreen iteration buffer in a hidden GLFW window, and each draw is timed between two
+glFinish calls. Nothing is presented, so the timings are not capped by vsync, and the swap interval is 0 anyway.
+An OpenGL 4.1 capable display is required.
+"""
+
+import contextlib
+import math
+import time
+
+import numpy as np
+
+import glfw
+from OpenGL.GL import *
+
+from MandelbrotExplorer import MandelbrotRenderer, create_opengl_program, create_opengl_vertex_array_object
+from iteration_buffer import IterationBuffer
+from precision import Precision, SHADER_DEFINES, select_precision
+
+
+class GpuKernelBenchmark:
+    """Time the direct kernel, in each precision, for views of a fixed window size."""
+
+    def __init__(self, window_size: tuple[int, int]):
+
+        self.window_size = window_size
+
+        self._exit_stack = contextlib.ExitStack()
+
+        if not glfw.init():
+            raise RuntimeError("Unable to initialize GLFW.")
+        self._exit_stack.callback(glfw.terminate)
+
+        glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 4)
+        glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 1)
+        glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+        glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, GL_TRUE)
+        glfw.window_hint(glfw.VISIBLE, GL_FALSE)
+
+        window = glfw.create_window(64, 64, "Mandelbrot benchmark", None, None)
+        if not window:
+            raise RuntimeError("Unable to create window using GLFW.")
+        self._exit_stack.callback(glfw.destroy_window, window)
+
+        glfw.make_context_current(window)
+        glfw.swap_interval(0)
+
+        self.renderer_name = glGetString(GL_RENDERER).decode()
+
+        # The renderer holds the view, and uploads it to the programs.
+
+        self._renderer = MandelbrotRenderer()
+        self._renderer.window_size = window_size
+
+        self._programs = {precision: create_opengl_program(self._exit_stack, "fragment_shader.glsl",
+                                                           [SHADER_DEFINES[precision]])
+                          for precision in Precision}
+        for program in self._programs.values():
+            self._renderer.find_uniform_locations(program, MandelbrotRenderer.PARAMETER_UNIFORMS)
+
+        self._vao = create_opengl_vertex_array_object(self._exit_stack)
+
+        self._iteration_buffer = IterationBuffer()
+        self._exit_stack.callback(self._iteration_buffer.close)
+        self._iteration_buffer.allocate(*window_size)
+
+        # The viewport covers the iteration buffer, not the (smaller) hidden window.
+
+        glViewport(0, 0, *window_size)
+
+        self.fast_doubles = None
+
+    def close(self) -> None:
+        self._exit_stack.close()
+
+    def set_view(self, map_center: tuple[float, float], map_scale: float, map_angle: float, max_iterations: int,
+                 interior_checks: bool = True) -> None:
+        """Upload the view to all programs."""
+
+        self._renderer.map_center = map_center
+        self._renderer.map_scale = map_scale
+        self._renderer.map_angle = map_angle
+        self._renderer.max_iterations = max_iterations
+        self._renderer.interior_checks = interior_checks
+
+        for program in self._programs.values():
+            glUseProgram(program)
+            self._renderer.upload_parameters(program)
+        glUseProgram(0)
+
+        # Measure the speed of native doubles once, as the explorer does on its initial view.
+
+        if self.fast_doubles is None:
+            glBindVertexArray(self._vao)
+            self.fast_doubles = self._renderer.measure_fast_doubles(self._programs, self._iteration_buffer.framebuffer)
+            glBindVertexArray(0)
+
+    def selected_precision(self) -> Precision:
+        """Return the precision that the explorer selects for the current view."""
+        return select_precision(self._renderer.map_center, self._renderer.map_scale, self.window_size,
+                                self.fast_doubles)
+
+    def run(self, precision: Precision, repeats: int) -> tuple[float, np.ndarray]:
+        """Draw the current view repeatedly; return the shortest duration [s], and the iteration counts."""
+
+        (width, height) = self.window_size
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self._iteration_buffer.framebuffer)
+
+        glUseProgram(self._programs[precision])
+        glBindVertexArray(self._vao)
+
+        duration = math.inf
+
+        for repeat in range(repeats):
+            glFinish()
+            t1 = time.monotonic()
+            glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+            glFinish()
+            t2 = time.monotonic()
+            duration = min(duration, t2 - t1)
+
+        glBindVertexArray(0)
+        glUseProgram(0)
+
+        # Read back the iteration counts, to count the work done.
+
+        iterations = glReadPixels(0, 0, width, height, GL_RED, GL_FLOAT)
+        iterations = np.frombuffer(iterations, dtype=np.float32).reshape(height, width)[::-1].astype(np.uint32)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        return (duration, iterations)
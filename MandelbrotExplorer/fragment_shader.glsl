@@ -1,10 +1,11 @@
 
 #version 410 core
 
-layout(location = 0) out vec4 fragment_color;
+// The iteration count and the fractional escape value; the palette pass colors them.
+
+layout(location = 0) out vec2 escape_value;
 
 uniform uvec2 window_size;
-uniform uint  frame_counter;
 
 // Where are we?
 
@@ -14,28 +15,7 @@ uniform dvec2  map_center;
 uniform double map_scale;
 uniform double map_angle;
 
-uint mandelbrot(double x0, double y0, uint max_iterations)
-{
-    double x = 0.0;
-    double y = 0.0;
-
-    uint iteration = 0;
-    while (iteration < max_iterations)
-    {
-        double xx = x * x;
-        double yy = y * y;
-
-        if (xx + yy > 4.0)
-        {
-            break;
-        }
-        double xtemp = xx - yy + x0;
-        y = 2 * x * y + y0;
-        x = xtemp;
-        ++iteration;
-    }
-    return iteration;
-}
+#include "mandelbrot_kernel.glsl"
 
 void main()
 {
@@ -60,20 +40,9 @@ void main()
     double x = map_center.x + 0.5 * scale * (height * sin_angle + 2.0 * cos_angle * sx - 2.0 * sin_angle * sy - cos_angle * width);
     double y = map_center.y - 0.5 * scale * (cos_angle * (height - 2 * sy) + sin_angle * (-2 * sx + width));
 
-    uint m = mandelbrot(x, y, max_iterations);
-
-    if (m == max_iterations)
-    {
-        fragment_color = vec4(0.0, 0.0, 0.0, 1.0);
-    }
-    else
-    {
-        //m = (m - frame_counter) % max_iterations;
+    float fraction;
 
-        uint r = (m % 256);
-        uint g = (m %  16) * 16;
-        uint b = (m %   4) * 64;
+    uint m = mandelbrot(x, y, max_iterations, PERIODICITY_TOLERANCE * scale, fraction);
 
-        fragment_color = vec4(r / 255.0, g / 255.0, b / 255.0, 1.0);
-    }
+    escape_value = vec2(float(m), fraction);
 }
@@ -0,0 +1,39 @@
+"""The window-sized buffer of escape values, written by the kernels and read by the palette pass.
+
+Each pixel holds (iteration count, fractional escape value) in an RG32F texture. The iteration count is exact up
+to 2^24 iterations.
+"""
+
+from OpenGL.GL import *
+
+
+class IterationBuffer:
+    """A framebuffer with an RG32F texture of escape values, the size of the window."""
+
+    def __init__(self):
+        self.size = None
+        self.framebuffer = glGenFramebuffers(1)
+        self.texture = glGenTextures(1)
+
+    def close(self) -> None:
+        glDeleteFramebuffers(1, (self.framebuffer, ))
+        glDeleteTextures(1, (self.texture, ))
+
+    def allocate(self, width: int, height: int) -> None:
+        """(Re-)allocate the escape value texture for the given window size."""
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RG32F, width, height, 0, GL_RG, GL_FLOAT, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.texture, 0)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("Iteration buffer framebuffer is incomplete (status 0x{:04x}).".format(status))
+
+        self.size = (width, height)
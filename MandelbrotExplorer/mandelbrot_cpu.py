@@ -0,0 +1,277 @@
+#! /usr/bin/env python3
+
+"""Multi-core NumPy CPU engine for the Mandelbrot set.
+
+The engine computes the same iteration counts as the fragment shader, for the same map_center, map_scale,
+map_angle and max_iterations parameters. It can be used to validate the GPU results, for batch jobs on
+machines without a GPU, and as a fallback.
+
+The image is split into tiles that are computed in parallel on a process pool. Within a tile, the escape-time
+iteration is vectorized with NumPy, and the points that escape are removed from the active set, so later
+iterations only process the points that are still iterating.
+
+Interior points are the most expensive ones, since they run all max_iterations iterations. Points inside the main
+cardioid and the period-2 bulb are recognized analytically, and the other points get Brent-style periodicity
+checking, with a tolerance relative to the pixel size. The fragment shaders do the same.
+
+Iteration count arrays have shape (height, width), with the top row of the image first.
+"""
+
+import argparse
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from palettes import PALETTES
+
+# The periodicity tolerance, relative to the size of a pixel.
+
+PERIODICITY_TOLERANCE = 1.0e-3
+
+
+def pixel_coordinates(window_size: tuple[int, int], map_center: tuple[float, float], map_scale: float,
+                      map_angle: float, row_range: tuple[int, int], column_range: tuple[int, int]):
+    """Return the fractal coordinates (x0, y0) of the centers of a rectangle of pixels.
+
+    This follows the calculation in the fragment shader, including the single precision calculation of the angle.
+    """
+
+    (width, height) = window_size
+
+    scale = map_scale / min(width, height)
+
+    angle = np.float32(map_angle) * np.float32(math.pi / 180.0)
+
+    sin_angle = float(np.sin(angle))
+    cos_angle = float(np.cos(angle))
+
+    # Window coordinates of the pixel centers. The bottom-left pixel center is at (0.5, 0.5).
+
+    sx = np.arange(*column_range, dtype=np.float64) + 0.5
+    sy = (height - 0.5) - np.arange(*row_range, dtype=np.float64)
+
+    (sx, sy) = np.meshgrid(sx, sy)
+
+    x0 = map_center[0] + 0.5 * scale * (height * sin_angle + 2.0 * cos_angle * sx - 2.0 * sin_angle * sy - cos_angle * width)
+    y0 = map_center[1] - 0.5 * scale * (cos_angle * (height - 2 * sy) + sin_angle * (-2 * sx + width))
+
+    return (x0, y0)
+
+
+def in_cardioid_or_bulb(x0: np.ndarray, y0: np.ndarray) -> np.ndarray:
+    """Return a mask of the points inside the main cardioid or the period-2 bulb, which never escape."""
+
+    yy = y0 * y0
+
+    xq = x0 - 0.25
+    q = xq * xq + yy
+
+    xb = x0 + 1.0
+
+    return (q * (q + xq) <= 0.25 * yy) | (xb * xb + yy <= 0.0625)
+
+
+def mandelbrot_iterations(x0: np.ndarray, y0: np.ndarray, max_iterations: int, interior_checks: bool = False,
+                          periodicity_tolerance: float = 0.0) -> np.ndarray:
+    """Return the escape-time iteration counts of the given points, using active-set compaction.
+
+    If interior_checks is set, points inside the main cardioid or the period-2 bulb are not iterated, and points
+    whose orbit returns to within periodicity_tolerance of a saved value are taken to be inside the set.
+    """
+
+    shape = x0.shape
+
+    x0 = x0.ravel()
+    y0 = y0.ravel()
+
+    iterations = np.full(x0.size, max_iterations, dtype=np.uint32)
+
+    # The indices, starting points and current values of the points that are still iterating.
+
+    active = np.arange(x0.size)
+    if interior_checks:
+        active = active[~in_cardioid_or_bulb(x0, y0)]
+    cx = x0[active]
+    cy = y0[active]
+    x = np.zeros_like(cx)
+    y = np.zeros_like(cy)
+
+    # Brent-style periodicity checking: z is compared to a saved value, that is replaced at iterations 1, 2, 4, 8, ...
+
+    saved_x = x
+    saved_y = y
+    next_save = 1
+
+    tolerance_squared = periodicity_tolerance * periodicity_tolerance
+
+    for iteration in range(max_iterations):
+
+        if active.size == 0:
+            break
+
+        xx = x * x
+        yy = y * y
+
+        escaped = xx + yy > 4.0
+
+        if escaped.any():
+
+            iterations[active[escaped]] = iteration
+
+            # Drop the escaped points from the active set.
+
+            keep = ~escaped
+            active = active[keep]
+            (cx, cy, x, y, xx, yy) = (cx[keep], cy[keep], x[keep], y[keep], xx[keep], yy[keep])
+            (saved_x, saved_y) = (saved_x[keep], saved_y[keep])
+
+        xtemp = xx - yy + cx
+        y = 2 * x * y + cy
+        x = xtemp
+
+        if interior_checks:
+
+            # Points that returned to the saved value are attracted by a cycle; they keep max_iterations.
+
+            dx = x - saved_x
+            dy = y - saved_y
+
+            periodic = dx * dx + dy * dy < tolerance_squared
+
+            if periodic.any():
+                keep = ~periodic
+                active = active[keep]
+                (cx, cy, x, y, saved_x, saved_y) = (cx[keep], cy[keep], x[keep], y[keep], saved_x[keep], saved_y[keep])
+
+            if iteration + 1 == next_save:
+                (saved_x, saved_y) = (x, y)
+                next_save *= 2
+
+    return iterations.reshape(shape)
+
+
+def compute_tile(tile):
+    """Compute the iteration counts of a single tile. This is the unit of work of the process pool."""
+    (window_size, map_center, map_scale, map_angle, max_iterations, interior_checks, row_range, column_range) = tile
+    (x0, y0) = pixel_coordinates(window_size, map_center, map_scale, map_angle, row_range, column_range)
+    periodicity_tolerance = PERIODICITY_TOLERANCE * map_scale / min(window_size)
+    return mandelbrot_iterations(x0, y0, max_iterations, interior_checks, periodicity_tolerance)
+
+
+def colorize(iterations: np.ndarray, max_iterations: int, palette_name: str = "classic") -> np.ndarray:
+    """Map iteration counts to RGB colors, as the palette pass does without smooth coloring."""
+
+    palette = PALETTES[palette_name]
+
+    iterations = iterations.astype(np.uint32)
+
+    rgb = palette[iterations % len(palette)]
+
+    rgb[iterations == max_iterations] = 0
+
+    return rgb
+
+
+class MandelbrotCpuEngine:
+    """Compute Mandelbrot iteration counts on the CPU, in parallel tiles."""
+
+    def __init__(self, max_workers: int = None, tile_size: int = 64, interior_checks: bool = True,
+                 verbose: bool = True):
+        self.max_workers = max_workers if max_workers is not None else os.cpu_count()
+        self.tile_size = tile_size
+        self.interior_checks = interior_checks
+        self.verbose = verbose  # Print the duration and speed of each computation.
+        self._executor = None
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def compute(self, window_size: tuple[int, int], map_center: tuple[float, float], map_scale: float,
+                map_angle: float, max_iterations: int, row_range: tuple[int, int] = None) -> np.ndarray:
+        """Return the iteration counts of all pixels of a window of the given size.
+
+        If row_range is given, only the iteration counts of those rows are computed and returned.
+        """
+
+        (width, height) = window_size
+
+        (first_row, end_row) = row_range if row_range is not None else (0, height)
+
+        tiles = [
+            (window_size, map_center, map_scale, map_angle, max_iterations, self.interior_checks,
+             (row, min(row + self.tile_size, end_row)), (column, min(column + self.tile_size, width)))
+            for row in range(first_row, end_row, self.tile_size)
+            for column in range(0, width, self.tile_size)
+        ]
+
+        t1 = time.monotonic()
+
+        if self.max_workers > 1:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(self.max_workers)
+            tile_results = self._executor.map(compute_tile, tiles)
+        else:
+            tile_results = map(compute_tile, tiles)
+
+        iterations = np.empty((end_row - first_row, width), dtype=np.uint32)
+        for (tile, tile_iterations) in zip(tiles, tile_results):
+            (tile_row_range, tile_column_range) = tile[6:]
+            iterations[tile_row_range[0] - first_row:tile_row_range[1] - first_row,
+                       tile_column_range[0]:tile_column_range[1]] = tile_iterations
+
+        t2 = time.monotonic()
+
+        if not self.verbose:
+            return iterations
+
+        # The nominal work is the sum of the iteration counts of all pixels. Interior points that the interior
+        # checks recognize count with max_iterations without being iterated, so it is not the work performed.
+
+        nominal_pixel_iterations = int(iterations.sum(dtype=np.uint64))
+        pixels = width * (end_row - first_row)
+        duration = t2 - t1
+
+        print("CPU engine: {} x {} pixels, {} tiles, {} workers, {:.3f} s, {:.2f} megapixels per second "
+              "({:.1f} nominal megapixel-iterations per second).".format(
+                  width, end_row - first_row, len(tiles), self.max_workers, duration, pixels / duration / 1e6,
+                  nominal_pixel_iterations / duration / 1e6))
+
+        return iterations
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Compute a Mandelbrot image on the CPU.")
+    parser.add_argument("--size", type=int, nargs=2, default=(640, 480), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--center", type=float, nargs=2, default=(0.0, 0.0), metavar=("X", "Y"))
+    parser.add_argument("--scale", type=float, default=4.0)
+    parser.add_argument("--angle", type=float, default=0.0, help="angle [degrees]")
+    parser.add_argument("--max-iterations", type=int, default=256)
+    parser.add_argument("--workers", type=int, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--no-interior-checks", dest="interior_checks", action="store_false",
+                        help="iterate interior points in full (for comparison)")
+    parser.add_argument("--output", help="write the image to this file (requires Pillow)")
+
+    args = parser.parse_args()
+
+    with MandelbrotCpuEngine(args.workers, interior_checks=args.interior_checks) as engine:
+        iterations = engine.compute(tuple(args.size), tuple(args.center), args.scale, args.angle, args.max_iterations)
+
+    if args.output is not None:
+        from PIL import Image
+        Image.fromarray(colorize(iterations, args.max_iterations)).save(args.output)
+
+
+if __name__ == "__main__":
+    main()
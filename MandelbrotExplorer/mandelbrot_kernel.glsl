@@ -0,0 +1,225 @@
+// The escape-time kernel, shared by the direct and the tiled fragment shaders.
+//
+// The kernel is compiled in one of three precisions, selected by a define:
+//
+//   PRECISION_FLOAT         -- single precision.
+//   PRECISION_DOUBLE_FLOAT  -- emulated 'double-float': each number is the unevaluated sum of two floats (hi + lo),
+//                              for a mantissa of about 48 bits, using only float arithmetic.
+//   PRECISION_DOUBLE        -- native double precision.
+//
+// The point is passed in double precision, and rounded to the kernel precision once.
+//
+// The kernel returns the iteration count, and the fractional part of the smooth escape count in 'fraction'.
+// For points that do not escape, the fraction is zero.
+
+#include "smooth_escape.glsl"
+
+// Skip the iteration of interior points: cardioid and bulb tests, and periodicity checking.
+
+uniform bool interior_checks;
+
+// The periodicity tolerance, relative to the size of a pixel.
+
+const double PERIODICITY_TOLERANCE = 1.0e-3;
+
+// Points inside the main cardioid or the period-2 bulb never escape; they are recognized analytically.
+
+bool in_cardioid_or_bulb(double x0, double y0)
+{
+    double yy = y0 * y0;
+
+    double xq = x0 - 0.25;
+    double q = xq * xq + yy;
+
+    if (q * (q + xq) <= 0.25 * yy)
+    {
+        return true;
+    }
+
+    double xb = x0 + 1.0;
+
+    return xb * xb + yy <= 0.0625;
+}
+
+#if defined(PRECISION_DOUBLE_FLOAT)
+
+// Double-float arithmetic. A value is a vec2 (hi, lo), with |lo| at most half an ulp of hi.
+// The 'precise' qualifier keeps the compiler from re-associating the error terms away.
+
+vec2 two_sum(float a, float b)
+{
+    precise float s = a + b;
+    precise float v = s - a;
+    precise float e = (a - (s - v)) + (b - v);
+    return vec2(s, e);
+}
+
+vec2 quick_two_sum(float a, float b)
+{
+    precise float s = a + b;
+    precise float e = b - (s - a);
+    return vec2(s, e);
+}
+
+vec2 two_product(float a, float b)
+{
+    precise float p = a * b;
+    precise float e = fma(a, b, -p);
+    return vec2(p, e);
+}
+
+vec2 df_add(vec2 a, vec2 b)
+{
+    precise vec2 s = two_sum(a.x, b.x);
+    precise vec2 t = two_sum(a.y, b.y);
+    s.y += t.x;
+    s = quick_two_sum(s.x, s.y);
+    s.y += t.y;
+    return quick_two_sum(s.x, s.y);
+}
+
+vec2 df_mul(vec2 a, vec2 b)
+{
+    precise vec2 p = two_product(a.x, b.x);
+    p.y += a.x * b.y + a.y * b.x;
+    return quick_two_sum(p.x, p.y);
+}
+
+vec2 df_from_double(double a)
+{
+    float hi = float(a);
+    return vec2(hi, float(a - hi));
+}
+
+uint mandelbrot(double x0, double y0, uint max_iterations, double periodicity_tolerance, out float fraction)
+{
+    fraction = 0.0;
+
+    if (interior_checks && in_cardioid_or_bulb(x0, y0))
+    {
+        return max_iterations;
+    }
+
+    vec2 cx = df_from_double(x0);
+    vec2 cy = df_from_double(y0);
+
+    vec2 x = vec2(0.0, 0.0);
+    vec2 y = vec2(0.0, 0.0);
+
+    // Brent-style periodicity checking, as in the single and double precision kernel below.
+
+    vec2 saved_x = x;
+    vec2 saved_y = y;
+    uint next_save = 1;
+
+    float tolerance_squared = float(periodicity_tolerance * periodicity_tolerance);
+
+    uint iteration = 0;
+    while (iteration < max_iterations)
+    {
+        vec2 xx = df_mul(x, x);
+        vec2 yy = df_mul(y, y);
+
+        // The high parts suffice for the escape test.
+
+        if (xx.x + yy.x > 4.0)
+        {
+            fraction = escape_fraction(xx.x + yy.x);
+            break;
+        }
+        vec2 xy = df_mul(x, y);
+        x = df_add(df_add(xx, -yy), cx);
+        y = df_add(2.0 * xy, cy);
+        ++iteration;
+
+        if (interior_checks)
+        {
+            float dx = df_add(x, -saved_x).x;
+            float dy = df_add(y, -saved_y).x;
+
+            if (dx * dx + dy * dy < tolerance_squared)
+            {
+                return max_iterations;
+            }
+
+            if (iteration == next_save)
+            {
+                saved_x = x;
+                saved_y = y;
+                next_save *= 2u;
+            }
+        }
+    }
+    return iteration;
+}
+
+#else
+
+#if defined(PRECISION_FLOAT)
+#define real float
+#else
+#define real double
+#endif
+
+uint mandelbrot(double x0, double y0, uint max_iterations, double periodicity_tolerance, out float fraction)
+{
+    fraction = 0.0;
+
+    if (interior_checks && in_cardioid_or_bulb(x0, y0))
+    {
+        return max_iterations;
+    }
+
+    real cx = real(x0);
+    real cy = real(y0);
+
+    real x = 0.0;
+    real y = 0.0;
+
+    // Brent-style periodicity checking: z is compared to a saved value, that is replaced at iterations 1, 2, 4, 8, ...
+    // If z returns to the saved value, the orbit is attracted by a cycle, and the point never escapes.
+
+    real saved_x = 0.0;
+    real saved_y = 0.0;
+    uint next_save = 1;
+
+    real tolerance_squared = real(periodicity_tolerance * periodicity_tolerance);
+
+    uint iteration = 0;
+    while (iteration < max_iterations)
+    {
+        real xx = x * x;
+        real yy = y * y;
+
+        if (xx + yy > 4.0)
+        {
+            fraction = escape_fraction(float(xx + yy));
+            break;
+        }
+        real xtemp = xx - yy + cx;
+        y = 2 * x * y + cy;
+        x = xtemp;
+        ++iteration;
+
+        if (interior_checks)
+        {
+            real dx = x - saved_x;
+            real dy = y - saved_y;
+
+            if (dx * dx + dy * dy < tolerance_squared)
+            {
+                return max_iterations;
+            }
+
+            if (iteration == next_save)
+            {
+                saved_x = x;
+                saved_y = y;
+                next_save *= 2u;
+            }
+        }
+    }
+    return iteration;
+}
+
+#endif
@@ -0,0 +1,42 @@
+#version 410 core
+
+// Color the escape values in the iteration buffer, using a 1D palette texture.
+//
+// Changing the palette, or cycling it, only repeats this pass; the iteration buffer is not recomputed.
+
+layout(location = 0) out vec4 fragment_color;
+
+uniform sampler2D escape_values;  // (iteration count, fractional escape value), as written by the kernels.
+uniform sampler1D palette;        // Repeating, and linearly filtered.
+
+uniform uint max_iterations;
+
+uniform float palette_offset;     // Palette cycling: the number of palette entries to shift the colors by.
+uniform bool  smooth_coloring;
+
+void main()
+{
+    vec2 escape_value = texelFetch(escape_values, ivec2(gl_FragCoord.xy), 0).xy;
+
+    if (escape_value.x >= float(max_iterations))
+    {
+        // The point is inside the set.
+        fragment_color = vec4(0.0, 0.0, 0.0, 1.0);
+        return;
+    }
+
+    float palette_size = float(textureSize(palette, 0));
+
+    if (smooth_coloring)
+    {
+        // Interpolate between palette entries.
+        float position = mod(escape_value.x + escape_value.y + palette_offset, palette_size);
+        fragment_color = vec4(texture(palette, (position + 0.5) / palette_size).rgb, 1.0);
+    }
+    else
+    {
+        // Use the palette entry of the iteration count.
+        float position = mod(escape_value.x + floor(palette_offset), palette_size);
+        fragment_color = vec4(texelFetch(palette, int(position), 0).rgb, 1.0);
+    }
+}
@@ -0,0 +1,34 @@
+"""A 1D texture holding the color palette of the palette pass."""
+
+from OpenGL.GL import *
+
+from palettes import PALETTES
+
+
+class PaletteTexture:
+    """A repeating, linearly filtered 1D RGB texture, holding one of the named palettes."""
+
+    def __init__(self):
+        self.name = None  # The name of the current palette.
+        self.texture = glGenTextures(1)
+
+    def close(self) -> None:
+        glDeleteTextures(1, (self.texture, ))
+
+    def update(self, name: str) -> None:
+        """Upload the named palette, if it is not the current palette."""
+
+        if name == self.name:
+            return
+
+        palette = PALETTES[name]
+
+        glBindTexture(GL_TEXTURE_1D, self.texture)
+        glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_MIN_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_MAG_FILTER, GL_LINEAR)
+        glTexParameteri(GL_TEXTURE_1D, GL_TEXTURE_WRAP_S, GL_REPEAT)
+        glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+        glTexImage1D(GL_TEXTURE_1D, 0, GL_RGB8, len(palette), 0, GL_RGB, GL_UNSIGNED_BYTE, palette)
+        glBindTexture(GL_TEXTURE_1D, 0)
+
+        self.name = name
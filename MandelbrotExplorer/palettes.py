@@ -0,0 +1,36 @@
+"""Color palettes for the escape values.
+
+A palette is an array of shape (n, 3) of 8-bit RGB values. It is indexed by the iteration count, modulo its
+length, and it repeats; for smooth coloring, the fractional escape value interpolates between the entries.
+Points inside the set are always black.
+"""
+
+import numpy as np
+
+
+def classic_palette() -> np.ndarray:
+    """The original palette of the explorer: (m % 256, (m % 16) * 16, (m % 4) * 64) for iteration count m."""
+    m = np.arange(256)
+    return np.stack([m % 256, (m % 16) * 16, (m % 4) * 64], axis=1).astype(np.uint8)
+
+
+def gradient_palette(colors, size: int = 256) -> np.ndarray:
+    """Return a repeating palette that interpolates linearly between the given RGB colors."""
+
+    colors = np.asarray(colors, dtype=np.float64)
+
+    position = np.arange(size) * len(colors) / size
+    index = np.floor(position).astype(int)
+    t = (position - index)[:, np.newaxis]
+
+    rgb = (1.0 - t) * colors[index] + t * colors[(index + 1) % len(colors)]
+
+    return np.round(rgb).astype(np.uint8)
+
+
+PALETTES = {
+    "classic": classic_palette(),
+    "ocean": gradient_palette([(0, 7, 100), (32, 107, 203), (237, 255, 255), (255, 170, 0), (0, 2, 0)]),
+    "fire": gradient_palette([(16, 0, 0), (160, 16, 0), (255, 128, 0), (255, 240, 160), (160, 16, 0)]),
+    "grayscale": gradient_palette([(0, 0, 0), (255, 255, 255)])
+}
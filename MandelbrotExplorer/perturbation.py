@@ -0,0 +1,103 @@
+"""Reference orbits for perturbation-theory deep zoom.
+
+Below a map scale of about 1e-13, double precision can no longer distinguish neighboring pixels. In deep zoom mode,
+the orbit of the map center is calculated in arbitrary precision (using the decimal module), and rounded to doubles.
+The fragment shader then only iterates the (small) differences between the pixel orbits and this reference orbit.
+
+The deltas are iterated in double precision, which limits the map scale to about 1e-300.
+"""
+
+import decimal
+import math
+
+import numpy as np
+
+from OpenGL.GL import *
+
+# The minimum value of GL_MAX_TEXTURE_BUFFER_SIZE. Longer orbits are truncated; the shader rebases at the end.
+
+MAX_REFERENCE_ORBIT_LENGTH = 65536
+
+
+def precision_digits(map_scale: float) -> int:
+    """Return the number of decimal digits needed to represent the map center at the given scale."""
+    return max(30, 20 - math.floor(math.log10(map_scale)))
+
+
+def reference_orbit(map_center: tuple[decimal.Decimal, decimal.Decimal], max_iterations: int, digits: int) -> np.ndarray:
+    """Return the orbit Z0 = 0, Z1, Z2, ... of the map center, rounded to doubles, as an array of shape (n, 2).
+
+    The orbit ends at the first value that escapes, or after max_iterations iterations.
+    """
+
+    with decimal.localcontext() as context:
+
+        context.prec = digits
+
+        # Round the center to the working precision.
+
+        cx = +map_center[0]
+        cy = +map_center[1]
+
+        x = decimal.Decimal(0)
+        y = decimal.Decimal(0)
+
+        four = decimal.Decimal(4)
+
+        orbit = [(0.0, 0.0)]
+
+        for iteration in range(min(max_iterations, MAX_REFERENCE_ORBIT_LENGTH - 1)):
+
+            xx = x * x
+            yy = y * y
+
+            if xx + yy > four:
+                break
+
+            (x, y) = (xx - yy + cx, 2 * x * y + cy)
+
+            orbit.append((float(x), float(y)))
+
+    return np.array(orbit, dtype=np.float64)
+
+
+class ReferenceOrbitTexture:
+    """A buffer texture holding a reference orbit as packed doubles, for use as a 'usamplerBuffer'."""
+
+    def __init__(self):
+        self.length = 0
+        self.key = None  # The (map center, max_iterations, digits) of the current orbit.
+        self.buffer = glGenBuffers(1)
+        self.texture = glGenTextures(1)
+
+    def close(self) -> None:
+        glDeleteTextures(1, (self.texture, ))
+        glDeleteBuffers(1, (self.buffer, ))
+
+    def update(self, map_center: tuple[decimal.Decimal, decimal.Decimal], max_iterations: int, map_scale: float) -> None:
+        """Re-calculate and upload the reference orbit, if the center, iteration count or precision changed."""
+
+        digits = precision_digits(map_scale)
+
+        key = (map_center, max_iterations, digits)
+        if key == self.key:
+            return
+
+        orbit = reference_orbit(map_center, max_iterations, digits)
+
+        # Each double is stored as two 32-bit unsigned integers, low word first, as expected by packDouble2x32().
+
+        packed_orbit = np.ascontiguousarray(orbit).view(np.uint32)
+
+        glBindBuffer(GL_TEXTURE_BUFFER, self.buffer)
+        glBufferData(GL_TEXTURE_BUFFER, packed_orbit.nbytes, packed_orbit, GL_STATIC_DRAW)
+        glBindBuffer(GL_TEXTURE_BUFFER, 0)
+
+        glBindTexture(GL_TEXTURE_BUFFER, self.texture)
+        glTexBuffer(GL_TEXTURE_BUFFER, GL_RGBA32UI, self.buffer)
+        glBindTexture(GL_TEXTURE_BUFFER, 0)
+
+        print("reference orbit: {} iterations, {} digits".format(len(orbit), digits))
+
+        self.length = len(orbit)
+        self.key = key
@@ -0,0 +1,101 @@
+#version 410 core
+
+// Deep zoom using perturbation theory.
+//
+// The orbit of a reference point (the map center) is calculated on the CPU in arbitrary precision, and provided
+// as a buffer texture of packed doubles. For each pixel, only the difference 'dz' between its orbit and the
+// reference orbit is iterated, in double precision:
+//
+//     dz' = (2 * Z + dz) * dz + dc
+//
+// where Z is the reference orbit value, and dc is the difference between the pixel and the reference point.
+//
+// Glitches occur when the pixel orbit gets close to zero, where dz loses its precision relative to z = Z + dz.
+// These are detected (|z| < |dz|), and resolved by rebasing: the pixel continues with dz = z, relative to the
+// start of the reference orbit. The same is done when the end of the reference orbit is reached.
+
+// The iteration count and the fractional escape value; the palette pass colors them.
+
+layout(location = 0) out vec2 escape_value;
+
+uniform uvec2 window_size;
+
+// Where are we?
+
+uniform uint max_iterations;
+
+uniform double map_scale;
+uniform double map_angle;
+
+uniform usamplerBuffer reference_orbit;  // (X.lo, X.hi, Y.lo, Y.hi) for each iteration, starting at Z = 0.
+uniform uint reference_orbit_length;
+
+#include "smooth_escape.glsl"
+
+dvec2 reference_orbit_value(uint n)
+{
+    uvec4 packed_value = texelFetch(reference_orbit, int(n));
+    return dvec2(packDouble2x32(packed_value.xy), packDouble2x32(packed_value.zw));
+}
+
+void main()
+{
+    double sx = gl_FragCoord.x;
+    double sy = gl_FragCoord.y;
+
+    uint width  = window_size.x;
+    uint height = window_size.y;
+
+    double scale = map_scale / min(width, height);
+
+    float angle = radians(float(map_angle));
+
+    double sin_angle = sin(angle);
+    double cos_angle = cos(angle);
+
+    // The offset of the pixel relative to the map center, which is the reference point.
+
+    dvec2 dc = dvec2(
+        +0.5 * scale * (height * sin_angle + 2.0 * cos_angle * sx - 2.0 * sin_angle * sy - cos_angle * width),
+        -0.5 * scale * (cos_angle * (height - 2 * sy) + sin_angle * (-2 * sx + width))
+    );
+
+    dvec2 dz = dvec2(0.0, 0.0);
+
+    uint n = 0;  // Index into the reference orbit.
+
+    float fraction = 0.0;
+
+    uint iteration = 0;
+    while (iteration < max_iterations)
+    {
+        dvec2 Z = reference_orbit_value(n);
+        dvec2 z = Z + dz;
+
+        double zz = dot(z, z);
+
+        if (zz > 4.0)
+        {
+            fraction = escape_fraction(float(zz));
+            break;
+        }
+
+        if (zz < dot(dz, dz) || n + 1 >= reference_orbit_length)
+        {
+            // Rebase: continue relative to the start of the reference orbit, where Z = 0.
+            dz = z;
+            Z = dvec2(0.0, 0.0);
+            n = 0;
+        }
+
+        // dz' = (2 * Z + dz) * dz + dc, in complex arithmetic.
+
+        dvec2 w = 2.0 * Z + dz;
+        dz = dvec2(w.x * dz.x - w.y * dz.y, w.x * dz.y + w.y * dz.x) + dc;
+
+        ++n;
+        ++iteration;
+    }
+
+    escape_value = vec2(float(iteration), fraction);
+}
@@ -0,0 +1,191 @@
+#! /usr/bin/env python3
+
+"""Out-of-core export of large Mandelbrot posters.
+
+Posters of 32k x 32k pixels and more do not fit in a framebuffer, and not comfortably in memory. The poster is
+therefore computed in bands of rows, from top to bottom. Each band is colorized and appended to the output files
+right away, so the memory use is bounded by a single band, whatever the size of the poster.
+
+The bands are computed by one of two engines:
+
+    cpu -- the multi-core NumPy engine (see mandelbrot_cpu.py). This engine runs headless.
+    gpu -- the tiled fragment shader, rendering tiles into an offscreen framebuffer (see poster_gpu.py).
+
+The image is written to a PNG file, which is compressed as it is streamed, or to a .npy file of RGB values, which
+is written through a memory map. The raw iteration counts can also be written to a .npy file, for recoloring later.
+"""
+
+import argparse
+import contextlib
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+from mandelbrot_cpu import MandelbrotCpuEngine, colorize
+
+
+class PngWriter:
+    """Write an 8-bit RGB PNG file band by band, without holding the image in memory."""
+
+    def __init__(self, filename: str, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._file = open(filename, "wb")
+        self._compressor = zlib.compressobj(6)
+
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+
+        # Bit depth 8, color type 2 (RGB), default compression, filtering, and no interlacing.
+
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _write_chunk(self, chunk_type: bytes, data: bytes) -> None:
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    def write_rows(self, rgb: np.ndarray) -> None:
+        """Append rows of shape (n, width, 3) to the image."""
+
+        # Each row is preceded by its filter type; 0 means no filtering.
+
+        scanlines = np.zeros((rgb.shape[0], 1 + self.width * 3), dtype=np.uint8)
+        scanlines[:, 1:] = rgb.reshape(rgb.shape[0], self.width * 3)
+
+        data = self._compressor.compress(scanlines.tobytes())
+        if data:
+            self._write_chunk(b"IDAT", data)
+
+        self.rows_written += rgb.shape[0]
+
+    def close(self) -> None:
+        if self.rows_written != self.height:
+            print("warning: PNG file is incomplete ({} of {} rows).".format(self.rows_written, self.height))
+        self._write_chunk(b"IDAT", self._compressor.flush())
+        self._write_chunk(b"IEND", b"")
+        self._file.close()
+
+
+class NpyWriter:
+    """Write an array to a .npy file band by band, through a memory map."""
+
+    def __init__(self, filename: str, shape: tuple, dtype):
+        self.rows_written = 0
+        self._array = np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=shape)
+
+    def write_rows(self, rows: np.ndarray) -> None:
+        """Append rows to the array."""
+        self._array[self.rows_written:self.rows_written + rows.shape[0]] = rows
+        self.rows_written += rows.shape[0]
+
+        # Write the band to disk, so the dirty pages do not pile up in memory.
+
+        self._array.flush()
+
+    def close(self) -> None:
+        self._array.flush()
+        self._array = None
+
+
+class CpuBandRenderer:
+    """Compute bands of poster rows with the CPU engine."""
+
+    def __init__(self, window_size: tuple[int, int], map_center: tuple[float, float], map_scale: float,
+                 map_angle: float, max_iterations: int, interior_checks: bool = True, max_workers: int = None):
+        self.view = (window_size, map_center, map_scale, map_angle, max_iterations)
+        self._engine = MandelbrotCpuEngine(max_workers, interior_checks=interior_checks)
+
+    def close(self) -> None:
+        self._engine.close()
+
+    def render_band(self, row_range: tuple[int, int]) -> np.ndarray:
+        """Return the iteration counts of the given rows, with the top row of the poster first."""
+        return self._engine.compute(*self.view, row_range=row_range)
+
+
+def export_poster(band_renderer, window_size: tuple[int, int], max_iterations: int, band_height: int,
+                  image_filename: str = None, iterations_filename: str = None) -> None:
+    """Compute the poster band by band, and stream the bands into the output files."""
+
+    (width, height) = window_size
+
+    with contextlib.ExitStack() as exit_stack:
+
+        writers = []
+
+        if image_filename is not None:
+            if os.path.splitext(image_filename)[1].lower() == ".npy":
+                image_writer = NpyWriter(image_filename, (height, width, 3), np.uint8)
+            else:
+                image_writer = PngWriter(image_filename, width, height)
+            exit_stack.callback(image_writer.close)
+            writers.append((image_writer, lambda iterations: colorize(iterations, max_iterations)))
+
+        if iterations_filename is not None:
+            iterations_writer = NpyWriter(iterations_filename, (height, width), np.uint32)
+            exit_stack.callback(iterations_writer.close)
+            writers.append((iterations_writer, lambda iterations: iterations))
+
+        t1 = time.monotonic()
+
+        for first_row in range(0, height, band_height):
+
+            row_range = (first_row, min(first_row + band_height, height))
+
+            iterations = band_renderer.render_band(row_range)
+
+            for (writer, convert) in writers:
+                writer.write_rows(convert(iterations))
+
+            print("poster: {} of {} rows done.".format(row_range[1], height))
+
+        t2 = time.monotonic()
+
+        print("poster: {} x {} pixels in {:.1f} s.".format(width, height, t2 - t1))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Export a large Mandelbrot poster, band by band.")
+    parser.add_argument("--size", type=int, nargs=2, default=(32768, 32768), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--center", type=float, nargs=2, default=(0.0, 0.0), metavar=("X", "Y"))
+    parser.add_argument("--scale", type=float, default=4.0)
+    parser.add_argument("--angle", type=float, default=0.0, help="angle [degrees]")
+    parser.add_argument("--max-iterations", type=int, default=256)
+    parser.add_argument("--no-interior-checks", dest="interior_checks", action="store_false",
+                        help="iterate interior points in full")
+    parser.add_argument("--engine", choices=("cpu", "gpu"), default="cpu")
+    parser.add_argument("--workers", type=int, help="number of worker processes of the CPU engine (default: number of CPUs)")
+    parser.add_argument("--band-height", type=int, default=256, help="number of rows computed at a time")
+    parser.add_argument("--output", help="write the image to this file (.png, or .npy for raw RGB values)")
+    parser.add_argument("--iterations-output", help="write the iteration counts to this .npy file")
+
+    args = parser.parse_args()
+
+    if args.output is None and args.iterations_output is None:
+        parser.error("at least one of --output and --iterations-output is required")
+
+    window_size = tuple(args.size)
+    view = (window_size, tuple(args.center), args.scale, args.angle, args.max_iterations, args.interior_checks)
+
+    if args.engine == "cpu":
+        band_renderer = CpuBandRenderer(*view, max_workers=args.workers)
+    else:
+        from poster_gpu import GpuBandRenderer
+        band_renderer = GpuBandRenderer(tile_size=args.band_height)
+        band_renderer.set_view(*view)
+
+    try:
+        export_poster(band_renderer, window_size, args.max_iterations, args.band_height,
+                      args.output, args.iterations_output)
+    finally:
+        band_renderer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Compute bands of poster rows on the GPU, using the tiled fragment shader.
+
+The shader runs in a hidden GLFW window. Each band is rendered as a row of square tiles into an offscreen
+framebuffer with an RG32F texture of escape values, and the iteration counts are read back. No window is shown,
+but an OpenGL 4.1 capable display is still required; on machines without one, use the CPU engine.
+"""
+
+import contextlib
+import math
+
+import numpy as np
+
+import glfw
+from OpenGL.GL import *
+
+from MandelbrotExplorer import create_opengl_program, create_opengl_vertex_array_object
+from precision import Precision, SHADER_DEFINES
+
+
+class GpuBandRenderer:
+    """Compute bands of poster rows with the tiled fragment shader, in double precision."""
+
+    def __init__(self, tile_size: int = 256):
+
+        self.window_size = None
+        self.tile_size = tile_size
+
+        self._exit_stack = contextlib.ExitStack()
+
+        if not glfw.init():
+            raise RuntimeError("Unable to initialize GLFW.")
+        self._exit_stack.callback(glfw.terminate)
+
+        glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 4)
+        glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 1)
+        glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+        glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, GL_TRUE)
+        glfw.window_hint(glfw.VISIBLE, GL_FALSE)
+
+        window = glfw.create_window(tile_size, tile_size, "Mandelbrot poster export", None, None)
+        if not window:
+            raise RuntimeError("Unable to create window using GLFW.")
+        self._exit_stack.callback(glfw.destroy_window, window)
+
+        glfw.make_context_current(window)
+
+        self._program = create_opengl_program(self._exit_stack, "tile_fragment_shader.glsl",
+                                              [SHADER_DEFINES[Precision.DOUBLE]])
+        self._vao = create_opengl_vertex_array_object(self._exit_stack)
+
+        # The tiles are rendered into the escape value texture of the offscreen framebuffer.
+
+        self._texture = glGenTextures(1)
+        self._exit_stack.callback(glDeleteTextures, 1, (self._texture, ))
+
+        glBindTexture(GL_TEXTURE_2D, self._texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RG32F, tile_size, tile_size, 0, GL_RG, GL_FLOAT, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        self._framebuffer = glGenFramebuffers(1)
+        self._exit_stack.callback(glDeleteFramebuffers, 1, (self._framebuffer, ))
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self._framebuffer)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self._texture, 0)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("Poster framebuffer is incomplete (status 0x{:04x}).".format(status))
+
+        self._tile_origin_location = glGetUniformLocation(self._program, "tile_origin")
+        self._lattice_center = None
+
+    def close(self) -> None:
+        self._exit_stack.close()
+
+    def set_view(self, window_size: tuple[int, int], map_center: tuple[float, float], map_scale: float,
+                 map_angle: float, max_iterations: int, interior_checks: bool = True) -> None:
+        """Set the view of the bands that are rendered next."""
+
+        self.window_size = window_size
+
+        (width, height) = window_size
+
+        pixel_size = map_scale / min(width, height)
+
+        # The lattice coordinates of the map center, as in MandelbrotRenderer.render_tiles. Here, the lattice is
+        # not snapped: the pixels of the poster are placed exactly as in the direct fragment shader.
+
+        angle = np.float32(map_angle) * np.float32(math.pi / 180.0)
+        sin_angle = float(np.sin(angle))
+        cos_angle = float(np.cos(angle))
+
+        (cx, cy) = map_center
+
+        self._lattice_center = ((cos_angle * cx + sin_angle * cy) / pixel_size,
+                                (-sin_angle * cx + cos_angle * cy) / pixel_size)
+
+        glUseProgram(self._program)
+        glUniform1d(glGetUniformLocation(self._program, "pixel_size"), pixel_size)
+        glUniform1d(glGetUniformLocation(self._program, "map_angle"), map_angle)
+        glUniform1ui(glGetUniformLocation(self._program, "max_iterations"), max_iterations)
+        glUniform1i(glGetUniformLocation(self._program, "interior_checks"), interior_checks)
+        glUseProgram(0)
+
+    def render_band(self, row_range: tuple[int, int]) -> np.ndarray:
+        """Return the iteration counts of the given rows, with the top row of the poster first.
+
+        The band may not be higher than the tile size.
+        """
+
+        (width, height) = self.window_size
+        (first_row, end_row) = row_range
+
+        band_height = end_row - first_row
+        if band_height > self.tile_size:
+            raise ValueError("The band height ({}) exceeds the tile size ({}).".format(band_height, self.tile_size))
+
+        iterations = np.empty((band_height, width), dtype=np.uint32)
+
+        # Rows are counted from the top of the poster, but window coordinates from the bottom.
+
+        band_bottom = height - end_row
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self._framebuffer)
+        glViewport(0, 0, self.tile_size, self.tile_size)
+
+        glUseProgram(self._program)
+        glBindVertexArray(self._vao)
+
+        for first_column in range(0, width, self.tile_size):
+
+            tile_width = min(self.tile_size, width - first_column)
+
+            glUniform2d(self._tile_origin_location,
+                        self._lattice_center[0] + first_column - 0.5 * width,
+                        self._lattice_center[1] + band_bottom - 0.5 * height)
+
+            glDrawArrays(GL_TRIANGLE_STRIP, 0, 4)
+
+            # Only the iteration counts are read back, as floats; they are exact up to 2^24 iterations.
+
+            tile = glReadPixels(0, 0, tile_width, band_height, GL_RED, GL_FLOAT)
+            tile = np.frombuffer(tile, dtype=np.float32).reshape(band_height, tile_width)
+
+            iterations[:, first_column:first_column + tile_width] = tile[::-1]
+
+        glBindVertexArray(0)
+        glUseProgram(0)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        return iterations
@@ -0,0 +1,49 @@
+"""The offscreen target that holds the most recently rendered image.
+
+The image is only rendered when the view changes. It is rendered into the present target, and copied to the
+window with a cheap blit whenever the window must be redrawn.
+"""
+
+from OpenGL.GL import *
+
+
+class PresentTarget:
+    """A framebuffer with a color texture, the size of the window."""
+
+    def __init__(self):
+        self.size = None
+        self.framebuffer = glGenFramebuffers(1)
+        self.texture = glGenTextures(1)
+
+    def close(self) -> None:
+        glDeleteFramebuffers(1, (self.framebuffer, ))
+        glDeleteTextures(1, (self.texture, ))
+
+    def allocate(self, width: int, height: int) -> None:
+        """(Re-)allocate the color texture for the given window size."""
+
+        glBindTexture(GL_TEXTURE_2D, self.texture)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+        glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+        glTexImage2D(GL_TEXTURE_2D, 0, GL_RGBA8, width, height, 0, GL_RGBA, GL_UNSIGNED_BYTE, None)
+        glBindTexture(GL_TEXTURE_2D, 0)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self.framebuffer)
+        glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, self.texture, 0)
+        status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        if status != GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("Present framebuffer is incomplete (status 0x{:04x}).".format(status))
+
+        self.size = (width, height)
+
+    def present(self) -> None:
+        """Copy the image to the window framebuffer."""
+
+        (width, height) = self.size
+
+        glBindFramebuffer(GL_READ_FRAMEBUFFER, self.framebuffer)
+        glBindFramebuffer(GL_DRAW_FRAMEBUFFER, 0)
+        glBlitFramebuffer(0, 0, width, height, 0, 0, width, height, GL_COLOR_BUFFER_BIT, GL_NEAREST)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
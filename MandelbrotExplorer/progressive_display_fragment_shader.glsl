@@ -0,0 +1,39 @@
+#version 410 core
+
+// Write the partial result of the progressive iteration to the iteration buffer.
+// Pixels that have not escaped (yet) get max_iterations, like the points inside the set.
+
+layout(location = 0) out vec2 escape_value;
+
+uniform usampler2D state_z;
+uniform usampler2D state_status;
+
+uniform uint max_iterations;
+
+#include "smooth_escape.glsl"
+
+void main()
+{
+    ivec2 texel = ivec2(gl_FragCoord.xy);
+
+    uvec2 status = texelFetch(state_status, texel, 0).xy;
+
+    uint m = status.x;
+    bool escaped = (status.y != 0u);
+
+    if (!escaped)
+    {
+        escape_value = vec2(float(max_iterations), 0.0);
+    }
+    else
+    {
+        // The state holds the value of z at which the pixel escaped.
+
+        uvec4 z = texelFetch(state_z, texel, 0);
+
+        double x = packDouble2x32(z.xy);
+        double y = packDouble2x32(z.zw);
+
+        escape_value = vec2(float(m), escape_fraction(float(x * x + y * y)));
+    }
+}
@@ -0,0 +1,117 @@
+#version 410 core
+
+// Advance the escape-time iteration of every unfinished pixel by at most 'iteration_budget' iterations.
+//
+// The per-pixel state is kept in two unsigned integer textures, since float textures cannot hold
+// the double precision values of z:
+//
+//   state_z:      (x.lo, x.hi, y.lo, y.hi) -- the current value of z, as two packed doubles.
+//   state_status: (iteration, escaped)
+
+layout(location = 0) out uvec4 next_state_z;
+layout(location = 1) out uvec2 next_state_status;
+
+uniform usampler2D state_z;
+uniform usampler2D state_status;
+
+uniform uvec2 window_size;
+
+// Where are we?
+
+uniform uint max_iterations;
+uniform uint iteration_budget;
+
+uniform dvec2  map_center;
+uniform double map_scale;
+uniform double map_angle;
+
+// Skip the iteration of points inside the main cardioid or the period-2 bulb.
+// (Periodicity checking is not done here, since there is no room in the state textures for the saved z value.)
+
+uniform bool interior_checks;
+
+bool in_cardioid_or_bulb(double x0, double y0)
+{
+    double yy = y0 * y0;
+
+    double xq = x0 - 0.25;
+    double q = xq * xq + yy;
+
+    if (q * (q + xq) <= 0.25 * yy)
+    {
+        return true;
+    }
+
+    double xb = x0 + 1.0;
+
+    return xb * xb + yy <= 0.0625;
+}
+
+void main()
+{
+    ivec2 texel = ivec2(gl_FragCoord.xy);
+
+    uvec4 z = texelFetch(state_z, texel, 0);
+    uvec2 status = texelFetch(state_status, texel, 0).xy;
+
+    uint iteration = status.x;
+    bool escaped = (status.y != 0u);
+
+    if (escaped || iteration >= max_iterations)
+    {
+        // This pixel is finished.
+        next_state_z = z;
+        next_state_status = status;
+        return;
+    }
+
+    // The pixel coordinates are calculated as in the non-progressive fragment shader.
+
+    double sx = gl_FragCoord.x;
+    double sy = gl_FragCoord.y;
+
+    uint width  = window_size.x;
+    uint height = window_size.y;
+
+    double scale = map_scale / min(width, height);
+
+    float angle = radians(float(map_angle));
+
+    double sin_angle = sin(angle);
+    double cos_angle = cos(angle);
+
+    double x0 = map_center.x + 0.5 * scale * (height * sin_angle + 2.0 * cos_angle * sx - 2.0 * sin_angle * sy - cos_angle * width);
+    double y0 = map_center.y - 0.5 * scale * (cos_angle * (height - 2 * sy) + sin_angle * (-2 * sx + width));
+
+    if (iteration == 0u && interior_checks && in_cardioid_or_bulb(x0, y0))
+    {
+        // This pixel is finished in the first frame.
+        next_state_z = z;
+        next_state_status = uvec2(max_iterations, 0u);
+        return;
+    }
+
+    double x = packDouble2x32(z.xy);
+    double y = packDouble2x32(z.zw);
+
+    uint last_iteration = (iteration_budget < max_iterations - iteration) ? iteration + iteration_budget : max_iterations;
+
+    while (iteration < last_iteration)
+    {
+        double xx = x * x;
+        double yy = y * y;
+
+        if (xx + yy > 4.0)
+        {
+            escaped = true;
+            break;
+        }
+        double xtemp = xx - yy + x0;
+        y = 2 * x * y + y0;
+        x = xtemp;
+        ++iteration;
+    }
+
+    next_state_z = uvec4(unpackDouble2x32(x), unpackDouble2x32(y));
+    next_state_status = uvec2(iteration, escaped ? 1u : 0u);
+}
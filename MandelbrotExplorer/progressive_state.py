@@ -0,0 +1,83 @@
+"""Per-pixel iteration state for progressive rendering.
+
+The state of each pixel (the current value of z, the iteration count, and whether the point escaped) is kept
+in two unsigned integer textures, attached to a framebuffer object. There are two such framebuffers: each frame,
+the iteration shader reads the state from the 'source' framebuffer and writes the advanced state to the
+'destination' framebuffer, after which the two are swapped (ping-pong).
+"""
+
+import numpy as np
+
+from OpenGL.GL import *
+
+
+class ProgressiveState:
+    """Ping-pong framebuffers holding the per-pixel iteration state."""
+
+    # Internal formats of the state textures: z as two packed doubles, and (iteration, escaped).
+
+    TEXTURE_FORMATS = [
+        (GL_RGBA32UI, GL_RGBA_INTEGER),
+        (GL_RG32UI, GL_RG_INTEGER)
+    ]
+
+    def __init__(self):
+        self.size = None
+        self._framebuffers = glGenFramebuffers(2)
+        self._textures = [glGenTextures(len(self.TEXTURE_FORMATS)) for _ in range(2)]
+        self._source_index = 0
+
+    def close(self) -> None:
+        glDeleteFramebuffers(2, self._framebuffers)
+        for textures in self._textures:
+            glDeleteTextures(len(textures), textures)
+
+    def allocate(self, width: int, height: int) -> None:
+        """(Re-)allocate the state textures for the given framebuffer size, and reset the state."""
+
+        for (framebuffer, textures) in zip(self._framebuffers, self._textures):
+
+            glBindFramebuffer(GL_FRAMEBUFFER, framebuffer)
+
+            for (attachment_index, (texture, (internal_format, pixel_format))) in enumerate(zip(textures, self.TEXTURE_FORMATS)):
+                glBindTexture(GL_TEXTURE_2D, texture)
+                # Integer textures cannot be filtered.
+                glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+                glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+                glTexImage2D(GL_TEXTURE_2D, 0, internal_format, width, height, 0, pixel_format, GL_UNSIGNED_INT, None)
+                glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0 + attachment_index, GL_TEXTURE_2D, texture, 0)
+
+            glDrawBuffers(len(textures), [GL_COLOR_ATTACHMENT0 + i for i in range(len(textures))])
+
+            status = glCheckFramebufferStatus(GL_FRAMEBUFFER)
+            if status != GL_FRAMEBUFFER_COMPLETE:
+                raise RuntimeError("Progressive state framebuffer is incomplete (status 0x{:04x}).".format(status))
+
+        glBindTexture(GL_TEXTURE_2D, 0)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+        self.size = (width, height)
+
+        self.reset()
+
+    def reset(self) -> None:
+        """Restart the iteration of all pixels: z = 0, iteration = 0, not escaped."""
+
+        zero = np.zeros(4, dtype=np.uint32)
+
+        glBindFramebuffer(GL_FRAMEBUFFER, self._framebuffers[self._source_index])
+        for attachment_index in range(len(self.TEXTURE_FORMATS)):
+            glClearBufferuiv(GL_COLOR, attachment_index, zero)
+        glBindFramebuffer(GL_FRAMEBUFFER, 0)
+
+    def source_textures(self):
+        """The (z, status) textures holding the current state."""
+        return self._textures[self._source_index]
+
+    def destination_framebuffer(self):
+        """The framebuffer that receives the advanced state."""
+        return self._framebuffers[1 - self._source_index]
+
+    def swap(self) -> None:
+        """Make the destination state the current state."""
+        self._source_index = 1 - self._source_index
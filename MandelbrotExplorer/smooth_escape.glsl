@@ -0,0 +1,7 @@
+// The fractional part of the smooth escape count n + 1 - log2(log2(|z|)), given |z|^2 at escape.
+// It is clamped to [0, 1], so the integer part remains the iteration count n.
+
+float escape_fraction(float zz)
+{
+    return clamp(2.0 - log2(log2(zz)), 0.0, 1.0);
+}
@@ -0,0 +1,76 @@
+"""A cache of iteration count tiles, to reuse work while panning.
+
+The plane is divided into a lattice of pixels that only depends on the pixel size and the angle of the view, and
+that lattice is divided into square tiles. A tile holds the escape values of its pixels (iteration count, and
+fractional escape value), in an RG32F texture.
+
+Tiles are keyed by (pixel size, angle, max_iterations, interior checks, kernel precision, tile x index, tile y index).
+When the view is panned, the tiles that are still visible are taken from the cache; only the newly exposed tiles are
+computed.
+
+The least recently used tiles are evicted when the memory used by the tiles exceeds the memory budget.
+"""
+
+from collections import OrderedDict
+
+from OpenGL.GL import *
+
+
+class IterationTileCache:
+    """A least-recently-used cache of iteration count tile textures."""
+
+    def __init__(self, tile_size: int = 256, memory_budget: int = 256 * 1024 * 1024):
+        self.tile_size = tile_size
+        self.memory_budget = memory_budget
+        self._tiles = OrderedDict()
+        self.hit_count = 0
+        self.miss_count = 0
+
+    @property
+    def tile_bytes(self) -> int:
+        return self.tile_size * self.tile_size * 8
+
+    def memory_usage(self) -> int:
+        return len(self._tiles) * self.tile_bytes
+
+    def close(self) -> None:
+        for texture in self._tiles.values():
+            glDeleteTextures(1, (texture, ))
+        self._tiles.clear()
+
+    def get(self, key):
+        """Return the texture of a cached tile, marking it as most recently used; or None if it is not cached."""
+        texture = self._tiles.get(key)
+        if texture is None:
+            self.miss_count += 1
+            return None
+        self._tiles.move_to_end(key)
+        self.hit_count += 1
+        return texture
+
+    def allocate(self, key):
+        """Return a new texture for the given tile, which will hold its escape values.
+
+        The texture of an evicted tile is reused if the cache is full.
+        """
+
+        texture = None
+
+        while self._tiles and self.memory_usage() + self.tile_bytes > self.memory_budget:
+            (evicted_key, evicted_texture) = self._tiles.popitem(last=False)
+            if texture is None:
+                texture = evicted_texture
+            else:
+                glDeleteTextures(1, (evicted_texture, ))
+
+        if texture is None:
+            texture = glGenTextures(1)
+            glBindTexture(GL_TEXTURE_2D, texture)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MIN_FILTER, GL_NEAREST)
+            glTexParameteri(GL_TEXTURE_2D, GL_TEXTURE_MAG_FILTER, GL_NEAREST)
+            glTexImage2D(GL_TEXTURE_2D, 0, GL_RG32F, self.tile_size, self.tile_size, 0, GL_RG, GL_FLOAT, None)
+            glBindTexture(GL_TEXTURE_2D, 0)
+
+        self._tiles[key] = texture
+
+        return texture
@@ -0,0 +1,14 @@
+#version 410 core
+
+// Copy a cached tile of escape values into the iteration buffer. The viewport is set to the rectangle of the tile
+// in the window.
+
+layout(location = 0) out vec2 escape_value;
+
+uniform sampler2D tile_escape_values;
+uniform ivec2 tile_window_origin;
+
+void main()
+{
+    escape_value = texelFetch(tile_escape_values, ivec2(gl_FragCoord.xy) - tile_window_origin, 0).xy;
+}
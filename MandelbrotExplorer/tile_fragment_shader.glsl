@@ -0,0 +1,42 @@
+#version 410 core
+
+// Compute the iteration counts of a single tile of the pixel lattice.
+//
+// Pixel (P, Q) of the lattice is centered at fractal coordinates pixel_size * R * (P + 0.5, Q + 0.5),
+// where R is the rotation by map_angle. The tile covers pixels tile_origin .. tile_origin + tile size - 1.
+
+// The iteration count and the fractional escape value.
+
+layout(location = 0) out vec2 escape_value;
+
+uniform dvec2  tile_origin;
+uniform double pixel_size;
+
+// Where are we?
+
+uniform uint max_iterations;
+
+uniform double map_angle;
+
+#include "mandelbrot_kernel.glsl"
+
+void main()
+{
+    // Within the tile, the pixel centers are at gl_FragCoord = (i + 0.5, j + 0.5).
+
+    dvec2 lattice_position = tile_origin + dvec2(gl_FragCoord.xy);
+
+    float angle = radians(float(map_angle));
+
+    double sin_angle = sin(angle);
+    double cos_angle = cos(angle);
+
+    double x = pixel_size * (cos_angle * lattice_position.x - sin_angle * lattice_position.y);
+    double y = pixel_size * (sin_angle * lattice_position.x + cos_angle * lattice_position.y);
+
+    float fraction;
+
+    uint m = mandelbrot(x, y, max_iterations, PERIODICITY_TOLERANCE * pixel_size, fraction);
+
+    escape_value = vec2(float(m), fraction);
+}
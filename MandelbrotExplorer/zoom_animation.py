@@ -0,0 +1,227 @@
+#! /usr/bin/env python3
+
+"""Headless rendering of zoom animations along keyframed paths.
+
+The path is given as a JSON list of keyframes, for example:
+
+    [
+        {"center": [-0.75, 0.0], "scale": 4.0, "angle": 0.0, "max_iterations": 256, "frames": 240},
+        {"center": [-0.7453, 0.1127], "scale": 1e-4, "angle": 90.0, "max_iterations": 2048}
+    ]
+
+'frames' is the number of frames from a keyframe to the next one (default: --frames-per-segment). Between
+keyframes, the scale and max_iterations are interpolated in log-scale, so the zoom speed is constant, and the
+center moves in proportion to the change of scale, so the point that is zoomed into stays in place. The explorer
+appends the current view to 'keyframes.json' when J is pressed.
+
+The frames are distributed over a process pool. Each worker has its own CPU engine (computing one frame at a
+time on a single core), or its own OpenGL context in a hidden window; with --software-gl, Mesa's software
+renderer is requested. The finished frames are written in order: at most a fixed number of frames is in flight,
+and frames that finish early wait in this bounded reorder buffer until their predecessors are written.
+
+The frames are written as a numbered PNG sequence, or as a raw RGB24 stream (e.g. to stdout, to pipe into ffmpeg).
+Progress is reported on stderr.
+"""
+
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from mandelbrot_cpu import MandelbrotCpuEngine, colorize
+from poster_export import PngWriter
+
+
+def interpolate_view(keyframe1: dict, keyframe2: dict, t: float) -> tuple:
+    """Return the view (center, scale, angle, max_iterations) at fraction t of the way between two keyframes."""
+
+    (scale1, scale2) = (keyframe1["scale"], keyframe2["scale"])
+
+    scale = scale1 * (scale2 / scale1) ** t
+
+    # The center moves in proportion to the change of scale; this keeps the zoom target in place.
+
+    if scale1 != scale2:
+        w = (scale1 - scale) / (scale1 - scale2)
+    else:
+        w = t
+
+    (x1, y1) = keyframe1["center"]
+    (x2, y2) = keyframe2["center"]
+
+    center = (x1 + w * (x2 - x1), y1 + w * (y2 - y1))
+
+    (angle1, angle2) = (keyframe1.get("angle", 0.0), keyframe2.get("angle", 0.0))
+
+    angle = angle1 + t * (angle2 - angle1)
+
+    (max_iterations1, max_iterations2) = (keyframe1.get("max_iterations", 256), keyframe2.get("max_iterations", 256))
+
+    max_iterations = round(max_iterations1 * (max_iterations2 / max_iterations1) ** t)
+
+    return (center, scale, angle, max_iterations)
+
+
+def frame_views(keyframes: list[dict], frames_per_segment: int) -> list[tuple]:
+    """Return the views of all frames along the keyframed path, ending with the last keyframe."""
+
+    views = []
+
+    for (keyframe1, keyframe2) in zip(keyframes[:-1], keyframes[1:]):
+        frame_count = keyframe1.get("frames", frames_per_segment)
+        views.extend(interpolate_view(keyframe1, keyframe2, frame / frame_count) for frame in range(frame_count))
+
+    views.append(interpolate_view(keyframes[-1], keyframes[-1], 0.0))
+
+    return views
+
+
+# The renderer of a worker process, created by the pool initializer.
+
+_worker_renderer = None
+
+
+def initialize_worker(engine: str, software_gl: bool, band_height: int) -> None:
+
+    global _worker_renderer
+
+    if engine == "cpu":
+        _worker_renderer = MandelbrotCpuEngine(max_workers=1, verbose=False)
+    else:
+        if software_gl:
+            os.environ["LIBGL_ALWAYS_SOFTWARE"] = "1"
+        from poster_gpu import GpuBandRenderer
+        _worker_renderer = GpuBandRenderer(tile_size=band_height)
+
+
+def render_frame(frame_size: tuple[int, int], view: tuple, interior_checks: bool) -> np.ndarray:
+    """Render a single frame in a worker process, and return its RGB values."""
+
+    (center, scale, angle, max_iterations) = view
+
+    if isinstance(_worker_renderer, MandelbrotCpuEngine):
+        _worker_renderer.interior_checks = interior_checks
+        iterations = _worker_renderer.compute(frame_size, center, scale, angle, max_iterations)
+    else:
+        (width, height) = frame_size
+        _worker_renderer.set_view(frame_size, center, scale, angle, max_iterations, interior_checks)
+        iterations = np.concatenate([
+            _worker_renderer.render_band((first_row, min(first_row + _worker_renderer.tile_size, height)))
+            for first_row in range(0, height, _worker_renderer.tile_size)
+        ])
+
+    return colorize(iterations, max_iterations)
+
+
+def render_animation(keyframes: list[dict], frame_size: tuple[int, int], frames_per_segment: int,
+                     write_frame, engine: str = "cpu", workers: int = None, software_gl: bool = False,
+                     interior_checks: bool = True, band_height: int = 256) -> None:
+    """Render all frames of the animation in parallel, and pass them to write_frame(index, rgb) in order."""
+
+    views = frame_views(keyframes, frames_per_segment)
+
+    workers = workers if workers is not None else os.cpu_count()
+
+    # The bounded reorder buffer: the frames in flight, in frame order.
+
+    capacity = 2 * workers
+
+    pending = collections.deque()
+
+    t1 = time.monotonic()
+
+    with ProcessPoolExecutor(workers, initializer=initialize_worker,
+                             initargs=(engine, software_gl, band_height)) as executor:
+
+        next_frame = 0
+
+        for frame_index in range(len(views)):
+
+            while next_frame < len(views) and len(pending) < capacity:
+                pending.append(executor.submit(render_frame, frame_size, views[next_frame], interior_checks))
+                next_frame += 1
+
+            rgb = pending.popleft().result()
+
+            write_frame(frame_index, rgb)
+
+            duration = time.monotonic() - t1
+
+            print("animation: frame {} of {} written, {:.2f} frames per second.".format(
+                frame_index + 1, len(views), (frame_index + 1) / duration), file=sys.stderr)
+
+    t2 = time.monotonic()
+
+    print("animation: {} frames of {} x {} pixels in {:.1f} s, {:.2f} frames per second ({} {} workers).".format(
+        len(views), frame_size[0], frame_size[1], t2 - t1, len(views) / (t2 - t1), workers, engine), file=sys.stderr)
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description="Render a Mandelbrot zoom animation along keyframes, headless.")
+    parser.add_argument("keyframes", help="JSON file with the list of keyframes")
+    parser.add_argument("--size", type=int, nargs=2, default=(1280, 720), metavar=("WIDTH", "HEIGHT"))
+    parser.add_argument("--frames-per-segment", type=int, default=120,
+                        help="number of frames between keyframes that do not specify 'frames'")
+    parser.add_argument("--no-interior-checks", dest="interior_checks", action="store_false",
+                        help="iterate interior points in full")
+    parser.add_argument("--engine", choices=("cpu", "gpu"), default="cpu")
+    parser.add_argument("--software-gl", action="store_true", help="request Mesa's software renderer (gpu engine)")
+    parser.add_argument("--workers", type=int, help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--output", help="write the frames as PNG files to this directory")
+    parser.add_argument("--raw-output", help="write the frames as a raw RGB24 stream to this file ('-' for stdout)")
+
+    args = parser.parse_args()
+
+    if (args.output is None) == (args.raw_output is None):
+        parser.error("exactly one of --output and --raw-output is required")
+
+    with open(args.keyframes, "r") as fi:
+        keyframes = json.load(fi)
+
+    if len(keyframes) == 0:
+        parser.error("the keyframe file contains no keyframes")
+
+    frame_size = tuple(args.size)
+
+    if args.output is not None:
+
+        os.makedirs(args.output, exist_ok=True)
+
+        def write_frame(frame_index: int, rgb: np.ndarray) -> None:
+            png_writer = PngWriter(os.path.join(args.output, "frame_{:05d}.png".format(frame_index)), *frame_size)
+            png_writer.write_rows(rgb)
+            png_writer.close()
+
+        render_animation(keyframes, frame_size, args.frames_per_segment, write_frame, args.engine, args.workers,
+                         args.software_gl, args.interior_checks)
+
+    else:
+
+        if args.raw_output == "-":
+            raw_file = sys.stdout.buffer
+        else:
+            raw_file = open(args.raw_output, "wb")
+
+        def write_frame(frame_index: int, rgb: np.ndarray) -> None:
+            raw_file.write(rgb.tobytes())
+
+        try:
+            render_animation(keyframes, frame_size, args.frames_per_segment, write_frame, args.engine, args.workers,
+                             args.software_gl, args.interior_checks)
+        finally:
+            if raw_file is not sys.stdout.buffer:
+                raw_file.close()
+
+        if args.raw_output != "-":
+            print("ffmpeg -f rawvideo -pixel_format rgb24 -video_size {}x{} -framerate 30 -i {} zoom.mp4".format(
+                frame_size[0], frame_size[1], args.raw_output), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()